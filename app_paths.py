@@ -0,0 +1,15 @@
+# 應用程式資料目錄（使用統計、快取等）
+import os
+
+APP_DIR_NAME = ".ims_print"
+
+
+def app_data_dir(*parts):
+    """回傳應用程式資料目錄下的路徑（必要時建立目錄）
+
+    預設為 ~/.ims_print，可用環境變數 IMS_PRINT_HOME 指定其他位置。
+    """
+    base = os.environ.get("IMS_PRINT_HOME") or os.path.join(os.path.expanduser("~"), APP_DIR_NAME)
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
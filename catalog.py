@@ -0,0 +1,691 @@
+# IMS 商品資料載入、SQLite 後端與差異更新（delta）工具
+import argparse
+import codecs
+import csv
+import glob
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from operator import itemgetter
+
+CODE_FIELD = "Item No"
+DESC_FIELD = "Item Description"
+
+# 同一目錄下優先使用已匯入的 SQLite 資料庫
+CATALOG_FILENAMES = ("ims_list.db", "ims_list.json", "ims_list.csv", "ims_list.tsv")
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+DELIMITED_SUFFIXES = (".csv", ".tsv", ".txt")
+
+# ERP 匯出的 CSV/TSV 未指定欄位時，依表頭名稱（不分大小寫）尋找商品編號與描述欄
+CODE_COLUMN_NAMES = ("item no", "item_no", "itemno", "item number", "article no", "article_no", "商品編號")
+DESC_COLUMN_NAMES = ("item description", "item_description", "description", "商品描述", "品名")
+
+# 沒有 BOM 且不是 UTF-8 時依序嘗試的編碼（ERP 常見的 Big5 / GBK / Windows 西文）
+FALLBACK_ENCODINGS = ("cp950", "gb18030", "cp1252")
+
+# 多商品資料設定檔（區域 / 品牌 / 門市覆寫）
+CATALOG_CONFIG_FILENAME = "catalogs.json"
+DEFAULT_CATALOG = "default"
+
+
+def load_catalog(path, options=None):
+    """載入 ims_list.json（或 CSV/TSV），回傳 {商品編號: 商品描述}
+
+    options 為 CSV/TSV 的讀取設定（columns、encoding、delimiter），見 load_delimited_catalog。
+    """
+    if path.lower().endswith(DELIMITED_SUFFIXES):
+        return load_delimited_catalog(path, **(options or {}))
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return records_to_catalog(data)
+
+
+def detect_encoding(path, sample_size=256 * 1024):
+    """依 BOM 或試著解碼檔案開頭判斷編碼"""
+    with open(path, "rb") as f:
+        sample = f.read(sample_size)
+    for bom, encoding in ((codecs.BOM_UTF8, "utf-8-sig"),
+                          (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")):
+        if sample.startswith(bom):
+            return encoding
+    for encoding in ("utf-8",) + FALLBACK_ENCODINGS:
+        try:
+            # 取樣可能在多位元組字元中間截斷，以漸進式解碼器忽略結尾
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return "latin-1"
+
+
+def detect_delimiter(path, first_line):
+    """.tsv 為 tab，其餘取表頭中出現最多次的分隔字元"""
+    if path.lower().endswith(".tsv"):
+        return "\t"
+    return max(("\t", ",", ";", "|"), key=first_line.count)
+
+
+def find_column(header, column, names):
+    """依設定（欄名或從 0 起算的欄位序號）或預設欄名找出欄位序號"""
+    if isinstance(column, int):
+        return column
+    folded = [name.strip().lower() for name in header]
+    for name in ([column] if column else names):
+        if name.strip().lower() in folded:
+            return folded.index(name.strip().lower())
+    raise ValueError(f"找不到欄位 {column or names[0]}，表頭為: {', '.join(header)}")
+
+
+def load_delimited_catalog(path, columns=None, encoding=None, delimiter=None):
+    """串流讀取 ERP 匯出的 CSV/TSV 商品資料，回傳 {商品編號: 商品描述}
+
+    columns 為 {"code": 欄名或序號, "description": 欄名或序號}，未指定時依表頭名稱尋找；
+    encoding 未指定時自動判斷；delimiter 未指定時 .tsv 為 tab，其餘依第一行判斷。
+    逐行讀取且只取出兩個需要的欄位，不建立整份記錄清單。
+    """
+    columns = columns or {}
+    encoding = encoding or detect_encoding(path)
+    with open(path, "r", encoding=encoding, newline="") as f:
+        first_line = f.readline()
+        delimiter = delimiter or detect_delimiter(path, first_line)
+        header = next(csv.reader([first_line], delimiter=delimiter), [])
+        code_index = find_column(header, columns.get("code"), CODE_COLUMN_NAMES)
+        desc_index = find_column(header, columns.get("description"), DESC_COLUMN_NAMES)
+        get_columns = itemgetter(code_index, desc_index)
+
+        data = {}
+        skipped = 0
+        for row in csv.reader(f, delimiter=delimiter):
+            try:
+                code, description = get_columns(row)
+            except IndexError:
+                skipped += int(bool(row))  # 空行不計
+                continue
+            code = code.strip()
+            if code:
+                data[code] = description.strip()
+    if skipped:
+        print(f"{os.path.basename(path)}: 略過 {skipped} 行欄位不足的資料")
+    return data
+
+
+def find_catalog_file(search_dirs):
+    """依序在各目錄尋找商品資料檔，找不到時回傳 None"""
+    for directory in search_dirs:
+        for name in CATALOG_FILENAMES:
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                return path
+    return None
+
+
+def open_catalog(path, options=None):
+    """依副檔名選擇商品資料後端：SQLite 資料庫、JSON 或 CSV/TSV 檔案"""
+    if path.lower().endswith(SQLITE_SUFFIXES):
+        return SQLiteCatalog(path)
+    return load_catalog(path, options)
+
+
+def open_shared_or_catalog(path, options=None):
+    """開啟商品資料並套用 delta
+
+    設定 IMS_PRINT_SHARED_CATALOG=1 時，JSON / CSV 商品資料改為開啟同一台主機共用的唯讀區段
+    （見 shared_catalog），各程式不再各自保存一份完整字典。
+    """
+    if not path.lower().endswith(SQLITE_SUFFIXES):
+        import shared_catalog
+        if shared_catalog.shared_catalog_enabled():
+            try:
+                return shared_catalog.attach(path, options=options)
+            except (OSError, ValueError) as e:
+                print(f"無法使用共用商品資料，改為各自載入: {e}")
+    data = open_catalog(path, options)
+    apply_delta_files(data, path)
+    return data
+
+
+def records_to_catalog(records):
+    """將 [{"Item No", "Item Description"}] 轉為查詢字典"""
+    return {
+        item[CODE_FIELD].strip(): item[DESC_FIELD].strip()
+        for item in records if CODE_FIELD in item and DESC_FIELD in item
+    }
+
+
+def catalog_to_records(catalog):
+    """將查詢字典轉回 ims_list.json 的記錄格式"""
+    return [{CODE_FIELD: code, DESC_FIELD: desc} for code, desc in catalog.items()]
+
+
+def save_catalog(catalog, path):
+    """以 ims_list.json 格式寫出商品資料"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(catalog_to_records(catalog), f, ensure_ascii=False, indent=1)
+
+
+def diff_catalogs(old, new):
+    """比對兩個版本的商品資料，產生 delta
+
+    以集合運算找出新增、刪除與共同的商品編號，只有共同編號需要逐筆比對描述。
+    """
+    old_keys = old.keys()
+    new_keys = new.keys()
+
+    added = new_keys - old_keys
+    deleted = old_keys - new_keys
+    updated = {code for code in new_keys & old_keys if old[code] != new[code]}
+
+    return {
+        "add": [{CODE_FIELD: code, DESC_FIELD: new[code]} for code in sorted(added)],
+        "update": [{CODE_FIELD: code, DESC_FIELD: new[code]} for code in sorted(updated)],
+        "delete": sorted(deleted),
+    }
+
+
+def load_delta(path):
+    """載入 delta 檔案"""
+    with open(path, "r", encoding="utf-8") as f:
+        delta = json.load(f)
+    for key in ("add", "update", "delete"):
+        delta.setdefault(key, [])
+    return delta
+
+
+def save_delta(delta, path):
+    """寫出 delta 檔案"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(delta, f, ensure_ascii=False, indent=1)
+
+
+def apply_delta(catalog, delta):
+    """將 delta 套用到已載入的商品資料（就地修改）
+
+    若 catalog 本身提供 apply_delta（例如已編譯的索引），交由其自行處理，
+    否則視為一般字典操作。回傳 (新增/更新筆數, 刪除筆數)。
+    """
+    if hasattr(catalog, "apply_delta"):
+        return catalog.apply_delta(delta)
+
+    changes = records_to_catalog(delta.get("add", []))
+    changes.update(records_to_catalog(delta.get("update", [])))
+    deleted = 0
+    for code in delta.get("delete", []):
+        if catalog.pop(code.strip(), None) is not None:
+            deleted += 1
+    catalog.update(changes)
+    return len(changes), deleted
+
+
+def find_delta_files(catalog_path):
+    """找出與商品資料檔同目錄的 delta 檔案（依檔名排序套用）
+
+    例如 ims_list.json 對應 ims_list.delta.20240101.json、ims_list.delta.20240102.json
+    """
+    stem, _ = os.path.splitext(catalog_path)
+    return sorted(glob.glob(glob.escape(stem) + ".delta*.json"))
+
+
+def apply_delta_files(catalog, catalog_path):
+    """依序套用商品資料檔旁的所有 delta 檔案，回傳套用的檔案數
+
+    SQLite 後端會記錄已套用的檔案，避免每次啟動重複寫入。
+    """
+    applied = 0
+    for delta_path in find_delta_files(catalog_path):
+        name = os.path.basename(delta_path)
+        if hasattr(catalog, "is_delta_applied") and catalog.is_delta_applied(name):
+            continue
+        upserted, deleted = apply_delta(catalog, load_delta(delta_path))
+        if hasattr(catalog, "mark_delta_applied"):
+            catalog.mark_delta_applied(name)
+        print(f"套用商品差異檔 {name}: 新增/更新 {upserted} 筆, 刪除 {deleted} 筆")
+        applied += 1
+    return applied
+
+
+class SQLiteCatalog(Mapping):
+    """以 SQLite 儲存的商品資料，用法與 {商品編號: 商品描述} 字典相同
+
+    商品編號有唯一索引，商品描述另建 FTS5 全文檢索表。查詢結果（包含查無資料）
+    存入大小有限的 LRU 快取，記憶體用量不隨商品數量增加。
+    """
+
+    _MISSING = object()
+
+    def __init__(self, path, cache_size=4096):
+        self.path = path
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # 允許在背景執行緒開啟後交給 UI 執行緒使用，存取以 _lock 序列化
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        create_sqlite_schema(self._db)
+        self.has_fts = _has_table(self._db, "items_fts")
+
+    @property
+    def _conn(self):
+        """資料庫連線；close() 之後再使用時重新開啟（在 _lock 內呼叫）
+
+        CatalogRegistry 淘汰時會關閉連線，但其他執行緒（例如背景預先計算換行）
+        可能仍持有這個物件，因此不能讓關閉後的物件無法使用。
+        """
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+        return self._db
+
+    def close(self):
+        """關閉連線（之後仍可使用，會重新開啟）"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def __getitem__(self, code):
+        value = self._lookup(code)
+        if value is self._MISSING:
+            raise KeyError(code)
+        return value
+
+    def __contains__(self, code):
+        return self._lookup(code) is not self._MISSING
+
+    def get(self, code, default=None):
+        value = self._lookup(code)
+        return default if value is self._MISSING else value
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def __iter__(self):
+        with self._lock:
+            codes = [row[0] for row in self._conn.execute("SELECT item_no FROM items")]
+        return iter(codes)
+
+    def _lookup(self, code):
+        if not isinstance(code, str):
+            code = str(code)
+        with self._lock:
+            if code in self._cache:
+                self._cache.move_to_end(code)
+                return self._cache[code]
+            row = self._conn.execute(
+                "SELECT description FROM items WHERE item_no = ?", (code,)).fetchone()
+            value = row[0] if row else self._MISSING
+            self._cache[code] = value
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return value
+
+    def search(self, text, limit=50):
+        """以商品描述搜尋，回傳 [(商品編號, 商品描述)]"""
+        text = text.strip()
+        if not text:
+            return []
+        with self._lock:
+            if self.has_fts:
+                # 每個字詞以雙引號包住，避免使用者輸入被當成 FTS 語法
+                query = " ".join('"%s"' % word.replace('"', '""') for word in text.split())
+                rows = self._conn.execute(
+                    "SELECT items.item_no, items.description FROM items_fts "
+                    "JOIN items ON items.id = items_fts.rowid "
+                    "WHERE items_fts MATCH ? ORDER BY rank LIMIT ?", (query, limit))
+            else:
+                rows = self._conn.execute(
+                    "SELECT item_no, description FROM items WHERE description LIKE ? LIMIT ?",
+                    ("%" + text + "%", limit))
+            return rows.fetchall()
+
+    def apply_delta(self, delta):
+        """在單一交易中套用 delta，並清除快取"""
+        changes = records_to_catalog(delta.get("add", []))
+        changes.update(records_to_catalog(delta.get("update", [])))
+        with self._lock, self._conn:
+            deleted = self._conn.executemany(
+                "DELETE FROM items WHERE item_no = ?",
+                [(code.strip(),) for code in delta.get("delete", [])]).rowcount
+            self._conn.executemany(
+                "INSERT INTO items (item_no, description) VALUES (?, ?) "
+                "ON CONFLICT(item_no) DO UPDATE SET description = excluded.description",
+                changes.items())
+            self._cache.clear()
+        return len(changes), max(deleted, 0)
+
+    def is_delta_applied(self, name):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM applied_deltas WHERE name = ?", (name,)).fetchone()
+        return row is not None
+
+    def mark_delta_applied(self, name):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO applied_deltas (name) VALUES (?)", (name,))
+
+
+class LayeredCatalog(Mapping):
+    """多層商品資料：依序查詢各層，前面的層（例如門市覆寫）優先
+
+    各層透過 CatalogRegistry 取得，共用的基礎商品資料只載入一份。
+    """
+
+    def __init__(self, registry, layer_names):
+        self.registry = registry
+        self.layer_names = list(layer_names)
+
+    def _layers(self):
+        return [self.registry.load(name) for name in self.layer_names]
+
+    def __getitem__(self, code):
+        for layer in self._layers():
+            if code in layer:
+                return layer[code]
+        raise KeyError(code)
+
+    def __contains__(self, code):
+        return any(code in layer for layer in self._layers())
+
+    def __len__(self):
+        return len(set().union(*self._layers()))
+
+    def __iter__(self):
+        return iter(set().union(*self._layers()))
+
+
+class CatalogRegistry:
+    """具名商品資料的登錄表
+
+    每份商品資料在第一次使用時才載入，並保存在數量有限的 LRU 快取中，
+    超過上限時釋放最久未使用者（SQLite 商品資料同時關閉連線，仍持有的呼叫端再使用時重新開啟）。設定了 base 的商品資料會組成
+    LayeredCatalog，只保存自己的覆寫內容；LayeredCatalog 每次查詢都經由 LRU 取得各層，
+    因此 max_loaded 至少為最多的層數，避免查詢一次就重新載入一層。
+    """
+
+    def __init__(self, catalogs, stores=None, default=DEFAULT_CATALOG, max_loaded=4):
+        # catalogs: {名稱: {"path": 檔案路徑, "base": 基礎商品資料名稱（可省略）}}
+        self.catalogs = catalogs
+        self.stores = stores or {}
+        self.default = default
+        self.max_loaded = max(max_loaded, self._max_depth())
+        self._loaded = OrderedDict()
+        self._attributes = OrderedDict()
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_config_file(cls, config_path, max_loaded=4):
+        """讀取 catalogs.json，相對路徑以設定檔所在目錄為準
+
+        格式：
+        {
+          "default": "base",
+          "catalogs": {
+            "base": "ims_list.db",
+            "tw-north": {"path": "ims_tw_north.json", "base": "base"},
+            "erp": {"path": "items.csv", "csv": {"columns": {"code": "SKU", "description": 2},
+                                                  "encoding": "cp950", "delimiter": ","}}
+          },
+          "stores": {"台北店": "tw-north"}
+        }
+        """
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+
+        config_dir = os.path.dirname(os.path.abspath(config_path))
+        catalogs = {}
+        for name, entry in config.get("catalogs", {}).items():
+            if isinstance(entry, str):
+                entry = {"path": entry}
+            entry = dict(entry)
+            entry["path"] = os.path.join(config_dir, entry["path"])
+            catalogs[name] = entry
+
+        return cls(catalogs,
+                   stores=config.get("stores"),
+                   default=config.get("default", DEFAULT_CATALOG),
+                   max_loaded=config.get("max_loaded", max_loaded))
+
+    def _max_depth(self):
+        depths = [0]
+        for name in self.catalogs:
+            try:
+                depths.append(len(self.layer_names(name)))
+            except (KeyError, ValueError):  # 設定錯誤在使用該商品資料時回報
+                pass
+        return max(depths)
+
+    def names(self):
+        return list(self.catalogs)
+
+    def loaded_names(self):
+        with self._lock:
+            return list(self._loaded)
+
+    def load(self, name):
+        """取得單一商品資料（不含基礎層），必要時載入並淘汰最久未使用者"""
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return self._loaded[name]
+
+            path = self.catalogs[name]["path"]
+            data = open_shared_or_catalog(path, self.catalogs[name].get("csv"))
+            print(f"載入商品資料 {name}: {len(data)} 筆 ({path})")
+
+            self._loaded[name] = data
+            while len(self._loaded) > self.max_loaded:
+                evicted, evicted_data = self._loaded.popitem(last=False)
+                if isinstance(evicted_data, SQLiteCatalog):
+                    evicted_data.close()
+                print(f"釋放商品資料 {evicted}")
+            return data
+
+    def load_attributes(self, name):
+        """取得單一商品資料的數值屬性（重量、材積、箱入數），第一次計算調貨單合計時才載入"""
+        with self._lock:
+            if name in self._attributes:
+                self._attributes.move_to_end(name)
+                return self._attributes[name]
+
+            import catalog_attributes
+            entry = self.catalogs[name]
+            attributes = catalog_attributes.open_attributes(entry["path"], entry.get("csv"))
+            self._attributes[name] = attributes
+            while len(self._attributes) > self.max_loaded:
+                _, evicted = self._attributes.popitem(last=False)
+                if isinstance(evicted, catalog_attributes.SQLiteAttributes):
+                    evicted.close()
+            return attributes
+
+    def attributes_for_store(self, store):
+        """依門市取得商品屬性（有基礎層時各層依序查詢）"""
+        layers = self.layer_names(self.resolve_name(store))
+        if len(layers) == 1:
+            return self.load_attributes(layers[0])
+        import catalog_attributes
+        return catalog_attributes.LayeredAttributes([self.load_attributes(name) for name in layers])
+
+    def layer_names(self, name):
+        """回傳由上而下的商品資料層名稱"""
+        layers = []
+        while name is not None:
+            if name in layers:
+                raise ValueError(f"商品資料設定循環參照: {name}")
+            if name not in self.catalogs:
+                raise KeyError(f"未定義的商品資料: {name}")
+            layers.append(name)
+            name = self.catalogs[name].get("base")
+        return layers
+
+    def get(self, name=None):
+        """取得具名商品資料，若有基礎層則回傳 LayeredCatalog"""
+        layers = self.layer_names(name or self.default)
+        if len(layers) == 1:
+            return self.load(layers[0])
+        return LayeredCatalog(self, layers)
+
+    def resolve_name(self, store):
+        """依門市（例如寄出店別）決定使用的商品資料名稱"""
+        return self.stores.get((store or "").strip(), self.default)
+
+    def for_store(self, store):
+        return self.get(self.resolve_name(store))
+
+
+def load_catalog_registry(search_dirs, max_loaded=4):
+    """建立商品資料登錄表
+
+    優先使用 catalogs.json；沒有設定檔時，以找到的單一商品資料檔作為預設。
+    兩者都找不到時回傳 None。
+    """
+    for directory in search_dirs:
+        config_path = os.path.join(directory, CATALOG_CONFIG_FILENAME)
+        if os.path.exists(config_path):
+            return CatalogRegistry.from_config_file(config_path, max_loaded)
+
+    catalog_path = find_catalog_file(search_dirs)
+    if catalog_path:
+        return CatalogRegistry({DEFAULT_CATALOG: {"path": catalog_path}}, max_loaded=max_loaded)
+    return None
+
+
+def _has_table(conn, name):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    return row is not None
+
+
+def _create_items_table(conn):
+    with conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "id INTEGER PRIMARY KEY, "
+            "item_no TEXT NOT NULL UNIQUE, "
+            "description TEXT NOT NULL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS applied_deltas (name TEXT PRIMARY KEY)")
+
+
+def create_sqlite_schema(conn):
+    """建立商品資料表、索引與全文檢索表（已存在則略過）"""
+    _create_items_table(conn)
+    with conn:
+        if _has_table(conn, "items_fts"):
+            return
+        try:
+            conn.execute(
+                "CREATE VIRTUAL TABLE items_fts USING fts5("
+                "description, content='items', content_rowid='id')")
+        except sqlite3.OperationalError:
+            # 部分 SQLite 編譯版本沒有 FTS5，搜尋改用 LIKE
+            return
+        conn.executescript("""
+            CREATE TRIGGER items_ai AFTER INSERT ON items BEGIN
+                INSERT INTO items_fts (rowid, description) VALUES (new.id, new.description);
+            END;
+            CREATE TRIGGER items_ad AFTER DELETE ON items BEGIN
+                INSERT INTO items_fts (items_fts, rowid, description)
+                VALUES ('delete', old.id, old.description);
+            END;
+            CREATE TRIGGER items_au AFTER UPDATE ON items BEGIN
+                INSERT INTO items_fts (items_fts, rowid, description)
+                VALUES ('delete', old.id, old.description);
+                INSERT INTO items_fts (rowid, description) VALUES (new.id, new.description);
+            END;
+        """)
+
+
+def import_json_to_sqlite(json_path, db_path, batch_size=50000):
+    """將 ims_list.json（或 CSV/TSV）一次匯入 SQLite 資料庫（覆寫既有資料庫），回傳筆數"""
+    rows = list(load_catalog(json_path).items())
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        # 先寫入資料，再建立全文檢索表並一次重建索引，比逐筆觸發器快得多
+        _create_items_table(conn)
+        with conn:
+            for start in range(0, len(rows), batch_size):
+                conn.executemany(
+                    "INSERT INTO items (item_no, description) VALUES (?, ?)",
+                    rows[start:start + batch_size])
+        _import_attributes(conn, json_path)
+        create_sqlite_schema(conn)
+        if _has_table(conn, "items_fts"):
+            with conn:
+                conn.execute("INSERT INTO items_fts (items_fts) VALUES ('rebuild')")
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    return len(rows)
+
+
+def _import_attributes(conn, source_path):
+    """來源含商品屬性（重量、材積、箱入數）時寫入 item_attributes 表"""
+    import catalog_attributes
+
+    table = catalog_attributes.load_attributes(source_path, apply_deltas=False)
+    if not len(table):
+        return
+    names = catalog_attributes.ATTRIBUTES
+    with conn:
+        conn.execute(f"CREATE TABLE item_attributes (item_no TEXT PRIMARY KEY, "
+                     f"{', '.join(name + ' REAL' for name in names)}) WITHOUT ROWID")
+        conn.executemany(f"INSERT INTO item_attributes VALUES ({', '.join('?' * (len(names) + 1))})",
+                         table.rows())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="IMS 商品資料工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    diff_parser = subparsers.add_parser("diff", help="比對兩個版本，產生 delta 檔案")
+    diff_parser.add_argument("old", help="舊版 ims_list.json")
+    diff_parser.add_argument("new", help="新版 ims_list.json")
+    diff_parser.add_argument("-o", "--output", required=True, help="輸出的 delta 檔案")
+
+    apply_parser = subparsers.add_parser("apply", help="將 delta 套用到商品資料並寫出新檔案")
+    apply_parser.add_argument("base", help="基準 ims_list.json")
+    apply_parser.add_argument("deltas", nargs="+", help="依序套用的 delta 檔案")
+    apply_parser.add_argument("-o", "--output", required=True, help="輸出的 ims_list.json")
+
+    import_parser = subparsers.add_parser("import", help="將 ims_list.json 或 CSV/TSV 匯入 SQLite 資料庫")
+    import_parser.add_argument("json", help="來源 ims_list.json（或 .csv / .tsv）")
+    import_parser.add_argument("-o", "--output", default="ims_list.db", help="輸出的資料庫檔案")
+
+    search_parser = subparsers.add_parser("search", help="以商品描述搜尋 SQLite 資料庫")
+    search_parser.add_argument("db", help="ims_list.db")
+    search_parser.add_argument("text", help="搜尋字詞")
+    search_parser.add_argument("--limit", type=int, default=20)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "diff":
+        delta = diff_catalogs(load_catalog(args.old), load_catalog(args.new))
+        save_delta(delta, args.output)
+        print(f"新增 {len(delta['add'])} 筆, 更新 {len(delta['update'])} 筆, "
+              f"刪除 {len(delta['delete'])} 筆 -> {args.output}")
+    elif args.command == "apply":
+        catalog = load_catalog(args.base)
+        for delta_path in args.deltas:
+            upserted, deleted = apply_delta(catalog, load_delta(delta_path))
+            print(f"{delta_path}: 新增/更新 {upserted} 筆, 刪除 {deleted} 筆")
+        save_catalog(catalog, args.output)
+        print(f"共 {len(catalog)} 筆商品資料 -> {args.output}")
+    elif args.command == "import":
+        count = import_json_to_sqlite(args.json, args.output)
+        print(f"已匯入 {count} 筆商品資料 -> {args.output}")
+    elif args.command == "search":
+        db = SQLiteCatalog(args.db)
+        for code, desc in db.search(args.text, args.limit):
+            print(f"{code:<15} {desc}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
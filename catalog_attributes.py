@@ -0,0 +1,242 @@
+# 商品數值屬性（單位重量、單位材積、箱入數）：以欄式陣列存放，供調貨單計算總重量、材積與箱數
+import csv
+import json
+import math
+import sqlite3
+import threading
+from array import array
+from itertools import repeat
+from operator import or_
+
+import catalog
+
+# 屬性名稱 -> ims_list.json 的欄位名稱
+ATTRIBUTE_FIELDS = {
+    "weight": "Unit Weight",      # 每件重量（kg）
+    "volume": "Unit Volume",      # 每件材積（m³）
+    "pack_size": "Pack Size",     # 每箱件數
+}
+ATTRIBUTES = tuple(ATTRIBUTE_FIELDS)
+
+# CSV/TSV 未指定欄位時依表頭名稱（不分大小寫）尋找
+ATTRIBUTE_COLUMN_NAMES = {
+    "weight": ("unit weight", "unit_weight", "weight", "單位重量", "重量"),
+    "volume": ("unit volume", "unit_volume", "volume", "單位材積", "材積"),
+    "pack_size": ("pack size", "pack_size", "case pack", "箱入數", "入數"),
+}
+
+# 缺少資料時陣列中的值：重量與材積乘上數量後為 0，箱入數為無限大（數量 / 箱入數為 0 箱），
+# 計算合計時不需逐項判斷有無資料
+_MISSING_VALUES = {"weight": 0.0, "volume": 0.0, "pack_size": math.inf}
+# 有無資料的位元標記：第 i 個屬性為 1 << i
+ATTRIBUTE_BITS = {name: 1 << index for index, name in enumerate(ATTRIBUTES)}
+
+_SQL_BATCH = 500
+
+
+def parse_attribute(value):
+    """將屬性值轉為正數，空白、無法解析或不大於 0 時回傳 None"""
+    if value is None or value == "":
+        return None
+    try:
+        number = float(str(value).strip().replace(",", ""))
+    except ValueError:
+        return None
+    return number if number > 0 and math.isfinite(number) else None
+
+
+class AttributeColumns:
+    """商品屬性的欄式存放：{商品編號: 列號} 加上每個屬性一個 array('d')，以及一個 array('B') 的有無位元標記
+
+    每個商品只佔每個屬性 8 bytes，不需為每個商品建立字典。
+    第 0 列是「查無商品」的哨兵列，查詢一整批商品編號時以 map 一次取出整欄，
+    不需逐項判斷是否存在。
+    """
+
+    def __init__(self):
+        self._rows = {}
+        self._values = {name: array("d", [_MISSING_VALUES[name]]) for name in ATTRIBUTES}
+        self._known = array("B", [0])
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, code):
+        return code in self._rows
+
+    def set(self, code, values):
+        """設定商品的屬性（values 為 {屬性: 數值或 None}，未列出的屬性維持原值）"""
+        row = self._rows.get(code)
+        if row is None:
+            row = self._rows[code] = len(self._known)
+            for name in ATTRIBUTES:
+                self._values[name].append(_MISSING_VALUES[name])
+            self._known.append(0)
+        for name, value in values.items():
+            if name not in self._values:
+                continue
+            if value is None:
+                self._values[name][row] = _MISSING_VALUES[name]
+                self._known[row] &= ~ATTRIBUTE_BITS[name]
+            else:
+                self._values[name][row] = value
+                self._known[row] |= ATTRIBUTE_BITS[name]
+
+    def rows(self):
+        """逐筆回傳 (商品編號, 屬性值...)，缺少的屬性為 None（匯出到 SQLite 用）"""
+        for code, row in self._rows.items():
+            known = self._known[row]
+            yield (code,) + tuple(self._values[name][row] if known & ATTRIBUTE_BITS[name] else None
+                                  for name in ATTRIBUTES)
+
+    def gather(self, codes):
+        """取出一批商品的屬性，回傳 ({屬性: 數值清單}, 有無位元標記清單)，順序與 codes 相同"""
+        rows = list(map(self._rows.get, codes, repeat(0)))
+        return ({name: list(map(self._values[name].__getitem__, rows)) for name in ATTRIBUTES},
+                list(map(self._known.__getitem__, rows)))
+
+
+class SQLiteAttributes:
+    """SQLite 商品資料的 item_attributes 表：只查詢調貨單上的商品，不載入整份屬性"""
+
+    def __init__(self, path):
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+
+    @property
+    def _conn(self):
+        """資料庫連線，第一次使用或 close() 之後再使用時開啟（在 _lock 內呼叫）"""
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+        return self._db
+
+    def close(self):
+        """關閉連線（之後仍可使用，會重新開啟）"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def check(self):
+        """確認資料庫有 item_attributes 表（沒有時引發 sqlite3.OperationalError）"""
+        with self._lock:
+            self._conn.execute("SELECT 1 FROM item_attributes LIMIT 1").fetchall()
+
+    def gather(self, codes):
+        codes = list(codes)
+        columns = AttributeColumns()
+        unique = list(dict.fromkeys(codes))
+        with self._lock:
+            for start in range(0, len(unique), _SQL_BATCH):
+                batch = unique[start:start + _SQL_BATCH]
+                sql = (f"SELECT item_no, {', '.join(ATTRIBUTES)} FROM item_attributes "
+                       f"WHERE item_no IN ({', '.join('?' * len(batch))})")
+                for row in self._conn.execute(sql, batch):
+                    columns.set(row[0], dict(zip(ATTRIBUTES, row[1:])))
+        return columns.gather(codes)
+
+
+class LayeredAttributes:
+    """多層商品資料的屬性：依序查詢各層，前面的層優先（各屬性分別判斷）"""
+
+    def __init__(self, layers):
+        self.layers = list(layers)
+
+    def gather(self, codes):
+        codes = list(codes)
+        values, known = self.layers[-1].gather(codes)
+        for layer in reversed(self.layers[:-1]):
+            upper_values, upper_known = layer.gather(codes)
+            for name, bit in ATTRIBUTE_BITS.items():
+                values[name] = [u if k & bit else v
+                                for u, k, v in zip(upper_values[name], upper_known, values[name])]
+            known = list(map(or_, upper_known, known))
+        return values, known
+
+
+def _attributes_from_record(record):
+    return {name: parse_attribute(record.get(field)) for name, field in ATTRIBUTE_FIELDS.items()
+            if field in record}
+
+
+def open_attributes(path, options=None):
+    """開啟商品資料的屬性
+
+    設定 IMS_PRINT_SHARED_CATALOG=1 時，JSON / CSV 商品資料的屬性在發佈共用區段時一併寫成屬性檔，
+    各程式以 mmap 開啟（見 shared_catalog），不再各自讀取整份商品資料。
+    """
+    if not path.lower().endswith(catalog.SQLITE_SUFFIXES):
+        import shared_catalog
+        if shared_catalog.shared_catalog_enabled():
+            try:
+                return shared_catalog.attach_attributes(path, options=options)
+            except (OSError, ValueError) as e:
+                print(f"無法使用共用商品屬性，改為各自載入: {e}")
+    return load_attributes(path, options)
+
+
+def load_attributes(path, options=None, apply_deltas=True):
+    """載入商品資料檔中的屬性，回傳可 gather 的物件
+
+    JSON 讀取每筆記錄的 ATTRIBUTE_FIELDS 欄位；CSV/TSV 依 options["columns"]
+    （weight、volume、pack_size）或表頭名稱；SQLite 使用 item_attributes 表。
+    apply_deltas 時，JSON / CSV 旁的 delta 檔中新增或更新的記錄若含屬性欄位，也一併套用。
+    """
+    lower = path.lower()
+    if lower.endswith(catalog.SQLITE_SUFFIXES):
+        attributes = SQLiteAttributes(path)
+        try:
+            attributes.check()
+        except sqlite3.OperationalError:  # 匯入時來源沒有屬性，沒有 item_attributes 表
+            attributes.close()
+            return AttributeColumns()
+        return attributes
+
+    table = AttributeColumns()
+    if lower.endswith(catalog.DELIMITED_SUFFIXES):
+        _load_delimited_attributes(path, table, **(options or {}))
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            _set_from_records(table, json.load(f))
+    if apply_deltas:
+        for delta_path in catalog.find_delta_files(path):
+            delta = catalog.load_delta(delta_path)
+            _set_from_records(table, delta["add"] + delta["update"])
+    return table
+
+
+def _set_from_records(table, records):
+    for record in records:
+        values = _attributes_from_record(record)
+        if values and catalog.CODE_FIELD in record:
+            table.set(record[catalog.CODE_FIELD].strip(), values)
+
+
+def _load_delimited_attributes(path, table, columns=None, encoding=None, delimiter=None):
+    """串流讀取 CSV/TSV 的屬性欄（表頭沒有任何屬性欄時不讀取內容）"""
+    columns = columns or {}
+    encoding = encoding or catalog.detect_encoding(path)
+    with open(path, "r", encoding=encoding, newline="") as f:
+        first_line = f.readline()
+        delimiter = delimiter or catalog.detect_delimiter(path, first_line)
+        header = next(csv.reader([first_line], delimiter=delimiter), [])
+        code_index = catalog.find_column(header, columns.get("code"), catalog.CODE_COLUMN_NAMES)
+
+        indices = {}
+        for name in ATTRIBUTES:
+            try:
+                indices[name] = catalog.find_column(header, columns.get(name), ATTRIBUTE_COLUMN_NAMES[name])
+            except ValueError:
+                if columns.get(name) is not None:  # 有設定卻找不到時回報
+                    raise
+        if not indices:
+            return
+
+        for row in csv.reader(f, delimiter=delimiter):
+            if len(row) <= code_index:
+                continue
+            code = row[code_index].strip()
+            if code:
+                table.set(code, {name: parse_attribute(row[index]) if index < len(row) else None
+                                 for name, index in indices.items()})
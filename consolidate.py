@@ -0,0 +1,185 @@
+# 調貨單合併：同一天、同一組寄出 / 收件店別的多張調貨單合併為一份文件，相同商品的數量加總
+import argparse
+import time
+
+from transfer_history import parse_transfer_date
+
+_NAME_FIELDS = ("sender_name", "receiver_name")
+
+
+def group_key(data):
+    """合併的依據：(調貨日期, 寄出店別, 收件店別)；日期格式不同（2024/1/31、2024-01-31）視為同一天"""
+    return (parse_transfer_date(data.get("date", "")),
+            str(data.get("sender_store", "")).strip(),
+            str(data.get("receiver_store", "")).strip())
+
+
+def _join_unique(values, separator):
+    """去除空白與重複後依出現順序串接"""
+    seen = []
+    for value in values:
+        value = str(value).strip()
+        if value and value not in seen:
+            seen.append(value)
+    return separator.join(seen)
+
+
+def _parse_quantity(value):
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        return None
+
+
+def merge_transfers(transfers):
+    """合併同一組的調貨資料，回傳新的調貨資料（不修改原資料）
+
+    表頭沿用第一張（寄件人、收件人不同時以「、」串接，備註以「；」串接）；
+    商品依商品編號依第一次出現的順序合併，數量加總。數量不是整數的行不合併，原樣保留交給驗證回報。
+    """
+    first = transfers[0]
+    merged = {key: value for key, value in first.items() if key != "items"}
+    for field in _NAME_FIELDS:
+        merged[field] = _join_unique((data.get(field, "") for data in transfers), "、")
+    merged["notes"] = _join_unique((data.get("notes", "") for data in transfers), "；")
+
+    items = []
+    totals = {}  # 商品編號 -> items 中的位置
+    for data in transfers:
+        for item in data.get("items", []):
+            article_no = str(item.get("article_no", "")).strip()
+            quantity = _parse_quantity(item.get("quantity", ""))
+            index = totals.get(article_no)
+            if index is not None and quantity is not None:
+                items[index]["quantity"] = str(int(items[index]["quantity"]) + quantity)
+                continue
+            items.append(dict(item, article_no=article_no,
+                              quantity=str(quantity) if quantity is not None else item.get("quantity", "")))
+            if article_no and quantity is not None:
+                totals[article_no] = len(items) - 1
+    merged["items"] = items
+    return merged
+
+
+class ConsolidationPlan:
+    """合併結果：groups 為 [(合併後的調貨資料, 原調貨單序號清單)]，依每組第一張出現的順序排列"""
+
+    def __init__(self, transfers, groups):
+        self.transfers = transfers
+        self.groups = groups
+        self.pages_before = None
+        self.pages_after = None
+
+    @property
+    def merged(self):
+        return [data for data, _ in self.groups]
+
+    def line_counts(self):
+        """(合併前商品行數, 合併後商品行數)"""
+        return (sum(len(data.get("items", [])) for data in self.transfers),
+                sum(len(data["items"]) for data, _ in self.groups))
+
+    def count_pages(self, template, font_name, profile="default"):
+        """計算合併前後的總頁數（只排版不產生 PDF），回傳 (合併前, 合併後)"""
+        import pdf_render
+        self.pages_before = sum(pdf_render.page_count(template, data, font_name, profile)
+                                for data in self.transfers)
+        self.pages_after = sum(pdf_render.page_count(template, data, font_name, profile)
+                               for data, _ in self.groups)
+        return self.pages_before, self.pages_after
+
+    def summary(self, limit=10):
+        """試算報告：節省的文件數、頁數與商品行數，並列出合併的組別"""
+        lines_before, lines_after = self.line_counts()
+        report = [f"文件 {len(self.transfers)} → {len(self.groups)}（節省 {len(self.transfers) - len(self.groups)} 份）",
+                  f"商品行 {lines_before} → {lines_after}（節省 {lines_before - lines_after} 行）"]
+        if self.pages_before is not None:
+            report.append(f"頁數 {self.pages_before} → {self.pages_after}"
+                          f"（節省 {self.pages_before - self.pages_after} 頁）")
+        combined = [(data, indices) for data, indices in self.groups if len(indices) > 1]
+        for data, indices in combined[:limit]:
+            report.append(f"  {data.get('date', '')} {data.get('sender_store', '')} → "
+                          f"{data.get('receiver_store', '')}: 第 {', '.join(str(i + 1) for i in indices)} 張合併")
+        if len(combined) > limit:
+            report.append(f"  ... 其餘 {len(combined) - limit} 組未列出")
+        return "\n".join(report)
+
+
+def plan_consolidation(transfers):
+    """依 (日期, 寄出店別, 收件店別) 分組合併整批調貨資料，回傳 ConsolidationPlan
+
+    以字典分組，整批只走訪一次；只有一張的組別直接沿用原資料。
+    """
+    indices_by_key = {}
+    for index, data in enumerate(transfers):
+        indices_by_key.setdefault(group_key(data), []).append(index)
+
+    groups = []
+    for indices in indices_by_key.values():
+        if len(indices) == 1:
+            groups.append((transfers[indices[0]], indices))
+        else:
+            groups.append((merge_transfers([transfers[i] for i in indices]), indices))
+    return ConsolidationPlan(transfers, groups)
+
+
+def sample_batch(count, pairs=20, days=3, rows=8, seed=0):
+    """測試用的批量列表：count 張調貨單分散在 pairs 組店別與 days 天"""
+    import random
+    rng = random.Random(seed)
+    transfers = []
+    for _ in range(count):
+        pair = rng.randrange(pairs)
+        transfers.append({
+            "date": f"2024/01/{rng.randrange(days) + 1:02d}",
+            "sender_store": f"店{pair % 7:02d}",
+            "sender_name": "王小明",
+            "receiver_store": f"店{pair // 7 + 10:02d}",
+            "receiver_name": "陳小華",
+            "notes": "",
+            "items": [{"article_no": f"{rng.randrange(300):05d}", "description": f"ITEM {n}",
+                       "quantity": str(rng.randrange(1, 10))} for n in range(rows)],
+        })
+    return transfers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="調貨單合併試算")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    plan_parser = subparsers.add_parser("plan", help="試算工作檔（job_queue 格式）合併後節省的文件與頁數")
+    plan_parser.add_argument("files", nargs="+", help="工作檔（JSON）")
+    plan_parser.add_argument("--font", help="ChineseFont 使用的 TTF/TTC 字體檔")
+
+    bench_parser = subparsers.add_parser("benchmark", help="以測試資料量測合併與頁數試算的時間")
+    bench_parser.add_argument("--count", type=int, default=5000, help="調貨單張數")
+    bench_parser.add_argument("--font", help="ChineseFont 使用的 TTF/TTC 字體檔")
+
+    args = parser.parse_args(argv)
+    import pdf_render
+    font_name = pdf_render.register_font(args.font)
+
+    if args.command == "plan":
+        import job_queue
+        transfers = []
+        template = "document"
+        for path in args.files:
+            jobs = job_queue.load_job_file(path, ".")
+            transfers += [data for data, _, _, _ in jobs]
+            template = jobs[0][2] if jobs else template
+        plan = plan_consolidation(transfers)
+        plan.count_pages(template, font_name)
+        print(plan.summary())
+    else:
+        transfers = sample_batch(args.count)
+        start = time.perf_counter()
+        plan = plan_consolidation(transfers)
+        planned = time.perf_counter()
+        plan.count_pages("document", font_name)
+        counted = time.perf_counter()
+        print(plan.summary(limit=0))
+        print(f"合併 {(planned - start) * 1000:.1f} ms，頁數試算 {(counted - planned) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
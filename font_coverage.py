@@ -0,0 +1,233 @@
+# 字體字元涵蓋範圍與備用字體鏈：主要字體缺字（例如西文字體遇到中文）時改用下一個有該字元的字體
+import hashlib
+import os
+import platform
+import zlib
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont, TTFontFile
+
+from app_paths import app_data_dir
+
+MAX_CODEPOINT = 0x110000
+
+# 各系統常見字體（依序作為備用字體候選；不存在的檔案略過）
+SYSTEM_FONT_CANDIDATES = {
+    "Windows": [
+        "C:/Windows/Fonts/msjh.ttc",     # 微軟正黑體
+        "C:/Windows/Fonts/msyh.ttc",     # 微軟雅黑
+        "C:/Windows/Fonts/simhei.ttf",   # 黑體
+        "C:/Windows/Fonts/simsun.ttc",   # 宋體
+    ],
+    "Darwin": [
+        "/System/Library/Fonts/PingFang.ttc",
+        "/System/Library/Fonts/Supplemental/Songti.ttc",
+        "/Library/Fonts/Microsoft/Microsoft JhengHei.ttf",
+    ],
+    "Linux": [
+        "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+        "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+        "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc",
+        "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    ],
+}
+
+# ReportLab 內建字體（WinAnsi 編碼）可顯示的字元：ASCII 與 Latin-1
+_STANDARD_FONT_RANGES = ((0x20, 0x7F), (0xA0, 0x100))
+
+_coverage_cache = {}
+_chains = {}
+
+
+def system_font_candidates():
+    return SYSTEM_FONT_CANDIDATES.get(platform.system(), SYSTEM_FONT_CANDIDATES["Linux"])
+
+
+class Coverage:
+    """字體涵蓋的字元，以每個 Unicode 碼位 1 bit 的位元組陣列存放（約 136 KB）"""
+
+    __slots__ = ("bits",)
+
+    def __init__(self, bits):
+        self.bits = bits
+
+    @classmethod
+    def from_codepoints(cls, codepoints):
+        bits = bytearray(MAX_CODEPOINT >> 3)
+        for cp in codepoints:
+            if cp < MAX_CODEPOINT:
+                bits[cp >> 3] |= 1 << (cp & 7)
+        return cls(bytes(bits))
+
+    def __contains__(self, cp):
+        return cp < MAX_CODEPOINT and self.bits[cp >> 3] >> (cp & 7) & 1
+
+    def covers(self, text):
+        return all(ord(ch) in self for ch in text)
+
+
+def standard_font_coverage():
+    return Coverage.from_codepoints(cp for start, end in _STANDARD_FONT_RANGES for cp in range(start, end))
+
+
+def font_coverage(path, subfont_index=0):
+    """TTF/TTC 字體的涵蓋範圍
+
+    解析 cmap 需要讀取整個字體檔（CJK 字體數十 MB），結果以字體檔路徑、大小與修改時間為鍵
+    壓縮存到 ~/.ims_print/font_coverage/，之後只需讀取數 KB。
+    """
+    stat = os.stat(path)
+    key = hashlib.sha1(f"{os.path.abspath(path)}:{subfont_index}:{stat.st_size}:{stat.st_mtime}"
+                       .encode("utf-8")).hexdigest()
+    coverage = _coverage_cache.get(key)
+    if coverage is not None:
+        return coverage
+
+    cache_path = os.path.join(app_data_dir("font_coverage"), key + ".bits")
+    try:
+        with open(cache_path, "rb") as f:
+            coverage = Coverage(zlib.decompress(f.read()))
+    except (OSError, zlib.error):
+        coverage = None
+    if coverage is None or len(coverage.bits) != MAX_CODEPOINT >> 3:
+        font_file = TTFontFile(path, validate=0, subfontIndex=subfont_index)
+        coverage = Coverage.from_codepoints(font_file.charToGlyph)
+        try:
+            from output_writer import atomic_write
+            atomic_write(cache_path, zlib.compress(coverage.bits))
+        except OSError as e:
+            print(f"無法寫入字體涵蓋範圍快取: {e}")
+
+    _coverage_cache[key] = coverage
+    return coverage
+
+
+class _ChainFont:
+    """備用字體鏈中的一個字體：TTF 檔在第一次用到時才解析與註冊"""
+
+    def __init__(self, name, path=None, subfont_index=0):
+        self.name = name
+        self.path = path
+        self.subfont_index = subfont_index
+        self._coverage = None
+
+    @property
+    def coverage(self):
+        if self._coverage is None:
+            if self.path is None:
+                self._coverage = standard_font_coverage()
+            else:
+                self._coverage = font_coverage(self.path, self.subfont_index)
+        return self._coverage
+
+    def ensure_registered(self):
+        if self.name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(self.name, self.path, subfontIndex=self.subfont_index))
+
+
+class FontChain:
+    """主要字體加上依序的備用字體，將文字切成各自使用一個字體的片段
+
+    每個字元只在第一次出現時查詢各字體的涵蓋位元，結果（涵蓋該字元的字體位元遮罩）
+    存在字典中；切段時目前字體有該字元就延續，標點與空白不會把片段切碎。
+    """
+
+    def __init__(self, fonts):
+        self.fonts = fonts
+        self.primary = fonts[0].name
+        self._masks = {}
+        self._ascii_ok = None
+
+    def _mask(self, ch):
+        cp = ord(ch)
+        mask = 0
+        for n, font in enumerate(self.fonts):
+            if cp in font.coverage:
+                mask |= 1 << n
+        self._masks[ch] = mask
+        return mask
+
+    def split(self, text):
+        """回傳 [(字體名稱, 文字片段)]；所有字體都沒有的字元使用目前字體"""
+        if self._ascii_ok is None:
+            self._ascii_ok = self.fonts[0].coverage.covers(
+                "".join(chr(cp) for cp in range(0x20, 0x7F)))
+        if self._ascii_ok and text.isascii():
+            return [(self.primary, text)]
+
+        masks = self._masks
+        runs = []
+        current = 0
+        start = 0
+        for i, ch in enumerate(text):
+            mask = masks.get(ch)
+            if mask is None:
+                mask = self._mask(ch)
+            if mask >> current & 1 or not mask:
+                continue
+            index = (mask & -mask).bit_length() - 1  # 涵蓋此字元的第一個字體
+            if i > start:
+                runs.append((self.fonts[current].name, text[start:i]))
+            current, start = index, i
+        if len(text) > start or not runs:
+            runs.append((self.fonts[current].name, text[start:]))
+
+        for name, _ in runs:
+            if name != self.primary:
+                self._font(name).ensure_registered()
+        return runs
+
+    def _font(self, name):
+        for font in self.fonts:
+            if font.name == name:
+                return font
+        raise KeyError(name)
+
+    def string_width(self, text, size):
+        return sum(pdfmetrics.stringWidth(run, name, size) for name, run in self.split(text))
+
+    def fingerprint(self):
+        """快取鍵用：備用字體檔與其修改時間"""
+        parts = []
+        for font in self.fonts[1:]:
+            mtime = os.path.getmtime(font.path) if font.path and os.path.exists(font.path) else ""
+            parts.append(f"{font.name}:{font.path}:{mtime}")
+        return "|".join(parts)
+
+
+def install_fallbacks(font_names, primary_path=None, candidates=None):
+    """為 font_names（已註冊的字體名稱）建立備用字體鏈，回傳找到的備用字體檔清單
+
+    備用字體依序為 primary_path（程式選用的字體檔）與 candidates（預設為 system_font_candidates()），
+    不存在的檔案與字體本身略過。內建字體（Helvetica 等）也可加上備用字體，標題等中文字不再顯示為方框。
+    """
+    candidates = system_font_candidates() if candidates is None else candidates
+    paths = []
+    seen = set()
+    for path in ([primary_path] if primary_path else []) + list(candidates):
+        key = os.path.normcase(os.path.abspath(path))
+        if key not in seen and os.path.exists(path):
+            seen.add(key)
+            paths.append(path)
+
+    for font_name in font_names:
+        if font_name in pdfmetrics.standardFonts:
+            fonts = [_ChainFont(font_name)]
+        else:
+            font = pdfmetrics.getFont(font_name)
+            fonts = [_ChainFont(font_name, font.face.filename, getattr(font.face, "subfontIndex", 0))]
+        own = os.path.normcase(os.path.abspath(fonts[0].path)) if fonts[0].path else None
+        # 同一個字體檔在各字體鏈中共用註冊名稱
+        fonts += [_ChainFont(f"Fallback-{os.path.splitext(os.path.basename(path))[0]}", path)
+                  for path in paths if os.path.normcase(os.path.abspath(path)) != own]
+        if len(fonts) > 1:
+            _chains[font_name] = FontChain(fonts)
+        else:
+            _chains.pop(font_name, None)
+    return [path for path in paths if not primary_path or path != primary_path]
+
+
+def chain_for(font_name):
+    """字體的備用字體鏈，沒有設定時回傳 None"""
+    return _chains.get(font_name)
@@ -0,0 +1,533 @@
+# 背景產生佇列：調貨單產生工作存入本機 SQLite，由任意數量的 worker 行程取出產生，
+# 失敗自動重試、超過次數移到失敗區，worker 中途結束後其他 worker 會接手
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from app_paths import app_data_dir
+
+QUEUE_FILENAME = "jobs.db"
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+DEAD = "dead"
+
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_DELAY_SECONDS = 10
+MAX_RETRY_DELAY_SECONDS = 600
+
+
+def default_queue_path():
+    """預設佇列資料庫，可用環境變數 IMS_PRINT_QUEUE 指定（例如多台電腦共用的位置）"""
+    return os.environ.get("IMS_PRINT_QUEUE") or os.path.join(app_data_dir(), QUEUE_FILENAME)
+
+
+def retry_delay(attempts):
+    """第 attempts 次失敗後的等待秒數（指數增加，設有上限）"""
+    return min(RETRY_DELAY_SECONDS * 2 ** (attempts - 1), MAX_RETRY_DELAY_SECONDS)
+
+
+class JobQueue:
+    """產生工作佇列
+
+    worker 以 lease() 取得工作並在期限內完成；期限過後工作回到可取得狀態，
+    因此 worker 當機或被中止時，未完成的工作會由其他 worker 重新產生。
+    每次取得都計入嘗試次數，超過 max_attempts 的工作標記為 dead，不再重試。
+
+    取得工作使用 BEGIN IMMEDIATE，多個行程同時取得也不會拿到同一份工作。
+    多台電腦共用時使用 shared=True（改用一般日誌模式，WAL 不支援網路磁碟）。
+    """
+
+    def __init__(self, path=None, shared=False):
+        self.path = path or default_queue_path()
+        # 自行控制交易（BEGIN IMMEDIATE），其他行程寫入中時最多等待 30 秒；
+        # 產生期間由 keep_lease 的執行緒延長租約（與主執行緒不會同時使用連線）
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode = %s" % ("DELETE" if shared else "WAL"))
+        self._create_schema()
+
+    def close(self):
+        self._conn.close()
+
+    def _create_schema(self):
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                batch TEXT NOT NULL,
+                state TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                output_path TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                available_at REAL NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                last_error TEXT,
+                created_at TEXT NOT NULL,
+                finished_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_state
+                ON jobs (state, available_at);
+            CREATE INDEX IF NOT EXISTS idx_jobs_batch
+                ON jobs (batch, state);
+        """)
+
+    def _transaction(self):
+        return _ImmediateTransaction(self._conn)
+
+    def enqueue_many(self, jobs, batch="", max_attempts=DEFAULT_MAX_ATTEMPTS, unique_paths=False):
+        """一次加入多份工作 [(調貨資料, 輸出路徑, 版面, 輸出設定)]，回傳工作編號清單
+
+        整批在同一個交易中寫入：要嘛全部加入，要嘛都不加入。
+        unique_paths 時在同一個交易中決定不重複的輸出檔名：除了既有檔案與同批次的檔名，
+        也避開佇列中尚未產生（等待中或產生中）的工作的輸出路徑，同一批重複加入時不會互相覆蓋。
+        """
+        now = time.time()
+        created_at = datetime.now().isoformat(timespec="seconds")
+        ids = []
+        with self._transaction():
+            if unique_paths:
+                jobs = unique_output_paths(jobs, self._pending_output_paths())
+            for data, output_path, template, profile in jobs:
+                payload = json.dumps({"data": data, "template": template, "profile": profile},
+                                     ensure_ascii=False, default=str)
+                cursor = self._conn.execute(
+                    "INSERT INTO jobs (batch, state, payload, output_path, max_attempts, "
+                    "available_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (batch, PENDING, payload, os.path.abspath(output_path), max_attempts, now, created_at))
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def _pending_output_paths(self):
+        rows = self._conn.execute("SELECT output_path FROM jobs WHERE state IN (?, ?)",
+                                  (PENDING, LEASED))
+        return {os.path.normcase(row["output_path"]) for row in rows}
+
+    def enqueue(self, data, output_path, template="document", profile="default", batch="",
+                max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """加入一份工作，回傳工作編號"""
+        return self.enqueue_many([(data, output_path, template, profile)], batch, max_attempts)[0]
+
+    def lease(self, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """取得下一份可執行的工作（含租約已過期的工作），沒有時回傳 None
+
+        回傳 dict：id、batch、attempts、output_path 以及 payload 的 data / template / profile。
+        """
+        now = time.time()
+        with self._transaction():
+            while True:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE (state = ? AND available_at <= ?) "
+                    "OR (state = ? AND lease_expires < ?) ORDER BY id LIMIT 1",
+                    (PENDING, now, LEASED, now)).fetchone()
+                if row is None:
+                    return None
+                if row["state"] == LEASED and row["attempts"] >= row["max_attempts"]:
+                    # 最後一次嘗試時 worker 中止（例如資料導致當機），不再重試
+                    self._conn.execute(
+                        "UPDATE jobs SET state = ?, lease_owner = NULL, lease_expires = NULL, "
+                        "last_error = ?, finished_at = ? WHERE id = ?",
+                        (DEAD, f"worker {row['lease_owner']} 未在期限內完成",
+                         datetime.now().isoformat(timespec="seconds"), row["id"]))
+                    continue
+                self._conn.execute(
+                    "UPDATE jobs SET state = ?, lease_owner = ?, lease_expires = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (LEASED, owner, now + lease_seconds, row["id"]))
+                break
+
+        job = json.loads(row["payload"])
+        job.update(id=row["id"], batch=row["batch"], attempts=row["attempts"] + 1,
+                   output_path=row["output_path"])
+        return job
+
+    def complete(self, job_id, owner):
+        """標記工作完成；租約已被其他 worker 接手時回傳 False"""
+        with self._transaction():
+            cursor = self._conn.execute(
+                "UPDATE jobs SET state = ?, lease_owner = NULL, lease_expires = NULL, "
+                "last_error = NULL, finished_at = ? WHERE id = ? AND state = ? AND lease_owner = ?",
+                (DONE, datetime.now().isoformat(timespec="seconds"), job_id, LEASED, owner))
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, owner, error):
+        """記錄失敗：尚有次數時延後重試，否則標記為 dead；回傳新狀態（租約已失效時為 None）"""
+        with self._transaction():
+            row = self._conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND state = ? AND lease_owner = ?",
+                (job_id, LEASED, owner)).fetchone()
+            if row is None:
+                return None
+            if row["attempts"] >= row["max_attempts"]:
+                state, available_at = DEAD, time.time()
+                finished_at = datetime.now().isoformat(timespec="seconds")
+            else:
+                state, available_at = PENDING, time.time() + retry_delay(row["attempts"])
+                finished_at = None
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, available_at = ?, lease_owner = NULL, lease_expires = NULL, "
+                "last_error = ?, finished_at = ? WHERE id = ?",
+                (state, available_at, str(error), finished_at, job_id))
+        return state
+
+    def extend(self, job_id, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """延長租約（產生時間特別長的工作使用）"""
+        with self._transaction():
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND state = ? AND lease_owner = ?",
+                (time.time() + lease_seconds, job_id, LEASED, owner))
+        return cursor.rowcount == 1
+
+    def next_available_at(self):
+        """等待中或產生中的工作最早可取得的時間（重試延後或租約到期），沒有未完成的工作時回傳 None"""
+        row = self._conn.execute(
+            "SELECT MIN(CASE WHEN state = ? THEN available_at ELSE lease_expires END) "
+            "FROM jobs WHERE state IN (?, ?)", (PENDING, PENDING, LEASED)).fetchone()
+        return row[0]
+
+    def retry_dead(self, batch=None):
+        """將 dead 工作重新排入佇列（嘗試次數歸零），回傳數量"""
+        sql = ("UPDATE jobs SET state = ?, attempts = 0, available_at = ?, finished_at = NULL "
+               "WHERE state = ?")
+        params = [PENDING, time.time(), DEAD]
+        if batch is not None:
+            sql += " AND batch = ?"
+            params.append(batch)
+        with self._transaction():
+            return self._conn.execute(sql, params).rowcount
+
+    def purge(self, days=7):
+        """刪除完成超過 days 天的工作，回傳數量"""
+        cutoff = (datetime.now() - timedelta(days=days)).isoformat(timespec="seconds")
+        with self._transaction():
+            return self._conn.execute(
+                "DELETE FROM jobs WHERE state = ? AND finished_at < ?", (DONE, cutoff)).rowcount
+
+    def counts(self, batch=None):
+        """各批次各狀態的工作數 {批次: {狀態: 數量}}"""
+        sql = "SELECT batch, state, COUNT(*) FROM jobs"
+        params = []
+        if batch is not None:
+            sql += " WHERE batch = ?"
+            params.append(batch)
+        sql += " GROUP BY batch, state ORDER BY MIN(id)"
+        counts = {}
+        for name, state, count in self._conn.execute(sql, params):
+            counts.setdefault(name, {})[state] = count
+        return counts
+
+    def dead_jobs(self, batch=None, limit=50):
+        """失敗（dead）的工作：(編號, 批次, 輸出路徑, 嘗試次數, 最後錯誤)"""
+        sql = "SELECT id, batch, output_path, attempts, last_error FROM jobs WHERE state = ?"
+        params = [DEAD]
+        if batch is not None:
+            sql += " AND batch = ?"
+            params.append(batch)
+        sql += " ORDER BY id LIMIT ?"
+        params.append(limit)
+        return [tuple(row) for row in self._conn.execute(sql, params)]
+
+
+class _ImmediateTransaction:
+    """BEGIN IMMEDIATE ... COMMIT（發生例外時 ROLLBACK）"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __enter__(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self._conn.execute("ROLLBACK" if exc_type is not None else "COMMIT")
+        return False
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+@contextmanager
+def keep_lease(queue, job_id, owner, lease_seconds):
+    """產生期間在背景每隔租約的 1/3 延長一次租約，產生時間較長的工作不會被其他 worker 接手而重複產生"""
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(lease_seconds / 3):
+            if not queue.extend(job_id, owner, lease_seconds):
+                break
+
+    thread = threading.Thread(target=renew, name=f"lease-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_worker(queue_path=None, font_path=None, exit_when_empty=False, poll_interval=2.0,
+               lease_seconds=DEFAULT_LEASE_SECONDS, shared=False, history=True):
+    """worker 主迴圈：反覆取得工作、產生 PDF、寫入調貨紀錄，回傳完成的工作數
+
+    輸出路徑在加入佇列時就已決定，重試時以原子寫入覆蓋同一檔案，
+    因此 worker 中途結束後重新產生不會留下重複或不完整的檔案。
+    exit_when_empty 時，等到沒有等待中（含延後重試）或產生中的工作才結束。
+    """
+    import pdf_render
+    from output_writer import atomic_write
+    from render_cache import RenderCache, render_cache_enabled
+
+    queue = JobQueue(queue_path, shared=shared)
+    owner = worker_id()
+    font_name = pdf_render.register_font(font_path)
+    cache = RenderCache() if render_cache_enabled() else None
+    transfer_history = None
+    if history:
+        from transfer_history import TransferHistory
+        transfer_history = TransferHistory()
+
+    done = 0
+    try:
+        while True:
+            job = queue.lease(owner, lease_seconds)
+            if job is None:
+                # 剩下的工作在等待重試或由其他 worker 產生中：等到最早可取得的時間（最多 poll_interval 秒）
+                available_at = queue.next_available_at()
+                if available_at is None and exit_when_empty:
+                    break
+                wait = poll_interval if available_at is None else available_at - time.time()
+                time.sleep(min(max(wait, 0.05), poll_interval))
+                continue
+
+            output_path = job["output_path"]
+            try:
+                with keep_lease(queue, job["id"], owner, lease_seconds):
+                    if cache is not None:
+                        pdf_bytes, _ = cache.render_bytes(job["template"], job["data"], font_name,
+                                                          job["profile"])
+                    else:
+                        pdf_bytes = pdf_render.render_bytes(job["template"], job["data"], font_name,
+                                                            profile=job["profile"])
+                    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                    atomic_write(output_path, pdf_bytes)
+            except Exception as e:
+                state = queue.fail(job["id"], owner, f"{type(e).__name__}: {e}")
+                print(f"[{owner}] 工作 {job['id']} 第 {job['attempts']} 次失敗（{state}）: {e}")
+                continue
+
+            if transfer_history is not None:
+                try:
+                    transfer_history.record(job["data"], output_path, job["template"], job["profile"])
+                except Exception as e:
+                    print(f"寫入調貨紀錄失敗: {e}")
+            if queue.complete(job["id"], owner):
+                done += 1
+                print(f"[{owner}] 工作 {job['id']} 完成: {os.path.basename(output_path)}")
+    finally:
+        queue.close()
+        if transfer_history is not None:
+            transfer_history.close()
+    return done
+
+
+def run_workers(count, **kwargs):
+    """啟動 count 個 worker 行程並等待結束（Ctrl+C 時中止，未完成的工作在租約到期後由其他 worker 接手）"""
+    if count <= 1:
+        return run_worker(**kwargs)
+    processes = [multiprocessing.Process(target=run_worker, kwargs=kwargs, name=f"job-worker-{n}")
+                 for n in range(count)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        raise
+
+
+def load_job_file(path, output_dir):
+    """讀取工作檔（JSON），回傳 [(調貨資料, 輸出路徑, 版面, 輸出設定)]
+
+    格式可為單一調貨資料、調貨資料清單，或
+    {"template": ..., "profile": ..., "transfers": [...]}；
+    調貨資料可用 "output" 指定檔名，未指定時依日期與店別命名。
+    """
+    with open(path, encoding="utf-8") as f:
+        content = json.load(f)
+
+    template, profile = "document", "default"
+    if isinstance(content, dict) and "transfers" in content:
+        template = content.get("template", template)
+        profile = content.get("profile", profile)
+        content = content["transfers"]
+    transfers = content if isinstance(content, list) else [content]
+
+    import pdf_render
+    from output_profiles import OUTPUT_PROFILES
+    if template not in pdf_render.TEMPLATES:
+        raise ValueError(f"未知的版面: {template}")
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"未知的輸出設定: {profile}")
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    jobs = []
+    for i, data in enumerate(transfers, 1):
+        if not isinstance(data, dict) or not data.get("items"):
+            raise ValueError(f"第 {i} 張調貨資料格式錯誤或沒有商品")
+        filename = data.get("output") or (
+            f"調貨單_{stem}_{i}_{str(data.get('date', '')).replace('/', '_')}_"
+            f"{data.get('sender_store', '')}_to_{data.get('receiver_store', '')}.pdf")
+        jobs.append((data, os.path.join(output_dir, filename), template, profile))
+    return jobs
+
+
+def unique_output_paths(jobs, reserved=()):
+    """決定不重複的輸出檔名（不覆蓋既有檔案與 reserved 中的路徑，同批次也不重複）
+
+    reserved 為已預留的路徑（os.path.normcase 後的絕對路徑）。
+    """
+    from output_writer import unique_path
+
+    reserved = set(reserved)
+    result = []
+    for data, output_path, template, profile in jobs:
+        output_path = unique_path(os.path.abspath(output_path), reserved)
+        reserved.add(os.path.normcase(output_path))
+        result.append((data, output_path, template, profile))
+    return result
+
+
+def watch_folder(queue, folder, output_dir=None, poll_interval=2.0, once=False):
+    """監看投遞資料夾：新的 *.json 工作檔加入佇列後移到 processed/，格式錯誤的移到 rejected/
+
+    先將檔案改名為隱藏檔再處理，多個監看程式同時執行也不會重複加入。
+    """
+    output_dir = output_dir or os.path.join(folder, "output")
+    processed_dir = os.path.join(folder, "processed")
+    rejected_dir = os.path.join(folder, "rejected")
+    for directory in (output_dir, processed_dir, rejected_dir):
+        os.makedirs(directory, exist_ok=True)
+
+    while True:
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            if name.startswith(".") or not name.lower().endswith(".json") or not os.path.isfile(path):
+                continue
+            claimed = os.path.join(folder, f".{name}.{os.getpid()}.claimed")
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue  # 其他監看程式已取走（或仍在寫入中被鎖定）
+
+            try:
+                jobs = load_job_file(claimed, output_dir)
+                queue.enqueue_many(jobs, batch=os.path.splitext(name)[0], unique_paths=True)
+            except Exception as e:
+                shutil.move(claimed, os.path.join(rejected_dir, name))
+                with open(os.path.join(rejected_dir, name + ".error.txt"), "w", encoding="utf-8") as f:
+                    f.write(f"{type(e).__name__}: {e}\n")
+                print(f"無法加入 {name}: {e}")
+                continue
+            shutil.move(claimed, os.path.join(processed_dir, name))
+            print(f"已加入 {name}: {len(jobs)} 份工作")
+
+        if once:
+            break
+        time.sleep(poll_interval)
+
+
+STATE_LABELS = {PENDING: "等待中", LEASED: "產生中", DONE: "完成", DEAD: "失敗"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="背景產生佇列")
+    parser.add_argument("--db", help="佇列資料庫（預設 ~/.ims_print/jobs.db，或環境變數 IMS_PRINT_QUEUE）")
+    parser.add_argument("--shared", action="store_true", help="佇列位於多台電腦共用的網路磁碟")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = subparsers.add_parser("enqueue", help="將工作檔（JSON）加入佇列")
+    enqueue_parser.add_argument("files", nargs="+")
+    enqueue_parser.add_argument("-o", "--output-dir", default=".", help="PDF 輸出目錄")
+    enqueue_parser.add_argument("--batch", help="批次名稱（預設為工作檔名稱）")
+
+    work_parser = subparsers.add_parser("work", help="執行 worker，產生佇列中的 PDF")
+    work_parser.add_argument("-j", "--workers", type=int, default=1, help="worker 行程數")
+    work_parser.add_argument("--font", help="ChineseFont 使用的 TTF/TTC 字體檔")
+    work_parser.add_argument("--exit-when-empty", action="store_true", help="佇列沒有工作時結束")
+    work_parser.add_argument("--lease", type=int, default=DEFAULT_LEASE_SECONDS,
+                             help="租約秒數（超過時間未完成的工作交由其他 worker 重新產生）")
+    work_parser.add_argument("--no-history", action="store_true", help="不寫入調貨紀錄")
+
+    watch_parser = subparsers.add_parser("watch", help="監看投遞資料夾，將新的工作檔加入佇列")
+    watch_parser.add_argument("folder")
+    watch_parser.add_argument("-o", "--output-dir", help="PDF 輸出目錄（預設為 <資料夾>/output）")
+    watch_parser.add_argument("--once", action="store_true", help="只處理目前的檔案後結束")
+
+    status_parser = subparsers.add_parser("status", help="顯示各批次進度與失敗的工作")
+    status_parser.add_argument("--batch")
+
+    retry_parser = subparsers.add_parser("retry", help="重新排入失敗的工作")
+    retry_parser.add_argument("--batch")
+
+    purge_parser = subparsers.add_parser("purge", help="刪除已完成的舊工作")
+    purge_parser.add_argument("--days", type=int, default=7)
+
+    args = parser.parse_args(argv)
+    queue_path = args.db or default_queue_path()
+
+    if args.command == "work":
+        run_workers(args.workers, queue_path=queue_path, font_path=args.font,
+                    exit_when_empty=args.exit_when_empty, lease_seconds=args.lease,
+                    shared=args.shared, history=not args.no_history)
+        return
+
+    queue = JobQueue(queue_path, shared=args.shared)
+    try:
+        if args.command == "enqueue":
+            for path in args.files:
+                try:
+                    jobs = load_job_file(path, args.output_dir)
+                except (OSError, ValueError) as e:
+                    parser.error(f"{path}: {e}")
+                batch = args.batch or os.path.splitext(os.path.basename(path))[0]
+                ids = queue.enqueue_many(jobs, batch=batch, unique_paths=True)
+                print(f"{path}: 已加入 {len(ids)} 份工作（批次 {batch}）")
+        elif args.command == "watch":
+            try:
+                watch_folder(queue, args.folder, args.output_dir, once=args.once)
+            except KeyboardInterrupt:
+                pass
+        elif args.command == "status":
+            for batch, counts in queue.counts(args.batch).items():
+                summary = "  ".join(f"{STATE_LABELS[state]} {counts[state]}"
+                                    for state in STATE_LABELS if state in counts)
+                print(f"{batch or '(未命名)':<30} {summary}")
+            for job_id, batch, output_path, attempts, error in queue.dead_jobs(args.batch):
+                print(f"  失敗 #{job_id} [{batch}] {os.path.basename(output_path)}（{attempts} 次）: {error}")
+        elif args.command == "retry":
+            print(f"已重新排入 {queue.retry_dead(args.batch)} 份工作")
+        elif args.command == "purge":
+            print(f"已刪除 {queue.purge(args.days)} 份已完成的工作")
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,31 @@
+import time
+
+# 啟動計時起點（--debug-startup 時輸出各階段耗時）
+_STARTUP_T0 = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import landscape, A4
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 import os
 import platform
 import subprocess
+import sys
+import threading
 from datetime import datetime
-import json
+
+import catalog
+import output_profiles
+import print_spool
+from transfer_history import TransferHistory
+
+# ReportLab 相關模組（pdf_render、render_cache）在第一次產生PDF時才載入
+DEBUG_STARTUP = False
+
+
+def log_startup(message):
+    """--debug-startup 時輸出自啟動起算的耗時"""
+    if DEBUG_STARTUP:
+        elapsed = (time.perf_counter() - _STARTUP_T0) * 1000
+        print(f"[startup] {elapsed:8.1f} ms  {message}", file=sys.stderr)
 
 
 class PDFGeneratorApp:
@@ -21,20 +38,61 @@ class PDFGeneratorApp:
         # 設置最小視窗大小
         self.root.minsize(800, 600)
         
-        # 初始化字體
-        self.setup_fonts()
-        
-        # 載入IMS數據
-        self.load_ims_data()
+        # 字體與 PDF 快取在第一次產生PDF時才初始化（見 ensure_pdf_ready）
+        self.chinese_font = None
+        self.font_path = None
+        self.render_cache = None
+        self.queue_worker = None
         
         # 設置UI
         self.setup_ui()
+        log_startup("UI 建立完成")
+        
+        # 載入IMS數據（預設商品資料在背景執行緒載入）
+        self.load_ims_data()
+        
+        # 調貨紀錄
+        self.open_history()
+    
+    def open_history(self):
+        """開啟調貨紀錄資料庫（失敗時不影響PDF產生）"""
+        try:
+            self.history = TransferHistory()
+        except Exception as e:
+            print(f"開啟調貨紀錄失敗: {e}")
+            self.history = None
+    
+    def ensure_pdf_ready(self):
+        """第一次產生PDF前載入 ReportLab、設置字體並建立PDF快取"""
+        if self.chinese_font is not None:
+            return
+        
+        start = time.perf_counter()
+        from render_cache import RenderCache, render_cache_enabled
+        self.setup_fonts()
+        self.render_cache = RenderCache() if render_cache_enabled() else None
+        print(f"PDF 引擎初始化: {(time.perf_counter() - start) * 1000:.0f} ms")
         
-        # 強制刷新顯示
-        self.root.update_idletasks()
+        import text_measure
+        if text_measure.prewrap_enabled() and self.catalogs:
+            threading.Thread(target=self.precompute_wraps, args=(self.profile_var.get(),),
+                             daemon=True).start()
+    
+    def precompute_wraps(self, profile):
+        """背景預先計算預設商品資料的描述換行（IMS_PRINT_PREWRAP=1 時）"""
+        import pdf_render
+        try:
+            count = pdf_render.precompute_wraps(self.catalogs.get().values(), 'document',
+                                                self.chinese_font, profile)
+            print(f"已預先計算 {count} 筆商品描述的換行")
+        except Exception as e:
+            print(f"預先計算描述換行失敗: {e}")
     
     def setup_fonts(self):
         """設置中文字體 - 支援 Windows 和 macOS"""
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        
         try:
             system = platform.system()
             font_found = False
@@ -56,6 +114,7 @@ class PDFGeneratorApp:
                             # 對於 Windows，我們使用同一個字體文件但嘗試粗體變體
                             pdfmetrics.registerFont(TTFont('ChineseFontBold', font_path))
                             self.chinese_font = 'ChineseFont'
+                            self.font_path = font_path
                             font_found = True
                             print(f"使用字體: {font_path}")
                             break
@@ -79,6 +138,7 @@ class PDFGeneratorApp:
                             pdfmetrics.registerFont(TTFont('ChineseFont', font_path))
                             pdfmetrics.registerFont(TTFont('ChineseFontBold', font_path))
                             self.chinese_font = 'ChineseFont'
+                            self.font_path = font_path
                             font_found = True
                             print(f"使用字體: {font_path}")
                             break
@@ -99,6 +159,7 @@ class PDFGeneratorApp:
                             pdfmetrics.registerFont(TTFont('ChineseFont', font_path))
                             pdfmetrics.registerFont(TTFont('ChineseFontBold', font_path))
                             self.chinese_font = 'ChineseFont'
+                            self.font_path = font_path
                             font_found = True
                             print(f"使用字體: {font_path}")
                             break
@@ -109,31 +170,35 @@ class PDFGeneratorApp:
             if not font_found:
                 print("未找到合適的中文字體，使用 Helvetica")
                 self.chinese_font = 'Helvetica'
+            
+            # 主要字體缺字（例如西文字體遇到中文）時改用系統中其他有該字元的字體
+            import font_coverage
+            font_names = ['Helvetica', 'Helvetica-Bold']
+            if font_found:
+                font_names = ['ChineseFont', 'ChineseFontBold'] + font_names
+            fallbacks = font_coverage.install_fallbacks(font_names, self.font_path)
+            if fallbacks:
+                print(f"備用字體: {', '.join(fallbacks)}")
                 
         except Exception as e:
             print(f"字體設置發生錯誤: {e}")
             self.chinese_font = 'Helvetica'
     
     def load_ims_data(self):
-        """載入IMS數據 - 支援不同路徑格式"""
-        self.ims_data = {}
+        """載入IMS數據 - 支援不同路徑格式
+
+        各商品資料（catalogs.json 可設定多份）在第一次查詢時才載入
+        """
+        self.catalogs = None
         try:
-            # 獲取腳本所在目錄
+            # 獲取腳本所在目錄，如果同目錄下沒有，嘗試當前工作目錄
             script_dir = os.path.dirname(os.path.abspath(__file__))
-            json_file = os.path.join(script_dir, 'ims_list.json')
-            
-            # 如果同目錄下沒有，嘗試當前工作目錄
-            if not os.path.exists(json_file):
-                json_file = 'ims_list.json'
+            self.catalogs = catalog.load_catalog_registry([script_dir, '.'])
             
-            if os.path.exists(json_file):
-                # 使用 UTF-8 編碼確保跨平台兼容
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for item in data:
-                        if 'Item No' in item and 'Item Description' in item:
-                            self.ims_data[item['Item No']] = item['Item Description']
-                print(f"成功載入 {len(self.ims_data)} 筆 IMS 數據")
+            if self.catalogs:
+                print(f"可用的 IMS 商品資料: {', '.join(self.catalogs.names())}")
+                # 在背景執行緒預先載入預設商品資料，不阻塞視窗顯示
+                threading.Thread(target=self.preload_ims_data, daemon=True).start()
             else:
                 print("未找到 ims_list.json 文件，物品查詢功能將無法使用")
                 
@@ -141,6 +206,27 @@ class PDFGeneratorApp:
             print(f"載入IMS數據時發生錯誤: {e}")
             messagebox.showwarning("警告", f"載入IMS數據失敗: {e}\n物品查詢功能將無法使用")
     
+    def preload_ims_data(self):
+        """背景載入預設商品資料與商品屬性（查詢時若尚未載入完成會等待載入）"""
+        try:
+            self.catalogs.get()
+            log_startup("IMS 商品資料載入完成")
+            self.catalogs.attributes_for_store(None)
+        except Exception as e:
+            # 背景執行緒不可操作 Tk，錯誤留待查詢時再提示
+            print(f"載入IMS數據時發生錯誤: {e}")
+    
+    def get_ims_data(self):
+        """依寄出店別取得對應的商品資料"""
+        if self.catalogs is None:
+            return {}
+        try:
+            return self.catalogs.for_store(self.sender_store_var.get())
+        except Exception as e:
+            print(f"載入IMS數據時發生錯誤: {e}")
+            messagebox.showwarning("警告", f"載入IMS數據失敗: {e}")
+            return {}
+    
     def lookup_description(self):
         """查詢物品描述"""
         article_no = self.article_entry.get().strip()
@@ -148,8 +234,9 @@ class PDFGeneratorApp:
             messagebox.showwarning("警告", "請輸入Article No")
             return
         
-        if article_no in self.ims_data:
-            self.description_var.set(self.ims_data[article_no])
+        ims_data = self.get_ims_data()
+        if article_no in ims_data:
+            self.description_var.set(ims_data[article_no])
         else:
             self.description_var.set("未找到相關描述")
     
@@ -187,6 +274,8 @@ class PDFGeneratorApp:
     
     def clear_items_list(self):
         """清空物品清單"""
+        if not self.items_tab_built:
+            return
         for item in self.items_tree.get_children():
             self.items_tree.delete(item)
     
@@ -217,23 +306,32 @@ class PDFGeneratorApp:
         self.doc_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.doc_frame, text="文件資訊")
         
-        # 物品清單頁面
+        # 物品清單頁面（第一次切換到該頁時才建立內容）
         self.items_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.items_frame, text="物品清單")
+        self.items_tab_built = False
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
         
         # 在文件資訊頁面添加內容
         self.create_document_tab(self.doc_frame)
         
-        # 在物品清單頁面添加內容
-        self.create_items_tab(self.items_frame)
-        
         # 按鈕區域（共用）
         self.create_main_buttons(main_frame)
         
-        # 強制重新佈局
-        self.root.update_idletasks()
         print("UI 設置完成")
     
+    def on_tab_changed(self, event=None):
+        """切換到物品清單頁時建立內容"""
+        if self.notebook.select() == str(self.items_frame):
+            self.ensure_items_tab()
+    
+    def ensure_items_tab(self):
+        """建立物品清單標籤頁（只建立一次）"""
+        if not self.items_tab_built:
+            self.items_tab_built = True
+            self.create_items_tab(self.items_frame)
+            log_startup("物品清單頁建立完成")
+    
     def create_document_tab(self, parent):
         """創建文件資訊標籤頁"""
         # 輸入欄位
@@ -349,6 +447,10 @@ class PDFGeneratorApp:
         generate_btn = ttk.Button(main_button_frame, text="生成PDF", command=self.generate_pdf)
         generate_btn.pack(side=tk.LEFT, padx=(0, 10))
         
+        # 生成並列印按鈕
+        print_btn = ttk.Button(main_button_frame, text="生成並列印", command=self.print_pdf)
+        print_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
         # 清空表單按鈕
         clear_btn = ttk.Button(main_button_frame, text="清空表單", command=self.clear_form)
         clear_btn.pack(side=tk.LEFT, padx=(0, 10))
@@ -364,6 +466,19 @@ class PDFGeneratorApp:
         ttk.Label(path_frame, text="保存位置:").pack(side=tk.LEFT)
         self.path_label = ttk.Label(path_frame, text=self.save_path_var.get(), foreground="blue")
         self.path_label.pack(side=tk.LEFT, padx=(5, 0))
+        
+        # 印表機（空白 = 系統預設印表機）
+        printer_frame = ttk.Frame(parent)
+        printer_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(printer_frame, text="印表機:").pack(side=tk.LEFT)
+        self.printer_var = tk.StringVar(value=print_spool.default_printer())
+        ttk.Entry(printer_frame, textvariable=self.printer_var, width=30).pack(side=tk.LEFT, padx=(5, 0))
+        
+        # 輸出設定（fast = 產生最快，small = 檔案最小）
+        ttk.Label(printer_frame, text="輸出設定:").pack(side=tk.LEFT, padx=(20, 0))
+        self.profile_var = tk.StringVar(value=output_profiles.default_profile())
+        ttk.Combobox(printer_frame, textvariable=self.profile_var, width=10, state="readonly",
+                     values=list(output_profiles.OUTPUT_PROFILES)).pack(side=tk.LEFT, padx=(5, 0))
     
     def create_batch_section(self, parent):
         # 批量處理框架
@@ -371,8 +486,10 @@ class PDFGeneratorApp:
         batch_frame.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
         
         # 批量列表
-        columns = ('日期', '寄出店別', '寄件人', '收件店別', '收件人')
+        columns = ('日期', '寄出店別', '寄件人', '收件店別', '收件人', '物品數')
         self.batch_tree = ttk.Treeview(batch_frame, columns=columns, show='headings', height=6)
+        # 批量列表項目 -> 完整調貨資料（含物品清單）
+        self.batch_data = {}
         
         for col in columns:
             self.batch_tree.heading(col, text=col)
@@ -398,8 +515,26 @@ class PDFGeneratorApp:
         generate_batch_btn = ttk.Button(batch_btn_frame, text="批量生成PDF", command=self.generate_batch_pdf)
         generate_batch_btn.pack(side=tk.LEFT, padx=(0, 10))
         
+        print_batch_btn = ttk.Button(batch_btn_frame, text="批量列印", command=self.print_batch)
+        print_batch_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
+        queue_batch_btn = ttk.Button(batch_btn_frame, text="背景產生", command=self.queue_batch)
+        queue_batch_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
+        consolidate_btn = ttk.Button(batch_btn_frame, text="合併試算", command=self.preview_consolidation)
+        consolidate_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
         clear_batch_btn = ttk.Button(batch_btn_frame, text="清空列表", command=self.clear_batch)
         clear_batch_btn.pack(side=tk.LEFT)
+        
+        # 批量生成時整批寫成單一 ZIP（批量列印不受影響）
+        self.batch_zip_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(batch_btn_frame, text="打包成 ZIP", variable=self.batch_zip_var).pack(side=tk.LEFT, padx=(10, 0))
+        
+        # 同一天、同一組店別的調貨單合併為一份文件（批量生成、列印與背景產生皆適用）
+        self.batch_consolidate_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(batch_btn_frame, text="合併同日同店別",
+                        variable=self.batch_consolidate_var).pack(side=tk.LEFT, padx=(10, 0))
     
     def choose_save_path(self):
         """選擇保存路徑 - 跨平台兼容"""
@@ -455,133 +590,56 @@ class PDFGeneratorApp:
             return False
         return True
     
+    def render_pdf_bytes(self, data):
+        """產生調貨單PDF內容（相同內容直接從快取取得；data 需已由 attach_totals 加上合計）"""
+        self.ensure_pdf_ready()
+        import pdf_render
+        
+        profile = self.profile_var.get()
+        if self.render_cache is None:
+            return pdf_render.render_bytes('document', data, self.chinese_font, profile=profile)
+        
+        pdf_bytes, hit = self.render_cache.render_bytes('document', data, self.chinese_font, profile)
+        print(f"{'快取命中' if hit else '已產生'}: {data['sender_store']} -> {data['receiver_store']} "
+              f"({self.render_cache.stats_text()})")
+        return pdf_bytes
+    
+    def attach_totals(self, data):
+        """加上調貨單合計（總數量、總重量、材積與箱數）；商品屬性無法載入時只計算總數量"""
+        from transfer_totals import with_totals
+        
+        attributes = None
+        if self.catalogs is not None:
+            try:
+                attributes = self.catalogs.attributes_for_store(data['sender_store'])
+            except Exception as e:
+                print(f"載入商品屬性時發生錯誤: {e}")
+        return with_totals(data, attributes)
+    
+    def record_history(self, data, filename):
+        """寫入調貨紀錄（失敗時不影響PDF產生）"""
+        if self.history is not None:
+            try:
+                self.history.record(data, filename, 'document', self.profile_var.get())
+            except Exception as e:
+                print(f"寫入調貨紀錄失敗: {e}")
+    
     def create_pdf_document(self, data, filename):
-        """創建PDF文件"""
-        c = canvas.Canvas(filename, pagesize=landscape(A4))
-        width, height = landscape(A4)
-        
-        # 標題
-        c.setFont("Helvetica-Bold", 20)
-        title_x = (width - 300) / 2
-        c.drawString(title_x, height - 60, "Transfer Document / 調貨單")
-        
-        # 內容 - 標籤部分使用普通字體，數據部分使用粗體
-        y_position = height - 120
-        line_height = 40
-        left_margin = 80
-        
-        # 獲取適合的粗體字體
-        if self.chinese_font == 'ChineseFont':
-            bold_font = 'ChineseFontBold'
-        else:
-            bold_font = 'Helvetica-Bold'
-        
-        # 日期
-        c.setFont(self.chinese_font, 14)
-        c.drawString(left_margin, y_position, "日期 Date: ")
-        label_width = c.stringWidth("日期 Date: ", self.chinese_font, 14)
-        c.setFont(bold_font, 14)
-        c.drawString(left_margin + label_width, y_position, data['date'])
-        y_position -= line_height
-        
-        # 寄出店別
-        c.setFont(self.chinese_font, 14)
-        c.drawString(left_margin, y_position, "寄出店別 From Store: ")
-        label_width = c.stringWidth("寄出店別 From Store: ", self.chinese_font, 14)
-        c.setFont(bold_font, 14)
-        c.drawString(left_margin + label_width, y_position, data['sender_store'])
-        y_position -= line_height
-        
-        # 寄件人
-        c.setFont(self.chinese_font, 14)
-        c.drawString(left_margin, y_position, "寄件人 Sender: ")
-        label_width = c.stringWidth("寄件人 Sender: ", self.chinese_font, 14)
-        c.setFont(bold_font, 14)
-        c.drawString(left_margin + label_width, y_position, data['sender_name'])
-        y_position -= line_height
-        
-        # 收件店別
-        c.setFont(self.chinese_font, 14)
-        c.drawString(left_margin, y_position, "收件店別 To Store: ")
-        label_width = c.stringWidth("收件店別 To Store: ", self.chinese_font, 14)
-        c.setFont(bold_font, 14)
-        c.drawString(left_margin + label_width, y_position, data['receiver_store'])
-        y_position -= line_height
-        
-        # 收件人
-        c.setFont(self.chinese_font, 14)
-        c.drawString(left_margin, y_position, "收件人 Receiver: ")
-        label_width = c.stringWidth("收件人 Receiver: ", self.chinese_font, 14)
-        c.setFont(bold_font, 14)
-        c.drawString(left_margin + label_width, y_position, data['receiver_name'])
-        y_position -= line_height * 1.5
-        
-        # 物品清單
-        if data.get('items'):
-            c.setFont(self.chinese_font, 16)
-            c.drawString(left_margin, y_position, "物品清單 Items List:")
-            y_position -= 30
-            
-            # 表格標題
-            c.setFont(self.chinese_font, 12)
-            c.drawString(left_margin, y_position, "Article No")
-            c.drawString(left_margin + 120, y_position, "Description")
-            c.drawString(left_margin + 500, y_position, "Quantity")
-            y_position -= 5
-            
-            # 畫線分隔
-            c.line(left_margin, y_position, width - 80, y_position)
-            y_position -= 20
-            
-            # 物品詳細
-            for item in data['items']:
-                if y_position < 150:  # 如果空間不夠，換頁
-                    c.showPage()
-                    y_position = height - 80
-                
-                c.setFont("Helvetica", 10)
-                c.drawString(left_margin, y_position, item['article_no'])
-                
-                # 處理長描述，可能需要換行
-                description = item['description']
-                if len(description) > 40:
-                    description = description[:40] + "..."
-                c.drawString(left_margin + 120, y_position, description)
-                
-                c.drawString(left_margin + 500, y_position, item['quantity'])
-                y_position -= 20
-        
-        # 裝飾邊框
-        c.rect(40, 40, width - 80, height - 80, stroke=1, fill=0)
-        
-        # 簽名區域
-        separator_y = 180
-        c.line(60, separator_y, width - 60, separator_y)
-        
-        signature_y = separator_y - 60
-        left_col_x = 80
-        right_col_x = width / 2 + 50
-        
-        # 簽名區域使用普通字體
-        c.setFont(self.chinese_font, 14)
-        
-        # 左欄：寄件人簽名
-        c.drawString(left_col_x, signature_y, "寄件人簽名 Sender Signature:")
-        c.line(left_col_x + 220, signature_y - 5, right_col_x - 30, signature_y - 5)
-        c.drawString(left_col_x, signature_y - 40, "日期 Date:")
-        c.line(left_col_x + 80, signature_y - 45, left_col_x + 200, signature_y - 45)
-        
-        # 右欄：收件人簽名
-        c.drawString(right_col_x, signature_y, "收件人簽名 Receiver Signature:")
-        c.line(right_col_x + 220, signature_y - 5, width - 80, signature_y - 5)
-        c.drawString(right_col_x, signature_y - 40, "日期 Date:")
-        c.line(right_col_x + 80, signature_y - 45, right_col_x + 200, signature_y - 45)
-        
-        c.save()
+        """創建PDF文件：先寫暫存檔再改名，檔名已存在時加上序號，回傳實際檔名"""
+        from output_writer import atomic_write, unique_path
+        
+        data = self.attach_totals(data)
+        pdf_bytes = self.render_pdf_bytes(data)
+        filename = unique_path(filename)
+        atomic_write(filename, pdf_bytes)
+        self.record_history(data, filename)
+        return filename
     
     def get_items_data(self):
         """獲取物品清單數據"""
         items = []
+        if not self.items_tab_built:
+            return items
         for item in self.items_tree.get_children():
             values = self.items_tree.item(item)['values']
             items.append({
@@ -591,26 +649,61 @@ class PDFGeneratorApp:
             })
         return items
     
-    def generate_pdf(self):
-        if not self.validate_inputs():
-            return
-        
-        items_data = self.get_items_data()
-        
-        data = {
+    def get_form_data(self):
+        """取得表單上的調貨資料"""
+        return {
             'date': self.date_var.get(),
             'sender_store': self.sender_store_var.get(),
             'sender_name': self.sender_name_var.get(),
             'receiver_store': self.receiver_store_var.get(),
             'receiver_name': self.receiver_name_var.get(),
-            'items': items_data
+            'items': self.get_items_data()
         }
-        
+    
+    def get_output_path(self, data):
+        """調貨單的輸出路徑"""
         filename = f"調貨單_{data['date'].replace('/', '_')}_{data['sender_store']}_to_{data['receiver_store']}.pdf"
-        filepath = os.path.join(self.save_path_var.get(), filename)
+        return os.path.join(self.save_path_var.get(), filename)
+    
+    def catalog_for_store(self, store):
+        """驗證用的商品資料（無法載入時回傳 None，略過商品編號檢查）"""
+        if self.catalogs is None:
+            return None
+        try:
+            return self.catalogs.for_store(store)
+        except Exception as e:
+            print(f"載入IMS數據時發生錯誤: {e}")
+            return None
+    
+    def check_transfers(self, transfers, output_paths):
+        """產生前整批驗證所有調貨單與物品，有錯誤或使用者取消時回傳 False"""
+        from transfer_validation import validate_transfers
+        
+        report = validate_transfers(
+            transfers, catalog_for_store=self.catalog_for_store, output_paths=output_paths,
+            required_fields=('sender_store', 'sender_name', 'receiver_store', 'receiver_name'),
+            require_items=False)
+        labels = [f"第 {i} 張（{data['sender_store']} → {data['receiver_store']}）"
+                  for i, data in enumerate(transfers, 1)]
+        if not report.ok:
+            messagebox.showerror("驗證失敗", report.summary(labels) + "\n\n請修正後再產生，尚未產生任何文件。")
+            return False
+        if report.warnings:
+            return messagebox.askyesno("警告", report.summary(labels) + "\n\n是否仍要繼續？")
+        return True
+    
+    def generate_pdf(self):
+        if not self.validate_inputs():
+            return
+        
+        data = self.get_form_data()
+        filepath = self.get_output_path(data)
+        if not self.check_transfers([data], [filepath]):
+            return
         
         try:
-            self.create_pdf_document(data, filepath)
+            filepath = self.create_pdf_document(data, filepath)
+            filename = os.path.basename(filepath)
             
             result = messagebox.askyesnocancel("成功",
                                                f"PDF文件已生成: {filename}\n\n是否要開啟文件？\n(取消=不開啟，是=開啟，否=開啟資料夾)")
@@ -623,19 +716,45 @@ class PDFGeneratorApp:
         except Exception as e:
             messagebox.showerror("錯誤", f"生成PDF時發生錯誤: {str(e)}")
     
+    def print_pdf(self):
+        """生成PDF並直接送到印表機"""
+        if not self.validate_inputs():
+            return
+        
+        data = self.get_form_data()
+        filepath = self.get_output_path(data)
+        if not self.check_transfers([data], [filepath]):
+            return
+        
+        try:
+            filepath = self.create_pdf_document(data, filepath)
+            job_id = self.submit_print_job([filepath], os.path.basename(filepath))
+            messagebox.showinfo("成功", f"已送出列印工作: {job_id}")
+        except Exception as e:
+            messagebox.showerror("錯誤", f"列印時發生錯誤: {str(e)}")
+    
+    def submit_print_job(self, filepaths, title=None):
+        """將PDF送到印表機佇列，多個文件合併為單一列印工作"""
+        spooler = print_spool.get_spooler()
+        printer = self.printer_var.get().strip() or None
+        return spooler.submit(filepaths, printer=printer, title=title)
+    
     def add_to_batch(self):
         if not self.validate_inputs():
             return
         
+        data = self.get_form_data()
         values = (
-            self.date_var.get(),
-            self.sender_store_var.get(),
-            self.sender_name_var.get(),
-            self.receiver_store_var.get(),
-            self.receiver_name_var.get()
+            data['date'],
+            data['sender_store'],
+            data['sender_name'],
+            data['receiver_store'],
+            data['receiver_name'],
+            len(data['items'])
         )
         
-        self.batch_tree.insert('', tk.END, values=values)
+        iid = self.batch_tree.insert('', tk.END, values=values)
+        self.batch_data[iid] = data
         self.clear_form()
         messagebox.showinfo("成功", "已添加到批量列表")
     
@@ -647,10 +766,48 @@ class PDFGeneratorApp:
         
         for item in selected:
             self.batch_tree.delete(item)
+            self.batch_data.pop(item, None)
     
     def clear_batch(self):
         for item in self.batch_tree.get_children():
             self.batch_tree.delete(item)
+        self.batch_data.clear()
+    
+    def get_batch_transfers(self):
+        """批量列表中的調貨資料（依列表順序）"""
+        return [self.batch_data[item] for item in self.batch_tree.get_children()]
+    
+    def get_batch_jobs(self):
+        """批量列表中的調貨資料與對應的輸出路徑；勾選合併時同日同店別的調貨單合併為一份"""
+        batch = self.get_batch_transfers()
+        if self.batch_consolidate_var.get():
+            from consolidate import plan_consolidation
+            batch = plan_consolidation(batch).merged
+        
+        transfers = []
+        filepaths = []
+        for i, data in enumerate(batch, 1):
+            filename = f"調貨單_{i}_{data['date'].replace('/', '_')}_{data['sender_store']}_to_{data['receiver_store']}.pdf"
+            transfers.append(data)
+            filepaths.append(os.path.join(self.save_path_var.get(), filename))
+        return transfers, filepaths
+    
+    def render_batch_files(self, transfers, filepaths, archive_path=None):
+        """產生批量列表中的所有PDF，回傳實際寫入的檔案路徑清單
+        
+        產生PDF在目前執行緒進行，寫檔交給 OutputWriter 的 I/O 執行緒，兩者同時進行；
+        指定 archive_path 時整批直接寫進單一 ZIP，回傳 [ZIP 路徑]。
+        """
+        from output_writer import OutputWriter, ZipOutputWriter
+        
+        writer = ZipOutputWriter(archive_path) if archive_path else OutputWriter()
+        with writer:
+            for data, filepath in zip(transfers, filepaths):
+                data = self.attach_totals(data)
+                written = writer.submit(filepath, self.render_pdf_bytes(data))
+                # ZIP 內的文件以原本的輸出路徑記錄，重新產生時寫成個別檔案
+                self.record_history(data, filepath if archive_path else written)
+        return [writer.zip_path] if archive_path else writer.paths
     
     def generate_batch_pdf(self):
         items = self.batch_tree.get_children()
@@ -658,27 +815,24 @@ class PDFGeneratorApp:
             messagebox.showwarning("警告", "批量列表為空")
             return
         
-        generated_files = []
+        # 整批先驗證，避免產生到一半才發現錯誤
+        transfers, filepaths = self.get_batch_jobs()
+        if not self.check_transfers(transfers, filepaths):
+            return
+        
+        archive_path = None
+        if self.batch_zip_var.get():
+            archive_path = os.path.join(self.save_path_var.get(),
+                                        f"調貨單_批量_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip")
         
         try:
-            for i, item in enumerate(items, 1):
-                values = self.batch_tree.item(item)['values']
-                data = {
-                    'date': values[0],
-                    'sender_store': values[1],
-                    'sender_name': values[2],
-                    'receiver_store': values[3],
-                    'receiver_name': values[4],
-                    'items': []  # 批量生成時暫不包含物品清單
-                }
-                
-                filename = f"調貨單_{i}_{data['date'].replace('/', '_')}_{data['sender_store']}_to_{data['receiver_store']}.pdf"
-                filepath = os.path.join(self.save_path_var.get(), filename)
-                
-                self.create_pdf_document(data, filepath)
-                generated_files.append(filename)
+            generated_files = self.render_batch_files(transfers, filepaths, archive_path)
             
-            messagebox.showinfo("成功", f"批量生成完成！\n共生成了 {len(generated_files)} 個文件")
+            if archive_path:
+                messagebox.showinfo("成功", f"批量生成完成！\n共 {len(transfers)} 個文件已打包為 "
+                                          f"{os.path.basename(generated_files[0])}")
+            else:
+                messagebox.showinfo("成功", f"批量生成完成！\n共生成了 {len(generated_files)} 個文件")
             
             # 詢問是否開啟資料夾
             if messagebox.askyesno("完成", "是否要開啟保存資料夾？"):
@@ -687,6 +841,82 @@ class PDFGeneratorApp:
         except Exception as e:
             messagebox.showerror("錯誤", f"批量生成時發生錯誤: {str(e)}")
     
+    def preview_consolidation(self):
+        """試算合併同日同店別後節省的文件數與頁數（不產生任何文件）"""
+        transfers = self.get_batch_transfers()
+        if not transfers:
+            messagebox.showwarning("警告", "批量列表為空")
+            return
+        
+        try:
+            from consolidate import plan_consolidation
+            
+            self.ensure_pdf_ready()
+            plan = plan_consolidation(transfers)
+            plan.count_pages('document', self.chinese_font, self.profile_var.get())
+            messagebox.showinfo("合併試算", plan.summary() + "\n\n勾選「合併同日同店別」後批量生成即套用。")
+        except Exception as e:
+            messagebox.showerror("錯誤", f"合併試算時發生錯誤: {str(e)}")
+    
+    def queue_batch(self):
+        """將批量列表加入背景產生佇列，由獨立的 worker 行程產生（程式關閉或中斷後可繼續）"""
+        items = self.batch_tree.get_children()
+        if not items:
+            messagebox.showwarning("警告", "批量列表為空")
+            return
+        
+        transfers, filepaths = self.get_batch_jobs()
+        if not self.check_transfers(transfers, filepaths):
+            return
+        
+        try:
+            import job_queue
+            
+            self.ensure_pdf_ready()
+            batch = f"批量_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            profile = self.profile_var.get()
+            jobs = [(self.attach_totals(data), filepath, 'document', profile)
+                    for data, filepath in zip(transfers, filepaths)]
+            queue = job_queue.JobQueue()
+            try:
+                queue.enqueue_many(jobs, batch=batch, unique_paths=True)
+            finally:
+                queue.close()
+            self.start_queue_worker()
+            self.clear_batch()
+            messagebox.showinfo("成功", f"已加入背景佇列（批次 {batch}）\n共 {len(jobs)} 個文件\n\n"
+                                      f"可執行 python job_queue.py status 查看進度")
+        except Exception as e:
+            messagebox.showerror("錯誤", f"加入背景佇列時發生錯誤: {str(e)}")
+    
+    def start_queue_worker(self):
+        """沒有執行中的 worker 時啟動一個（佇列清空後自動結束）"""
+        if self.queue_worker is not None and self.queue_worker.poll() is None:
+            return
+        cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "job_queue.py"),
+               "work", "--exit-when-empty"]
+        if self.font_path:
+            cmd += ["--font", self.font_path]
+        self.queue_worker = subprocess.Popen(cmd)
+    
+    def print_batch(self):
+        """批量生成並直接列印（整批合併為單一列印工作）"""
+        items = self.batch_tree.get_children()
+        if not items:
+            messagebox.showwarning("警告", "批量列表為空")
+            return
+        
+        transfers, filepaths = self.get_batch_jobs()
+        if not self.check_transfers(transfers, filepaths):
+            return
+        
+        try:
+            filepaths = self.render_batch_files(transfers, filepaths)
+            job_id = self.submit_print_job(filepaths, f"調貨單 x {len(filepaths)}")
+            messagebox.showinfo("成功", f"已送出列印工作: {job_id}\n共 {len(filepaths)} 個文件")
+        except Exception as e:
+            messagebox.showerror("錯誤", f"批量列印時發生錯誤: {str(e)}")
+    
     def open_pdf(self, filepath):
         """跨平台開啟PDF文件"""
         try:
@@ -715,8 +945,14 @@ class PDFGeneratorApp:
 
 
 def main():
-    # 設置環境變數來消除警告
-    import os
+    global DEBUG_STARTUP
+    
+    # --debug-startup: 以 -X importtime 重新啟動，並輸出各階段耗時與可操作時間
+    if "--debug-startup" in sys.argv:
+        if "importtime" not in sys._xoptions:
+            os.execv(sys.executable, [sys.executable, "-X", "importtime"] + sys.argv)
+        DEBUG_STARTUP = True
+    log_startup("模組載入完成")
     
     # 消除 macOS 的 Tk 廢棄警告
     if platform.system() == "Darwin":
@@ -738,8 +974,6 @@ def main():
             root.focus_force()
         
         # 確保視窗在螢幕中央（跨平台）
-        root.update_idletasks()
-        
         # 獲取螢幕尺寸
         screen_width = root.winfo_screenwidth()
         screen_height = root.winfo_screenheight()
@@ -758,11 +992,11 @@ def main():
         
         # 創建應用程式實例
         app = PDFGeneratorApp(root)
-        
-        # 強制重新繪製
-        root.update()
         root.deiconify()  # 確保視窗顯示
         
+        # 主循環第一次閒置時（視窗已繪製、可操作）記錄可操作時間
+        root.after_idle(log_startup, "視窗可操作 (time-to-interactive)")
+        
         print("=" * 50)
         print("PDF文件生成器已啟動")
         print(f"運行平台: {platform.system()}")
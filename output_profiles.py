@@ -0,0 +1,22 @@
+# PDF 輸出設定（不依賴 ReportLab，UI 可在載入 ReportLab 前使用）
+import os
+
+# 輸出設定：在產生速度與檔案大小之間取捨
+#   compression  內容串流是否壓縮（不壓縮最快，適合本機直接列印）
+#   fonts        embedded = 嵌入字體子集；cid = 使用不嵌入的 CJK CID 字體
+#                （檔案最小，閱讀器需有亞洲字型支援）
+#   pdf_version  PDF 版本
+#   linearize    是否線性化（Fast Web View，見 pdf_linearize），平板下載到一部分就能顯示第一頁
+OUTPUT_PROFILES = {
+    'fast': {'compression': False, 'fonts': 'embedded', 'pdf_version': (1, 4), 'linearize': False},
+    'default': {'compression': True, 'fonts': 'embedded', 'pdf_version': (1, 4), 'linearize': False},
+    'small': {'compression': True, 'fonts': 'cid', 'pdf_version': (1, 5), 'linearize': False},
+    'web': {'compression': True, 'fonts': 'embedded', 'pdf_version': (1, 4), 'linearize': True},
+}
+DEFAULT_PROFILE = 'default'
+
+
+def default_profile():
+    """預設輸出設定（環境變數 IMS_PRINT_PROFILE）"""
+    profile = os.environ.get("IMS_PRINT_PROFILE", DEFAULT_PROFILE)
+    return profile if profile in OUTPUT_PROFILES else DEFAULT_PROFILE
@@ -0,0 +1,159 @@
+# PDF 輸出：暫存檔 + 原子性改名、不覆蓋的檔名，以及專用 I/O 執行緒（可直接串流成單一 ZIP）
+import itertools
+import os
+import queue
+import threading
+import time
+import zipfile
+
+_tmp_counter = itertools.count(1)
+
+
+def atomic_write(path, data):
+    """先寫到同目錄的暫存檔再改名，程式中途結束也不會留下寫到一半的檔案"""
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.{next(_tmp_counter)}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def unique_path(path, reserved=()):
+    """檔案已存在（或已被同批次預留）時加上序號：調貨單.pdf -> 調貨單 (2).pdf"""
+    base, ext = os.path.splitext(path)
+    candidate = path
+    for n in itertools.count(2):
+        if not os.path.exists(candidate) and os.path.normcase(candidate) not in reserved:
+            return candidate
+        candidate = f"{base} ({n}){ext}"
+
+
+class OutputWriter:
+    """專用 I/O 執行緒：呼叫端產生 PDF 內容後交由此執行緒寫檔，產生與寫檔同時進行
+
+    submit() 立即決定不重複的最終檔名並回傳；佇列最多 max_pending 份，
+    寫檔跟不上時 submit() 會等待，避免整批內容堆在記憶體中。
+    寫檔錯誤在 close() 時拋出。
+    """
+
+    def __init__(self, max_pending=8):
+        self.paths = []
+        self.errors = []
+        self._reserved = set()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="output-writer", daemon=True)
+        self._thread.start()
+
+    def reserve(self, path):
+        """決定最終檔名（不覆蓋既有檔案，也不與同批次的其他檔案重複）"""
+        path = unique_path(path, self._reserved)
+        self._reserved.add(os.path.normcase(path))
+        return path
+
+    def submit(self, path, data):
+        """排入一份文件，回傳實際寫入的路徑"""
+        path = self.reserve(path)
+        self.paths.append(path)
+        self._queue.put((path, data))
+        return path
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            path, data = job
+            try:
+                self._write(path, data)
+            except Exception as e:
+                self.errors.append((path, e))
+
+    def _write(self, path, data):
+        atomic_write(path, data)
+
+    def _finish(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _raise_errors(self):
+        if self.errors:
+            path, error = self.errors[0]
+            raise OSError(f"寫入 {os.path.basename(path)} 失敗（共 {len(self.errors)} 個錯誤）: {error}")
+
+    def close(self, discard=False):
+        """等待所有文件寫完；有寫檔錯誤時拋出第一個錯誤
+
+        discard=True 用於產生過程已出錯時：已寫完的個別檔案都是完整的，予以保留。
+        """
+        self._finish()
+        if not discard:
+            self._raise_errors()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 產生過程出錯時仍等待 I/O 執行緒結束，但保留原本的例外
+        self.close(discard=exc_type is not None)
+        return False
+
+
+class ZipOutputWriter(OutputWriter):
+    """將整批文件直接串流寫進單一 ZIP，不先產生個別檔案
+
+    ZIP 先寫到暫存檔，全部成功後才改名為最終檔名；submit() 的路徑只取檔名作為 ZIP 內的名稱。
+    """
+
+    def __init__(self, zip_path, max_pending=8, compression=zipfile.ZIP_DEFLATED):
+        self.zip_path = unique_path(zip_path)
+        self._tmp_path = os.path.join(os.path.dirname(os.path.abspath(self.zip_path)),
+                                      f".{os.path.basename(self.zip_path)}.{os.getpid()}.tmp")
+        self._zip = zipfile.ZipFile(self._tmp_path, "w", compression=compression)
+        super().__init__(max_pending)
+
+    def reserve(self, path):
+        name = os.path.basename(path)
+        base, ext = os.path.splitext(name)
+        candidate = name
+        for n in itertools.count(2):
+            if candidate not in self._reserved:
+                break
+            candidate = f"{base} ({n}){ext}"
+        self._reserved.add(candidate)
+        return candidate
+
+    def _write(self, name, data):
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = self._zip.compression
+        self._zip.writestr(info, data)
+
+    def close(self, discard=False):
+        """寫完所有文件並關閉 ZIP；有錯誤（或 discard）時刪除暫存檔，不留下不完整的 ZIP"""
+        self._finish()
+        if self._zip is None:
+            return
+        try:
+            self._zip.close()
+        except Exception as e:
+            self.errors.append((self.zip_path, e))
+        self._zip = None
+
+        if discard or self.errors:
+            try:
+                os.remove(self._tmp_path)
+            except OSError:
+                pass
+            if not discard:
+                self._raise_errors()
+            return
+        os.replace(self._tmp_path, self.zip_path)
@@ -1,16 +1,29 @@
 # ✅ 整合 ims_list.json 的商品明細查詢 + PDF 生成（包含批次與單筆明細）
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
+from tkinter import font as tkfont
 from reportlab.lib.pagesizes import landscape, A4
-from reportlab.pdfgen import canvas
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from datetime import datetime
 import os
-import json
 import platform
 import subprocess
-
+import threading
+
+import catalog
+import font_coverage
+import output_profiles
+import output_writer
+import pdf_render
+import print_spool
+import text_measure
+import transfer_history
+import transfer_totals
+import transfer_validation
+from render_cache import RenderCache, render_cache_enabled
+from usage_stats import UsageStats, HotItemCache
+from scanner import ScanQueue, ScanStats
 
 class PDFGeneratorApp:
     def __init__(self, root):
@@ -23,6 +36,15 @@ class PDFGeneratorApp:
         # 初始化變數
         self.items = []
         self.font_loaded = False
+        self.preview_window = None
+        self.history_window = None
+
+        # 掃描模式：佇列、統計與商品編號 -> 清單項目索引
+        self.scan_queue = ScanQueue()
+        self.scan_stats = ScanStats()
+        self.scan_index = None
+        self.scan_job = None
+        self.scan_label_job = None
 
         # 設置UI變數
         self.setup_variables()
@@ -33,6 +55,19 @@ class PDFGeneratorApp:
         # 載入IMS數據
         self.load_ims_data()
 
+        # 載入商品使用統計
+        self.load_usage_stats()
+
+        # PDF 快取（deterministic 模式）
+        self.render_cache = RenderCache() if render_cache_enabled() else None
+
+        # 調貨紀錄
+        try:
+            self.history = transfer_history.TransferHistory()
+        except Exception as e:
+            print(f"開啟調貨紀錄失敗: {e}")
+            self.history = None
+
         # 設置UI
         self.setup_ui()
 
@@ -51,6 +86,10 @@ class PDFGeneratorApp:
         self.item_desc_var = tk.StringVar()
         self.item_qty_var = tk.StringVar()
         self.notes_var = tk.StringVar()
+        self.printer_var = tk.StringVar(value=print_spool.default_printer())
+        self.profile_var = tk.StringVar(value=output_profiles.default_profile())
+        self.picker_mode_var = tk.StringVar(value="recent")
+        self.scanner_mode_var = tk.BooleanVar(value=False)
 
     def setup_fonts(self):
         """設置中文字體 - 跨平台支援"""
@@ -95,31 +134,34 @@ class PDFGeneratorApp:
                 print("未找到合適的中文字體，使用預設字體")
                 self.font_name = 'Helvetica'
 
+            # 主要字體缺字（例如西文字體遇到中文）時改用系統中其他有該字元的字體
+            fallbacks = font_coverage.install_fallbacks(
+                [self.font_name], font_path if self.font_loaded else None)
+            if fallbacks:
+                print(f"備用字體: {', '.join(fallbacks)}")
+
         except Exception as e:
             print(f"字體設置錯誤: {e}")
             self.font_name = 'Helvetica'
 
     def load_ims_data(self):
-        """載入IMS數據"""
-        self.ims_lookup = {}
+        """載入IMS數據（各商品資料於第一次查詢時才載入）"""
+        self.catalogs = None
         try:
-            # 嘗試不同路徑
-            json_paths = [
-                "ims_list.json",
-                os.path.join(os.path.dirname(__file__), "ims_list.json"),
-                os.path.join(os.getcwd(), "ims_list.json")
-            ]
-
-            for json_path in json_paths:
-                if os.path.exists(json_path):
-                    with open(json_path, "r", encoding="utf-8") as f:
-                        ims_data = json.load(f)
-                        self.ims_lookup = {
-                            item["Item No"].strip(): item["Item Description"].strip()
-                            for item in ims_data if "Item No" in item and "Item Description" in item
-                        }
-                    print(f"成功載入 {len(self.ims_lookup)} 筆商品資料")
-                    return
+            # 嘗試不同路徑（catalogs.json 優先，其次 ims_list.db、ims_list.json）
+            self.catalogs = catalog.load_catalog_registry([
+                ".",
+                os.path.dirname(os.path.abspath(__file__)),
+                os.getcwd(),
+            ])
+
+            if self.catalogs:
+                print(f"可用的商品資料: {', '.join(self.catalogs.names())}")
+                # 在背景執行緒預先載入預設商品資料的屬性，第一次產生PDF時不需等待讀取
+                threading.Thread(target=self.preload_attributes, daemon=True).start()
+                if text_measure.prewrap_enabled():
+                    threading.Thread(target=self.precompute_wraps, daemon=True).start()
+                return
 
             print("警告: 未找到 ims_list.json 檔案")
             messagebox.showwarning(
@@ -129,6 +171,60 @@ class PDFGeneratorApp:
             print(f"載入商品資料錯誤: {e}")
             messagebox.showerror("錯誤", f"載入商品資料失敗: {e}")
 
+    def preload_attributes(self):
+        """背景載入預設商品資料的屬性（計算合計時若尚未載入完成會等待載入）"""
+        try:
+            self.catalogs.attributes_for_store(None)
+        except Exception as e:
+            # 背景執行緒不可操作 Tk，錯誤留待產生PDF時再提示
+            print(f"載入商品屬性錯誤: {e}")
+
+    def precompute_wraps(self):
+        """背景預先計算預設商品資料的描述換行（IMS_PRINT_PREWRAP=1 時）"""
+        try:
+            count = pdf_render.precompute_wraps(self.catalogs.get().values(), 'sheet',
+                                                self.font_name, self.profile_var.get())
+            print(f"已預先計算 {count} 筆商品描述的換行")
+        except Exception as e:
+            print(f"預先計算描述換行失敗: {e}")
+
+    def load_usage_stats(self):
+        """載入商品使用統計與常用商品快取"""
+        self.hot_items = HotItemCache()
+        self.usage_stats = UsageStats()
+        try:
+            self.usage_stats.load()
+        except Exception as e:
+            print(f"載入使用統計錯誤: {e}")
+
+    def save_usage_stats(self):
+        """儲存商品使用統計"""
+        try:
+            self.usage_stats.save()
+        except Exception as e:
+            print(f"儲存使用統計錯誤: {e}")
+
+    def get_ims_lookup(self):
+        """依寄出店別取得對應的商品資料"""
+        if self.catalogs is None:
+            return {}
+        try:
+            return self.catalogs.for_store(self.sender_store_var.get())
+        except Exception as e:
+            print(f"載入商品資料錯誤: {e}")
+            messagebox.showerror("錯誤", f"載入商品資料失敗: {e}")
+            return {}
+
+    def attach_totals(self, data):
+        """加上調貨單合計（總數量、總重量、材積與箱數）；商品屬性無法載入時只計算總數量"""
+        attributes = None
+        if self.catalogs is not None:
+            try:
+                attributes = self.catalogs.attributes_for_store(data['sender_store'])
+            except Exception as e:
+                print(f"載入商品屬性錯誤: {e}")
+        return transfer_totals.with_totals(data, attributes)
+
     def setup_ui(self):
         """設置使用者介面"""
         # 清除舊內容
@@ -186,6 +282,7 @@ class PDFGeneratorApp:
             ("收件店別 (To Store)", self.receiver_store_var),
             ("收件人 (Receiver)", self.receiver_name_var),
             ("備註 (Notes)", self.notes_var),
+            ("印表機 (Printer)", self.printer_var),
         ]
 
         for i, (label, var) in enumerate(info_fields):
@@ -210,6 +307,13 @@ class PDFGeneratorApp:
         ttk.Button(path_frame, text="選擇", command=self.choose_path,
                    width=8).pack(side=tk.RIGHT, padx=(5, 0))
 
+        # 輸出設定（fast = 產生最快，small = 檔案最小）
+        ttk.Label(parent, text="輸出設定 (Profile)").grid(
+            row=len(info_fields) + 1, column=0, sticky="w", pady=2)
+        ttk.Combobox(parent, textvariable=self.profile_var, state="readonly",
+                     values=list(output_profiles.OUTPUT_PROFILES), width=10).grid(
+            row=len(info_fields) + 1, column=1, sticky="w", pady=2, padx=(5, 0))
+
     def create_item_section(self, parent):
         """創建商品區域"""
         # 商品輸入區域
@@ -243,8 +347,35 @@ class PDFGeneratorApp:
         ttk.Button(item_input_frame, text="加入", command=self.add_item,
                    width=8).grid(row=2, column=2, padx=(5, 0), pady=(5, 0))
 
+        # 掃描模式：每次掃描直接加入商品或數量加一，不跳出對話框
+        ttk.Checkbutton(item_input_frame, text="掃描模式 (Scanner)",
+                        variable=self.scanner_mode_var,
+                        command=self.toggle_scanner_mode).grid(
+            row=3, column=0, sticky="w", pady=(5, 0))
+        self.scan_label = ttk.Label(item_input_frame, text="")
+        self.scan_label.grid(row=3, column=1, columnspan=2,
+                             sticky="w", pady=(5, 0), padx=(5, 0))
+
         item_input_frame.columnconfigure(1, weight=1)
 
+        # 常用商品（依寄出店別的最近 / 最常使用商品，點選即帶入）
+        picker_frame = ttk.LabelFrame(parent, text="常用商品", padding=10)
+        picker_frame.pack(fill=tk.X, pady=(0, 5))
+
+        ttk.Radiobutton(picker_frame, text="最近使用", value="recent",
+                        variable=self.picker_mode_var,
+                        command=self.refresh_item_picker).grid(row=0, column=0, sticky="w")
+        ttk.Radiobutton(picker_frame, text="最常使用", value="frequent",
+                        variable=self.picker_mode_var,
+                        command=self.refresh_item_picker).grid(row=0, column=1, sticky="w", padx=(10, 0))
+
+        self.picker_list = tk.Listbox(picker_frame, height=5, activestyle="none",
+                                      exportselection=False)
+        self.picker_list.grid(row=1, column=0, columnspan=3, sticky="ew", pady=(5, 0))
+        picker_frame.columnconfigure(2, weight=1)
+        self.picker_codes = []
+        self.refresh_item_picker()
+
         # 商品列表區域
         list_frame = ttk.LabelFrame(parent, text="商品清單", padding=10)
         list_frame.pack(fill=tk.BOTH, expand=True)
@@ -286,6 +417,10 @@ class PDFGeneratorApp:
 
         ttk.Button(btn_frame, text="清除表單", command=self.clear_form).pack(
             side=tk.LEFT, padx=(0, 5))
+        ttk.Button(btn_frame, text="歷史紀錄", command=self.show_history).pack(
+            side=tk.LEFT, padx=(0, 5))
+        ttk.Button(btn_frame, text="列印", command=self.print_pdf).pack(
+            side=tk.RIGHT, padx=(5, 0))
         ttk.Button(btn_frame, text="產生 PDF", command=self.generate_pdf).pack(
             side=tk.RIGHT, padx=(5, 0))
         ttk.Button(btn_frame, text="預覽資料", command=self.preview_data).pack(
@@ -299,9 +434,16 @@ class PDFGeneratorApp:
 
     def bind_events(self):
         """綁定事件"""
-        self.code_entry.bind("<Return>", lambda e: self.lookup_item())
-        self.code_entry.bind("<FocusOut>", lambda e: self.lookup_item())
+        self.code_entry.bind("<Return>", self.on_code_return)
+        self.code_entry.bind("<FocusOut>", self.on_code_focus_out)
         self.qty_entry.bind("<Return>", lambda e: self.add_item())
+        self.picker_list.bind("<<ListboxSelect>>", self.pick_item)
+
+        # 寄出店別變更時更新常用商品
+        self.sender_store_var.trace_add("write", lambda *args: self.refresh_item_picker())
+
+        # 關閉視窗時儲存使用統計
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # 雙擊編輯
         self.tree.bind("<Double-1>", self.edit_item)
@@ -314,6 +456,95 @@ class PDFGeneratorApp:
             self.path_label.config(text=path)
             self.status_bar.config(text=f"儲存路徑已設定: {path}")
 
+    def on_code_return(self, event=None):
+        """商品編號欄位按下 Enter（掃描器每次掃描結尾也會送出 Enter）"""
+        if not self.scanner_mode_var.get():
+            self.lookup_item()
+            return
+
+        # 只做入列並清空欄位，查詢與加入留給批次處理，避免快速掃描時漏字
+        self.scan_queue.push(self.item_code_var.get())
+        self.item_code_var.set("")
+        if self.scan_job is None:
+            self.scan_job = self.root.after(20, self.process_scan_queue)
+        return "break"
+
+    def on_code_focus_out(self, event=None):
+        if not self.scanner_mode_var.get():
+            self.lookup_item()
+
+    def toggle_scanner_mode(self):
+        """切換掃描模式"""
+        if self.scanner_mode_var.get():
+            self.scan_stats.reset()
+            self.scan_index = None
+            self.clear_item_inputs()
+            self.code_entry.focus_set()
+            self.update_scan_label()
+            self.status_bar.config(text="掃描模式已開啟")
+        else:
+            self.scan_label.config(text="")
+            self.status_bar.config(text="掃描模式已關閉")
+
+    def get_scan_index(self):
+        """商品編號 -> 清單項目的索引（清單被其他操作修改後重建）"""
+        if self.scan_index is None:
+            self.scan_index = {
+                str(self.tree.item(item)['values'][0]): item
+                for item in self.tree.get_children()
+            }
+        return self.scan_index
+
+    def process_scan_queue(self):
+        """批次處理掃描佇列：已存在的商品數量加一，新商品直接加入"""
+        self.scan_job = None
+        codes = self.scan_queue.drain()
+        if not codes:
+            return
+
+        index = self.get_scan_index()
+        added = 0
+        for code in codes:
+            description = self.lookup_description(code)
+            self.scan_stats.record(description is not None, code)
+            if description is None:
+                continue
+
+            item = index.get(code)
+            if item is not None and self.tree.exists(item):
+                values = self.tree.item(item)['values']
+                try:
+                    qty = int(values[2]) + 1
+                except (TypeError, ValueError):
+                    qty = 1
+                self.tree.item(item, values=(code, values[1], qty))
+            else:
+                index[code] = self.tree.insert("", "end", values=(code, description, 1))
+            self.usage_stats.record(self.sender_store_var.get(), code, description)
+            added += 1
+
+        if added:
+            self.refresh_item_picker()
+        self.update_scan_label()
+        self.status_bar.config(text=f"已處理掃描 {len(codes)} 筆")
+
+    def update_scan_label(self):
+        """更新掃描速率與未知商品顯示，掃描模式期間每秒更新"""
+        if not self.scanner_mode_var.get():
+            return
+
+        text = (f"已掃描 {self.scan_stats.total} 筆 | "
+                f"{self.scan_stats.rate():.1f} 筆/秒 | "
+                f"未知 {self.scan_stats.unknown_total} 筆")
+        unknown = self.scan_stats.recent_unknown()
+        if unknown:
+            text += ": " + ", ".join(unknown[:5])
+        self.scan_label.config(text=text)
+
+        if self.scan_label_job is not None:
+            self.root.after_cancel(self.scan_label_job)
+        self.scan_label_job = self.root.after(1000, self.update_scan_label)
+
     def lookup_item(self):
         """查詢商品資訊"""
         code = self.item_code_var.get().strip()
@@ -321,14 +552,52 @@ class PDFGeneratorApp:
             self.item_desc_var.set("")
             return
 
-        if code in self.ims_lookup:
-            description = self.ims_lookup[code]
+        description = self.lookup_description(code)
+        if description is not None:
             self.item_desc_var.set(description)
             self.status_bar.config(text=f"找到商品: {code}")
         else:
             self.item_desc_var.set("未找到商品資訊")
             self.status_bar.config(text=f"未找到商品: {code}")
 
+    def lookup_description(self, code):
+        """查詢商品描述（先查常用商品快取），查無時回傳 None"""
+        store = self.sender_store_var.get()
+        catalog_name = self.catalogs.resolve_name(store) if self.catalogs else None
+        key = (catalog_name, code)
+
+        description = self.hot_items.get(key)
+        if description is None:
+            description = self.get_ims_lookup().get(code)
+            if description is not None:
+                self.hot_items.put(key, description)
+        return description
+
+    def refresh_item_picker(self):
+        """更新常用商品清單"""
+        store = self.sender_store_var.get()
+        if self.picker_mode_var.get() == "frequent":
+            entries = self.usage_stats.frequent(store)
+        else:
+            entries = self.usage_stats.recent(store)
+
+        self.picker_codes = [code for code, _ in entries]
+        self.picker_list.delete(0, tk.END)
+        for code, desc in entries:
+            self.picker_list.insert(tk.END, f"{code}  {desc}")
+
+    def pick_item(self, event=None):
+        """從常用商品清單帶入商品"""
+        selection = self.picker_list.curselection()
+        if not selection:
+            return
+
+        self.item_code_var.set(self.picker_codes[selection[0]])
+        self.lookup_item()
+        self.picker_list.selection_clear(0, tk.END)
+        self.qty_entry.focus_set()
+        self.qty_entry.select_range(0, tk.END)
+
     def add_item(self):
         """加入商品到清單"""
         code = self.item_code_var.get().strip()
@@ -353,6 +622,7 @@ class PDFGeneratorApp:
             if self.tree.item(item)['values'][0] == code:
                 if messagebox.askyesno("確認", f"商品 {code} 已存在，是否要更新數量？"):
                     self.tree.item(item, values=(code, desc, qty))
+                    self.record_item_usage(code, desc)
                     self.clear_item_inputs()
                     self.status_bar.config(text=f"已更新商品: {code}")
                     return
@@ -361,9 +631,16 @@ class PDFGeneratorApp:
 
         # 加入新商品
         self.tree.insert("", "end", values=(code, desc, qty))
+        self.scan_index = None
+        self.record_item_usage(code, desc)
         self.clear_item_inputs()
         self.status_bar.config(text=f"已加入商品: {code}")
 
+    def record_item_usage(self, code, desc):
+        """記錄商品使用並更新常用商品清單"""
+        self.usage_stats.record(self.sender_store_var.get(), code, desc)
+        self.refresh_item_picker()
+
     def clear_item_inputs(self):
         """清空商品輸入欄位"""
         self.item_code_var.set("")
@@ -379,6 +656,7 @@ class PDFGeneratorApp:
 
         for item in selected:
             self.tree.delete(item)
+        self.scan_index = None
 
         self.status_bar.config(text="已移除選取的商品")
 
@@ -390,6 +668,7 @@ class PDFGeneratorApp:
         if messagebox.askyesno("確認", "確定要清空所有商品嗎？"):
             for item in self.tree.get_children():
                 self.tree.delete(item)
+            self.scan_index = None
             self.status_bar.config(text="已清空所有商品")
 
     def edit_item(self, event):
@@ -405,6 +684,7 @@ class PDFGeneratorApp:
 
         # 移除原項目
         self.tree.delete(item)
+        self.scan_index = None
 
     def clear_form(self):
         """清空表單"""
@@ -419,49 +699,98 @@ class PDFGeneratorApp:
             self.status_bar.config(text="表單已清空")
 
     def preview_data(self):
-        """預覽資料"""
+        """預覽調貨單：使用與 PDF 相同的版面計算，逐頁顯示在 Canvas 上"""
         if not self.validate_inputs():
             return
 
-        items = [(self.tree.item(item)['values'][0],
-                 self.tree.item(item)['values'][1],
-                 self.tree.item(item)['values'][2])
-                 for item in self.tree.get_children()]
-
-        preview_text = f"""
-調貨單預覽
-================
-日期: {self.date_var.get()}
-寄出店別: {self.sender_store_var.get()}
-寄件人: {self.sender_name_var.get()}
-收件店別: {self.receiver_store_var.get()}
-收件人: {self.receiver_name_var.get()}
-備註: {self.notes_var.get()}
-
-商品明細:
-{'編號':<15} {'描述':<50} {'數量':<10}
-{'-'*75}
-"""
-
-        for code, desc, qty in items:
-            preview_text += f"{code:<15} {desc[:50]:<50} {qty:<10}\n"
-
-        # 顯示預覽視窗
-        preview_window = tk.Toplevel(self.root)
-        preview_window.title("資料預覽")
-        preview_window.geometry("800x600")
-
-        text_widget = tk.Text(
-            preview_window, wrap=tk.WORD, font=('Courier', 10))
-        text_widget.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-
-        scrollbar_preview = ttk.Scrollbar(
-            preview_window, command=text_widget.yview)
-        text_widget.config(yscrollcommand=scrollbar_preview.set)
-        scrollbar_preview.pack(side=tk.RIGHT, fill=tk.Y)
-
-        text_widget.insert(tk.END, preview_text)
-        text_widget.config(state=tk.DISABLED)
+        data = self.attach_totals(self.get_transfer_data())
+        font_name, _ = pdf_render.profile_fonts(self.font_name, self.profile_var.get())
+        # 版面逐頁計算：開啟時只算第一頁，翻頁時才計算後續頁面
+        self.preview_pages = pdf_render.LazyPages(pdf_render.layout_transfer_sheet(
+            data, font_name, pdf_render.sheet_footer_text(data)))
+        self.preview_page = 0
+
+        # 顯示預覽視窗（重複使用同一個視窗，整天使用也不會累積視窗與元件）
+        if self.preview_window is None or not self.preview_window.winfo_exists():
+            self.preview_window = tk.Toplevel(self.root)
+            self.preview_window.title("資料預覽")
+            self.preview_window.geometry("900x700")
+
+            nav_frame = ttk.Frame(self.preview_window, padding=5)
+            nav_frame.pack(fill=tk.X)
+            ttk.Button(nav_frame, text="◀ 上一頁",
+                       command=lambda: self.show_preview_page(self.preview_page - 1)).pack(side=tk.LEFT)
+            ttk.Button(nav_frame, text="下一頁 ▶",
+                       command=lambda: self.show_preview_page(self.preview_page + 1)).pack(side=tk.LEFT, padx=5)
+            self.preview_page_label = ttk.Label(nav_frame)
+            self.preview_page_label.pack(side=tk.LEFT, padx=10)
+
+            self.preview_canvas = tk.Canvas(self.preview_window, background="gray70",
+                                            highlightthickness=0)
+            self.preview_canvas.pack(fill=tk.BOTH, expand=True)
+            # 視窗大小改變時依新尺寸重畫目前頁面
+            self.preview_canvas.bind("<Configure>", lambda e: self.show_preview_page(self.preview_page))
+            for key, step in (("<Prior>", -1), ("<Left>", -1), ("<Next>", 1), ("<Right>", 1)):
+                self.preview_window.bind(
+                    key, lambda e, step=step: self.show_preview_page(self.preview_page + step))
+
+        self.preview_window.deiconify()
+        self.preview_window.lift()
+        self.preview_window.focus_set()
+        self.show_preview_page(0)
+
+    def show_preview_page(self, index):
+        """在預覽 Canvas 上繪製第 index 頁（只繪製目前顯示的頁面）"""
+        if index < 0:
+            return
+        page = self.preview_pages.get(index)
+        if page is None:
+            return
+        self.preview_page = index
+
+        canvas = self.preview_canvas
+        canvas.delete("all")
+        self.preview_images = []  # Canvas 只保存 PhotoImage 的名稱，需自行保留參考
+        page_width, page_height = landscape(A4)
+        margin = 10
+        scale = max(min((canvas.winfo_width() - 2 * margin) / page_width,
+                        (canvas.winfo_height() - 2 * margin) / page_height), 0.2)
+        canvas.create_rectangle(margin, margin, margin + page_width * scale,
+                                margin + page_height * scale, fill="white", outline="gray40")
+
+        # PDF 座標原點在左下角，Canvas 在左上角
+        def point(x, y):
+            return margin + x * scale, margin + (page_height - y) * scale
+
+        family = tkfont.nametofont("TkDefaultFont").actual("family")
+        font = (family, -12)
+        for op in page:
+            if op[0] == 'font':
+                font = (family, -max(int(op[2] * scale), 1))
+            elif op[0] == 'text':
+                canvas.create_text(*point(op[1], op[2]), text=op[3], font=font, anchor="sw")
+            elif op[0] == 'line':
+                canvas.create_line(*point(op[1], op[2]), *point(op[3], op[4]))
+            elif op[0] == 'image':
+                self.draw_preview_image(op[5], *point(op[1], op[2] + op[4]), op[3] * scale, op[4] * scale)
+
+        total = self.preview_pages.known_count()
+        count_text = f"{total}" if self.preview_pages.complete else f"{total}+"
+        self.preview_page_label.config(text=f"第 {index + 1} 頁 / 共 {count_text} 頁")
+
+    def draw_preview_image(self, path, x, y, width, height):
+        """在預覽中畫出商品縮圖（左上角 x, y），保持比例置中於方框"""
+        try:
+            from PIL import Image, ImageTk
+            with Image.open(path) as image:
+                image.thumbnail((max(int(width), 1), max(int(height), 1)))
+                photo = ImageTk.PhotoImage(image)
+        except (ImportError, OSError) as e:
+            print(f"無法顯示商品縮圖 {path}: {e}")
+            self.preview_canvas.create_rectangle(x, y, x + width, y + height, outline="gray60")
+            return
+        self.preview_images.append(photo)
+        self.preview_canvas.create_image(x + width / 2, y + height / 2, image=photo, anchor="center")
 
     def validate_inputs(self):
         """驗證輸入"""
@@ -476,21 +805,41 @@ class PDFGeneratorApp:
             return False
         return True
 
+    def check_transfer(self, data, filepath):
+        """產生前驗證整張調貨單（所有商品行一次檢查），有錯誤或使用者取消時回傳 False"""
+        catalog_for_store = None
+        if self.catalogs is not None:
+            lookup = self.get_ims_lookup()
+            catalog_for_store = lambda store: lookup
+        report = transfer_validation.validate_transfers(
+            [data], catalog_for_store=catalog_for_store, output_paths=[filepath])
+        if not report.ok:
+            messagebox.showerror("驗證失敗", report.summary(labels=["調貨單"]))
+            self.status_bar.config(text=f"驗證失敗: {len(report.errors)} 個錯誤")
+            return False
+        if report.warnings:
+            return messagebox.askyesno(
+                "警告", report.summary(labels=["調貨單"]) + "\n\n是否仍要繼續？")
+        return True
+
     def generate_pdf(self):
         """生成PDF文件"""
-        if not self.validate_inputs():
+        data = self.get_transfer_data()
+        filepath = output_writer.unique_path(self.get_output_path())
+        if not self.check_transfer(data, filepath):
             return
 
         try:
-            # 生成檔名
-            date_str = self.date_var.get().replace('/', '-')
-            filename = f"調貨單_{date_str}_{self.sender_store_var.get()}_to_{self.receiver_store_var.get()}.pdf"
-            filepath = os.path.join(self.save_path.get(), filename)
+            filename = os.path.basename(filepath)
 
             # 創建PDF
-            self.create_pdf(filepath)
+            self.create_pdf(filepath, data)
 
-            self.status_bar.config(text=f"PDF已生成: {filename}")
+            status = f"PDF已生成: {filename}"
+            if self.render_cache is not None:
+                status += f" ({self.render_cache.stats_text('sheet')})"
+            self.status_bar.config(text=status)
+            self.save_usage_stats()
 
             # 詢問是否開啟
             if messagebox.askyesno("完成", f"PDF已成功生成！\n\n檔案位置: {filepath}\n\n是否要開啟檔案？"):
@@ -503,100 +852,187 @@ class PDFGeneratorApp:
             messagebox.showerror("錯誤", f"PDF生成失敗: {str(e)}")
             self.status_bar.config(text="PDF生成失敗")
 
-    def create_pdf(self, filepath):
-        """創建PDF文件"""
-        c = canvas.Canvas(filepath, pagesize=landscape(A4))
-        width, height = landscape(A4)
-
-        # 設置字體
-        font_size_title = 22
-        font_size_header = 16
-        font_size_content = 14
-        font_size_small = 12
-
-        # 標題
-        c.setFont(self.font_name, font_size_title)
-        title_text = "Transfer Document / 調貨單"
-        title_width = c.stringWidth(
-            title_text, self.font_name, font_size_title)
-        c.drawString((width - title_width) / 2, height - 50, title_text)
-
-        # 基本資訊
-        c.setFont(self.font_name, font_size_header)
-        y_pos = height - 100
-        line_height = 25
-
-        info_items = [
-            ("Date / 日期", self.date_var.get()),
-            ("From Store / 寄出店別", self.sender_store_var.get()),
-            ("Sender / 寄件人", self.sender_name_var.get()),
-            ("To Store / 收件店別", self.receiver_store_var.get()),
-            ("Receiver / 收件人", self.receiver_name_var.get()),
-        ]
-
-        for label, value in info_items:
-            c.drawString(60, y_pos, f"{label}: {value}")
-            y_pos -= line_height
-
-        # 備註
-        if self.notes_var.get().strip():
-            c.drawString(60, y_pos, f"Notes / 備註: {self.notes_var.get()}")
-            y_pos -= line_height
+    def print_pdf(self):
+        """產生PDF並直接送到印表機"""
+        data = self.get_transfer_data()
+        filepath = output_writer.unique_path(self.get_output_path())
+        if not self.check_transfer(data, filepath):
+            return
 
-        y_pos -= 10
+        try:
+            self.create_pdf(filepath, data)
+            self.save_usage_stats()
 
-        # 商品標題
-        c.setFont(self.font_name, font_size_header)
-        c.drawString(60, y_pos, "Items / 商品明細:")
-        y_pos -= 30
+            spooler = print_spool.get_spooler()
+            printer = self.printer_var.get().strip() or None
+            job_id = spooler.submit([filepath], printer=printer,
+                                    title=os.path.basename(filepath))
+            self.status_bar.config(text=f"已送出列印工作: {job_id}")
 
-        # 表格標題
-        c.setFont(self.font_name, font_size_content)
-        c.drawString(60, y_pos, "Item Code / 商品編號")
-        c.drawString(220, y_pos, "Description / 商品描述")
-        c.drawString(650, y_pos, "Qty / 數量")
+        except Exception as e:
+            messagebox.showerror("錯誤", f"列印失敗: {str(e)}")
+            self.status_bar.config(text="列印失敗")
+
+    def get_output_path(self):
+        """生成檔名與輸出路徑"""
+        date_str = self.date_var.get().replace('/', '-')
+        filename = f"調貨單_{date_str}_{self.sender_store_var.get()}_to_{self.receiver_store_var.get()}.pdf"
+        return os.path.join(self.save_path.get(), filename)
+
+    def get_transfer_data(self):
+        """取得表單上的調貨資料"""
+        return {
+            'date': self.date_var.get(),
+            'sender_store': self.sender_store_var.get(),
+            'sender_name': self.sender_name_var.get(),
+            'receiver_store': self.receiver_store_var.get(),
+            'receiver_name': self.receiver_name_var.get(),
+            'notes': self.notes_var.get(),
+            'items': [
+                {
+                    'article_no': values[0],
+                    'description': values[1],
+                    'quantity': values[2],
+                }
+                for values in (self.tree.item(item)['values']
+                               for item in self.tree.get_children())
+            ],
+        }
+
+    def create_pdf(self, filepath, data=None):
+        """創建PDF文件（相同內容直接從快取取得）"""
+        if data is None:
+            data = self.get_transfer_data()
+        profile = self.profile_var.get()
+        render_data = self.attach_totals(data)
+        if self.render_cache is None:
+            pdf_bytes = pdf_render.render_bytes('sheet', render_data, self.font_name, profile=profile)
+        else:
+            pdf_bytes, _ = self.render_cache.render_bytes('sheet', render_data, self.font_name, profile)
+        # 先寫暫存檔再改名，中途失敗不會留下不完整的 PDF
+        output_writer.atomic_write(filepath, pdf_bytes)
+
+        # 寫入調貨紀錄
+        if self.history is not None:
+            try:
+                self.history.record(render_data, filepath, 'sheet', profile)
+            except Exception as e:
+                print(f"寫入調貨紀錄失敗: {e}")
+
+    def show_history(self):
+        """調貨紀錄視窗：查詢、重新產生、列印或載回表單"""
+        if self.history is None:
+            messagebox.showerror("錯誤", "調貨紀錄無法使用")
+            return
 
-        # 畫線
-        c.line(60, y_pos - 5, width - 60, y_pos - 5)
-        y_pos -= 25
+        # 已開啟時直接帶到最上層，不重複建立
+        if self.history_window is not None and self.history_window.winfo_exists():
+            self.history_window.deiconify()
+            self.history_window.lift()
+            return
 
-        # 商品項目
-        c.setFont(self.font_name, font_size_small)
-        for item in self.tree.get_children():
-            values = self.tree.item(item)['values']
-            code, desc, qty = values[0], values[1], values[2]
-
-            # 檢查是否需要新頁面
-            if y_pos < 100:
-                c.showPage()
-                y_pos = height - 80
-                c.setFont(self.font_name, font_size_small)
-
-            c.drawString(60, y_pos, str(code))
-
-            # 處理長描述
-            max_desc_length = 60
-            if len(desc) > max_desc_length:
-                desc = desc[:max_desc_length] + "..."
-            c.drawString(220, y_pos, desc)
-
-            c.drawString(650, y_pos, str(qty))
-            y_pos -= 20
-
-        # 總計
-        total_items = len(self.tree.get_children())
-        y_pos -= 20
-        c.line(60, y_pos, width - 60, y_pos)
-        y_pos -= 20
-        c.setFont(self.font_name, font_size_content)
-        c.drawString(60, y_pos, f"Total Items / 總項目數: {total_items}")
-
-        # 頁腳
-        c.setFont(self.font_name, font_size_small)
-        footer_text = f"Generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        c.drawString(60, 30, footer_text)
-
-        c.save()
+        window = self.history_window = tk.Toplevel(self.root)
+        window.title("調貨紀錄")
+        window.geometry("900x500")
+
+        # 查詢條件
+        filter_frame = ttk.Frame(window, padding=10)
+        filter_frame.pack(fill=tk.X)
+        filters = {}
+        for i, (key, label) in enumerate([("date_from", "起始日期"), ("date_to", "結束日期"),
+                                          ("sender_store", "寄出店別"), ("receiver_store", "收件店別"),
+                                          ("article_no", "商品編號")]):
+            ttk.Label(filter_frame, text=label).grid(row=0, column=i * 2, sticky="w")
+            filters[key] = tk.StringVar()
+            ttk.Entry(filter_frame, textvariable=filters[key], width=12).grid(
+                row=0, column=i * 2 + 1, padx=(2, 8))
+
+        # 查詢結果
+        columns = ("id", "date", "from", "to", "items", "path")
+        tree = ttk.Treeview(window, columns=columns, show="headings")
+        for column, text, width in [("id", "編號", 60), ("date", "日期", 90), ("from", "寄出店別", 100),
+                                    ("to", "收件店別", 100), ("items", "項目數", 60),
+                                    ("path", "檔案", 400)]:
+            tree.heading(column, text=text)
+            tree.column(column, width=width)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10)
+
+        def search():
+            tree.delete(*tree.get_children())
+            try:
+                rows = self.history.query(**{key: var.get().strip() or None
+                                             for key, var in filters.items()})
+            except Exception as e:
+                messagebox.showerror("錯誤", f"查詢失敗: {e}", parent=window)
+                return
+            for row in rows:
+                tree.insert("", "end", iid=str(row['id']), values=(
+                    row['id'], row['transfer_date'], row['sender_store'],
+                    row['receiver_store'], row['item_count'], row['output_path']))
+
+        def selected_record():
+            selection = tree.selection()
+            if not selection:
+                messagebox.showwarning("警告", "請選擇調貨紀錄", parent=window)
+                return None
+            return self.history.load(int(selection[0]))
+
+        def reprint(send_to_printer):
+            record = selected_record()
+            if record is None:
+                return
+            if 'totals' not in record:  # 保存合計之前的紀錄：依目前的商品屬性重新計算
+                record = self.attach_totals(record)
+            try:
+                filepath = transfer_history.rerender(record, self.font_name,
+                                                     render_cache=self.render_cache)
+                if send_to_printer:
+                    job_id = print_spool.get_spooler().submit(
+                        [filepath], printer=self.printer_var.get().strip() or None,
+                        title=os.path.basename(filepath))
+                    self.status_bar.config(text=f"已送出列印工作: {job_id}")
+                else:
+                    self.status_bar.config(text=f"已重新產生: {filepath}")
+                    self.open_file(filepath)
+            except Exception as e:
+                messagebox.showerror("錯誤", f"重新產生失敗: {e}", parent=window)
+
+        def load_into_form():
+            record = selected_record()
+            if record is None:
+                return
+            self.date_var.set(record['date'])
+            self.sender_store_var.set(record['sender_store'])
+            self.sender_name_var.set(record['sender_name'])
+            self.receiver_store_var.set(record['receiver_store'])
+            self.receiver_name_var.set(record['receiver_name'])
+            self.notes_var.set(record['notes'])
+            self.tree.delete(*self.tree.get_children())
+            for item in record['items']:
+                self.tree.insert("", "end", values=(
+                    item['article_no'], item['description'], item['quantity']))
+            self.scan_index = None
+            self.status_bar.config(text=f"已載入調貨紀錄 {record['id']}")
+            window.destroy()
+
+        ttk.Button(filter_frame, text="查詢", command=search).grid(row=0, column=10)
+
+        btn_frame = ttk.Frame(window, padding=10)
+        btn_frame.pack(fill=tk.X)
+        ttk.Button(btn_frame, text="重新產生並開啟",
+                   command=lambda: reprint(False)).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(btn_frame, text="列印",
+                   command=lambda: reprint(True)).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(btn_frame, text="載入到表單",
+                   command=load_into_form).pack(side=tk.LEFT)
+        tree.bind("<Double-1>", lambda e: reprint(False))
+
+        search()
+
+    def on_close(self):
+        """關閉視窗"""
+        self.save_usage_stats()
+        self.root.destroy()
 
     def open_file(self, filepath):
         """開啟檔案"""
@@ -0,0 +1,93 @@
+# PDF 線性化（Fast Web View）：第一頁所需的物件移到檔案開頭，
+# 門市平板經由較慢的 Wi-Fi 開啟時下載到一部分就能顯示第一頁
+# 使用 pikepdf（pip install pikepdf）或系統的 qpdf 指令，兩者都沒有時維持一般輸出
+import io
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+try:
+    import pikepdf
+except ImportError:
+    pikepdf = None
+
+_LINEARIZED_DICT = re.compile(rb"<<[^>]*/Linearized\s+[\d.]+[^>]*>>")
+_warned = False
+
+
+def backend_name():
+    """可用的線性化工具：pikepdf、qpdf 或 None"""
+    if pikepdf is not None:
+        return "pikepdf"
+    if shutil.which("qpdf"):
+        return "qpdf"
+    return None
+
+
+def _linearize_pikepdf(pdf_bytes):
+    output = io.BytesIO()
+    with pikepdf.open(io.BytesIO(pdf_bytes)) as pdf:
+        # deterministic_id：相同內容產生相同檔案，不影響 deterministic 模式與快取
+        pdf.save(output, linearize=True, deterministic_id=True)
+    return output.getvalue()
+
+
+def _linearize_qpdf(pdf_bytes):
+    with tempfile.TemporaryDirectory(prefix="ims_print_") as directory:
+        source = os.path.join(directory, "source.pdf")
+        target = os.path.join(directory, "linearized.pdf")
+        with open(source, "wb") as f:
+            f.write(pdf_bytes)
+        result = subprocess.run(["qpdf", "--linearize", "--deterministic-id", source, target],
+                                capture_output=True)
+        if result.returncode not in (0, 3):  # 3 = 成功但有警告
+            raise RuntimeError(result.stderr.decode("utf-8", "replace").strip())
+        with open(target, "rb") as f:
+            return f.read()
+
+
+def linearize(pdf_bytes):
+    """回傳線性化後的 PDF 內容；沒有可用的工具或轉換失敗時原樣回傳（只提示一次）"""
+    global _warned
+    backend = backend_name()
+    try:
+        if backend == "pikepdf":
+            return _linearize_pikepdf(pdf_bytes)
+        if backend == "qpdf":
+            return _linearize_qpdf(pdf_bytes)
+        reason = "找不到 pikepdf 或 qpdf"
+    except (OSError, RuntimeError) as e:
+        reason = str(e)
+    except Exception as e:  # pikepdf.PdfError 等
+        reason = f"{type(e).__name__}: {e}"
+    if not _warned:
+        _warned = True
+        print(f"無法線性化 PDF，改為一般輸出: {reason}")
+    return pdf_bytes
+
+
+def linearization_info(pdf_bytes):
+    """讀取檔案開頭的線性化參數字典，回傳 {'L': 檔案長度, 'E': 第一頁結束位置, 'N': 頁數, 'O': 第一頁物件}
+
+    不是線性化檔案、或線性化後又被修改（/L 與檔案長度不符）時回傳 None。
+    """
+    match = _LINEARIZED_DICT.search(pdf_bytes[:2048])
+    if match is None:
+        return None
+    info = {key.decode(): int(value) for key, value in
+            re.findall(rb"/([LENOT])\s+(\d+)", match.group(0))}
+    if info.get("L") != len(pdf_bytes) or "E" not in info:
+        return None
+    return info
+
+
+def first_page_bytes(pdf_bytes):
+    """依序下載時顯示第一頁需要的位元組數
+
+    線性化檔案為第一頁區段的結尾（/E）；一般檔案的交叉參照表在檔案結尾，
+    閱讀器必須下載整個檔案才能找到第一頁的物件。
+    """
+    info = linearization_info(pdf_bytes)
+    return info["E"] if info else len(pdf_bytes)
@@ -0,0 +1,668 @@
+# 調貨單 PDF 繪製（與 UI 分離，供快取、批次與背景工作共用）
+import argparse
+import base64
+import io
+import os
+import re
+import time
+import zlib
+from datetime import datetime
+
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import landscape, A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.lib.rl_accel import fp_str
+
+import font_coverage
+import pdf_linearize
+import thumbnails
+from output_profiles import OUTPUT_PROFILES, DEFAULT_PROFILE
+from text_measure import text_width, wrap_cache
+from transfer_totals import format_totals, transfer_totals
+
+# 版面有任何變更時遞增，讓舊的快取失效
+TEMPLATE_VERSION = 4
+
+CID_FONT = 'MSung-Light'
+
+# 商品描述依欄寬換行，最多顯示的行數
+DESCRIPTION_MAX_LINES = 3
+
+# 各版面的商品描述欄：(字體（None 為版面的主要字體）, 大小, 欄寬)
+DESCRIPTION_COLUMNS = {
+    'document': ("Helvetica", 10, 370),
+    'sheet': (None, 12, 420),
+}
+
+# 商品縮圖（見 thumbnails）：物品行中的大小（pt），放在商品描述欄左側
+THUMBNAIL_SIZE = 18
+
+HEADER_FIELDS = ('date', 'sender_store', 'sender_name', 'receiver_store', 'receiver_name', 'notes')
+ITEM_FIELDS = ('article_no', 'description', 'quantity')
+
+
+def normalize_transfer(data):
+    """將調貨資料整理為固定格式（所有欄位皆為去除前後空白的字串）
+
+    Treeview 取回的數字欄位會變成 int，統一轉成字串後繪製與計算快取鍵才一致。
+    合計（totals，見 transfer_totals）未預先計算時只計算總數量。
+    """
+    normalized = {field: str(data.get(field, '')).strip() for field in HEADER_FIELDS}
+    normalized['items'] = [
+        {field: str(item.get(field, '')).strip() for field in ITEM_FIELDS}
+        for item in data.get('items', [])
+    ]
+    normalized['totals'] = data.get('totals') or transfer_totals(normalized['items'])
+    return normalized
+
+
+def font_fingerprint(font_name):
+    """字體識別字串：名稱加上字體檔路徑與修改時間（內建字體只有名稱），以及備用字體"""
+    filename = getattr(pdfmetrics.getFont(font_name).face, 'filename', None)
+    fingerprint = font_name
+    if filename and os.path.exists(filename):
+        fingerprint = f"{font_name}:{filename}:{os.path.getmtime(filename)}"
+    chain = font_coverage.chain_for(font_name)
+    if chain is not None:
+        fingerprint += "|" + chain.fingerprint()
+    return fingerprint
+
+
+def draw_text(c, x, y, text):
+    """以目前字體畫出文字；目前字體缺字時切成多段，缺字的部分改用備用字體
+
+    只有一段時直接 drawString，輸出與未設定備用字體時相同。
+    """
+    chain = font_coverage.chain_for(c._fontname)
+    runs = chain.split(text) if chain is not None else None
+    if runs is None or len(runs) == 1 and runs[0][0] == c._fontname:
+        c.drawString(x, y, text)
+        return
+    size = c._fontsize
+    t = c.beginText(x, y)
+    for name, run in runs:
+        t.setFont(name, size, c._leading)
+        t.textOut(run)
+    t.setFont(c._fontname, size, c._leading)  # 還原目前字體，後續文字不受影響
+    c.drawText(t)
+
+
+class RowText:
+    """在同一個文字物件（BT ... ET）中依序輸出多段文字，供物品表格使用
+
+    drawString 每段文字都產生 BT、Tf、Tm、ET；這裡字體只在切換時設定，
+    位置以相對前一段文字的 Td 移動（同一欄的行距與欄距都是固定的差值）。
+    備用字體的處理與 draw_text 相同。
+    """
+
+    def __init__(self, c, font_name, size):
+        self._c = c
+        self._t = None
+        self._x = self._y = 0
+        self.set_font(font_name, size)
+
+    def set_font(self, font_name, size):
+        self.font_name = font_name
+        self.size = size
+        self._chain = font_coverage.chain_for(font_name)
+        if self._t is not None:
+            self._t.setFont(font_name, size)
+
+    def text(self, x, y, text):
+        t = self._t
+        if t is None:
+            t = self._t = self._c.beginText(x, y)
+            t.setFont(self.font_name, self.size)
+        else:
+            t._code.append(f"{fp_str(x - self._x, y - self._y)} Td")
+        self._x, self._y = x, y
+
+        # 直接輸出文字運算子：textOut 會為了游標位置再量一次字寬，這裡用不到
+        runs = self._chain.split(text) if self._chain is not None else None
+        if runs is None or len(runs) == 1 and runs[0][0] == self.font_name:
+            t._code.append(t._formatText(text))
+            return
+        for name, run in runs:
+            t.setFont(name, self.size)
+            t._code.append(t._formatText(run))
+        t.setFont(self.font_name, self.size)
+
+    def draw(self):
+        """結束文字物件並畫到畫布（沒有任何文字時不輸出）"""
+        if self._t is not None:
+            self._c.drawText(self._t)
+            self._t = None
+
+
+def draw_thumbnail(c, path, x, y):
+    """在 (x, y) 為左下角的方框中畫出商品縮圖（保持比例置中）
+
+    以檔名傳給 drawImage：ReportLab 依檔名判斷是否已嵌入，相同縮圖在同一份 PDF 中只嵌入一次。
+    """
+    c.drawImage(path, x, y, THUMBNAIL_SIZE, THUMBNAIL_SIZE, preserveAspectRatio=True)
+
+
+def make_canvas(filepath, profile=DEFAULT_PROFILE, deterministic=False):
+    """依輸出設定建立橫向 A4 畫布"""
+    settings = OUTPUT_PROFILES[profile]
+    return canvas.Canvas(filepath, pagesize=landscape(A4),
+                         pageCompression=1 if settings['compression'] else 0,
+                         pdfVersion=settings['pdf_version'],
+                         invariant=1 if deterministic else None)
+
+
+def save_canvas(c, filepath, profile=DEFAULT_PROFILE):
+    """完成畫布並寫出；輸出設定需要線性化時先取得內容轉換後再寫入 filepath（路徑或檔案物件）"""
+    if not OUTPUT_PROFILES[profile]['linearize']:
+        c.save()
+        return
+    pdf_bytes = pdf_linearize.linearize(c.getpdfdata())
+    if hasattr(filepath, 'write'):
+        filepath.write(pdf_bytes)
+    else:
+        with open(filepath, 'wb') as f:
+            f.write(pdf_bytes)
+
+
+def profile_fonts(font_name, profile=DEFAULT_PROFILE):
+    """依輸出設定回傳 (一般字體, 粗體字體)"""
+    if OUTPUT_PROFILES[profile]['fonts'] == 'cid':
+        if CID_FONT not in pdfmetrics.getRegisteredFontNames():
+            from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+            pdfmetrics.registerFont(UnicodeCIDFont(CID_FONT))
+        return CID_FONT, CID_FONT
+    if font_name == 'ChineseFont':
+        return font_name, 'ChineseFontBold'
+    return font_name, 'Helvetica-Bold'
+
+
+def document_item_rows(items, y_position, height):
+    """調貨單（main.py）物品詳細的排版，逐項回傳 (物品, 是否先換頁, y 位置, 描述各行)"""
+    for item in items:
+        # 描述依欄寬換行（Description 欄到 Quantity 欄之間）
+        lines = wrap_cache.wrap(item['description'], *DESCRIPTION_COLUMNS['document'],
+                                DESCRIPTION_MAX_LINES)
+        new_page = y_position - 12 * (len(lines) - 1) < 150  # 如果空間不夠，換頁
+        if new_page:
+            y_position = height - 80
+        yield item, new_page, y_position, lines
+        y_position -= 20 + 12 * (len(lines) - 1)
+
+
+def render_transfer_document(data, filename, font_name, deterministic=False, profile=DEFAULT_PROFILE):
+    """調貨單版面（main.py）"""
+    data = normalize_transfer(data)
+    c = make_canvas(filename, profile, deterministic)
+    width, height = landscape(A4)
+
+    # 標題
+    c.setFont("Helvetica-Bold", 20)
+    title_x = (width - 300) / 2
+    draw_text(c, title_x, height - 60, "Transfer Document / 調貨單")
+
+    # 內容 - 標籤部分使用普通字體，數據部分使用粗體
+    y_position = height - 120
+    line_height = 40
+    left_margin = 80
+
+    # 獲取適合的粗體字體
+    font_name, bold_font = profile_fonts(font_name, profile)
+
+    header_rows = [
+        ("日期 Date: ", data['date']),
+        ("寄出店別 From Store: ", data['sender_store']),
+        ("寄件人 Sender: ", data['sender_name']),
+        ("收件店別 To Store: ", data['receiver_store']),
+        ("收件人 Receiver: ", data['receiver_name']),
+    ]
+    for label, value in header_rows:
+        c.setFont(font_name, 14)
+        draw_text(c, left_margin, y_position, label)
+        label_width = text_width(label, font_name, 14)
+        c.setFont(bold_font, 14)
+        draw_text(c, left_margin + label_width, y_position, value)
+        y_position -= line_height
+
+    # 合計（表頭右側）：總數量，有商品屬性時加上總重量、材積與箱數
+    if data['items']:
+        c.setFont(font_name, 12)
+        for n, line in enumerate(format_totals(data['totals'])):
+            draw_text(c, width / 2 + 50, height - 120 - 20 * n, line)
+    y_position -= line_height * 0.5
+
+    # 物品清單
+    if data['items']:
+        c.setFont(font_name, 16)
+        draw_text(c, left_margin, y_position, "物品清單 Items List:")
+        y_position -= 30
+
+        # 表格標題
+        c.setFont(font_name, 12)
+        draw_text(c, left_margin, y_position, "Article No")
+        draw_text(c, left_margin + 120, y_position, "Description")
+        draw_text(c, left_margin + 500, y_position, "Quantity")
+        y_position -= 5
+
+        # 畫線分隔
+        c.line(left_margin, y_position, width - 80, y_position)
+        y_position -= 20
+
+        # 物品詳細：每頁的表格以一個文字物件輸出
+        rows = RowText(c, "Helvetica", 10)
+        thumbs = thumbnails.default_cache()
+        for item, new_page, y_position, lines in document_item_rows(data['items'], y_position, height):
+            if new_page:
+                rows.draw()
+                c.showPage()
+
+            thumbnail = thumbs.get(item['article_no']) if thumbs else None
+            if thumbnail:
+                draw_thumbnail(c, thumbnail, left_margin + 120 - THUMBNAIL_SIZE - 4, y_position - 5)
+            rows.text(left_margin, y_position, item['article_no'])
+            for n, line in enumerate(lines):
+                rows.text(left_margin + 120, y_position - 12 * n, line)
+            rows.text(left_margin + 500, y_position, item['quantity'])
+        rows.draw()
+
+    # 裝飾邊框
+    c.rect(40, 40, width - 80, height - 80, stroke=1, fill=0)
+
+    # 簽名區域
+    separator_y = 180
+    c.line(60, separator_y, width - 60, separator_y)
+
+    signature_y = separator_y - 60
+    left_col_x = 80
+    right_col_x = width / 2 + 50
+
+    # 簽名區域使用普通字體
+    c.setFont(font_name, 14)
+
+    # 左欄：寄件人簽名
+    draw_text(c, left_col_x, signature_y, "寄件人簽名 Sender Signature:")
+    c.line(left_col_x + 220, signature_y - 5, right_col_x - 30, signature_y - 5)
+    draw_text(c, left_col_x, signature_y - 40, "日期 Date:")
+    c.line(left_col_x + 80, signature_y - 45, left_col_x + 200, signature_y - 45)
+
+    # 右欄：收件人簽名
+    draw_text(c, right_col_x, signature_y, "收件人簽名 Receiver Signature:")
+    c.line(right_col_x + 220, signature_y - 5, width - 80, signature_y - 5)
+    draw_text(c, right_col_x, signature_y - 40, "日期 Date:")
+    c.line(right_col_x + 80, signature_y - 45, right_col_x + 200, signature_y - 45)
+
+    save_canvas(c, filename, profile)
+
+
+def footer_uses_date():
+    """環境變數 IMS_PRINT_SHEET_FOOTER=date 時調貨單頁腳改印調貨日期（頁腳固定，才能使用 PDF 快取）"""
+    return os.environ.get("IMS_PRINT_SHEET_FOOTER", "time") == "date"
+
+
+def sheet_footer_text(data, generated_at=None):
+    """調貨單頁腳：產生時間（generated_at 未指定時為現在），或依 footer_uses_date 印調貨日期"""
+    if footer_uses_date():
+        return f"Generated for {data['date']}"
+    return f"Generated on {(generated_at or datetime.now()).strftime('%Y-%m-%d %H:%M:%S')}"
+
+
+def layout_transfer_sheet(data, font_name, footer_text):
+    """調貨單版面（pdf_generator_tkinter.py）的繪製指令，逐頁產生
+
+    每一頁是指令清單：('font', 字體, 大小)、('text', x, y, 文字)、('line', x1, y1, x2, y2)、
+    ('image', x, y, 寬, 高, 縮圖檔)。
+    PDF 與預覽共用同一份版面計算；以產生器逐頁計算，預覽只需要算到目前顯示的頁。
+    """
+    data = normalize_transfer(data)
+    width, height = landscape(A4)
+    page = []
+
+    # 設置字體
+    font_size_title = 22
+    font_size_header = 16
+    font_size_content = 14
+    font_size_small = 12
+
+    # 標題
+    page.append(('font', font_name, font_size_title))
+    title_text = "Transfer Document / 調貨單"
+    title_width = text_width(title_text, font_name, font_size_title)
+    page.append(('text', (width - title_width) / 2, height - 50, title_text))
+
+    # 基本資訊
+    page.append(('font', font_name, font_size_header))
+    y_pos = height - 100
+    line_height = 25
+
+    info_items = [
+        ("Date / 日期", data['date']),
+        ("From Store / 寄出店別", data['sender_store']),
+        ("Sender / 寄件人", data['sender_name']),
+        ("To Store / 收件店別", data['receiver_store']),
+        ("Receiver / 收件人", data['receiver_name']),
+    ]
+
+    for label, value in info_items:
+        page.append(('text', 60, y_pos, f"{label}: {value}"))
+        y_pos -= line_height
+
+    # 合計（基本資訊右側）：總數量，有商品屬性時加上總重量、材積與箱數
+    page.append(('font', font_name, font_size_content))
+    for n, line in enumerate(format_totals(data['totals'])):
+        page.append(('text', width / 2 + 50, height - 100 - line_height * n, line))
+    page.append(('font', font_name, font_size_header))
+
+    # 備註
+    if data['notes']:
+        page.append(('text', 60, y_pos, f"Notes / 備註: {data['notes']}"))
+        y_pos -= line_height
+
+    y_pos -= 10
+
+    # 商品標題
+    page.append(('font', font_name, font_size_header))
+    page.append(('text', 60, y_pos, "Items / 商品明細:"))
+    y_pos -= 30
+
+    # 表格標題
+    page.append(('font', font_name, font_size_content))
+    page.append(('text', 60, y_pos, "Item Code / 商品編號"))
+    page.append(('text', 220, y_pos, "Description / 商品描述"))
+    page.append(('text', 650, y_pos, "Qty / 數量"))
+
+    # 畫線
+    page.append(('line', 60, y_pos - 5, width - 60, y_pos - 5))
+    y_pos -= 25
+
+    # 商品項目
+    page.append(('font', font_name, font_size_small))
+    desc_width = DESCRIPTION_COLUMNS['sheet'][2]
+    thumbs = thumbnails.default_cache()
+    for item in data['items']:
+        code, qty = item['article_no'], item['quantity']
+        # 描述依欄寬換行（商品描述欄到數量欄之間）
+        lines = wrap_cache.wrap(item['description'], font_name, font_size_small, desc_width,
+                                DESCRIPTION_MAX_LINES)
+
+        # 檢查是否需要新頁面
+        if y_pos - 14 * (len(lines) - 1) < 100:
+            yield page
+            page = [('font', font_name, font_size_small)]
+            y_pos = height - 80
+
+        thumbnail = thumbs.get(code) if thumbs else None
+        if thumbnail:
+            page.append(('image', 220 - THUMBNAIL_SIZE - 4, y_pos - 5, THUMBNAIL_SIZE, THUMBNAIL_SIZE, thumbnail))
+        page.append(('text', 60, y_pos, code))
+        for n, line in enumerate(lines):
+            page.append(('text', 220, y_pos - 14 * n, line))
+        page.append(('text', 650, y_pos, qty))
+        y_pos -= 20 + 14 * (len(lines) - 1)
+
+    # 總計
+    total_items = len(data['items'])
+    y_pos -= 20
+    page.append(('line', 60, y_pos, width - 60, y_pos))
+    y_pos -= 20
+    page.append(('font', font_name, font_size_content))
+    page.append(('text', 60, y_pos, f"Total Items / 總項目數: {total_items}"))
+
+    # 頁腳
+    page.append(('font', font_name, font_size_small))
+    page.append(('text', 60, 30, footer_text))
+    yield page
+
+
+def draw_pages(c, pages):
+    """將版面指令畫到 ReportLab 畫布（頁與頁之間換頁）"""
+    for page_no, page in enumerate(pages):
+        if page_no:
+            c.showPage()
+        # 連續的文字指令合併在同一個文字物件中，遇到畫線時才結束
+        rows = None
+        for op in page:
+            if op[0] == 'text':
+                if rows is None:
+                    rows = RowText(c, c._fontname, c._fontsize)
+                rows.text(op[1], op[2], op[3])
+            elif op[0] == 'font':
+                c.setFont(op[1], op[2])
+                if rows is not None:
+                    rows.set_font(op[1], op[2])
+            elif op[0] == 'line':
+                if rows is not None:
+                    rows.draw()
+                    rows = None
+                c.line(op[1], op[2], op[3], op[4])
+            elif op[0] == 'image':
+                draw_thumbnail(c, op[5], op[1], op[2])
+        if rows is not None:
+            rows.draw()
+
+
+class LazyPages:
+    """逐頁取得版面指令，只計算到要求的頁數"""
+
+    def __init__(self, pages):
+        self._pages = []
+        self._source = iter(pages)
+        self.complete = False
+
+    def get(self, index):
+        """取得第 index 頁（從 0 起算），超出總頁數時回傳 None"""
+        while len(self._pages) <= index and not self.complete:
+            try:
+                self._pages.append(next(self._source))
+            except StopIteration:
+                self.complete = True
+        return self._pages[index] if index < len(self._pages) else None
+
+    def known_count(self):
+        """目前已計算的頁數（complete 為 True 時即總頁數）"""
+        return len(self._pages)
+
+
+def render_transfer_sheet(data, filepath, font_name, deterministic=False, profile=DEFAULT_PROFILE):
+    """調貨單版面（pdf_generator_tkinter.py）
+
+    deterministic 模式下 PDF 不含建立時間與隨機 ID；頁腳預設印產生時間，
+    頁腳改印調貨日期時（footer_uses_date）相同資料會產生逐位元組相同的檔案。
+    """
+    data = normalize_transfer(data)
+    c = make_canvas(filepath, profile, deterministic)
+    font_name, _ = profile_fonts(font_name, profile)
+    draw_pages(c, layout_transfer_sheet(data, font_name, sheet_footer_text(data)))
+    save_canvas(c, filepath, profile)
+
+
+def precompute_wraps(descriptions, template, font_name, profile=DEFAULT_PROFILE):
+    """預先計算商品描述在版面中的換行（載入商品資料時使用），回傳計算的筆數"""
+    font, size, width = DESCRIPTION_COLUMNS[template]
+    font = font or profile_fonts(font_name, profile)[0]
+    return wrap_cache.precompute(descriptions, font, size, width, DESCRIPTION_MAX_LINES)
+
+
+def page_count(template, data, font_name, profile=DEFAULT_PROFILE):
+    """調貨單的頁數（只計算排版，不產生 PDF；換行結果與產生時共用快取）"""
+    data = normalize_transfer(data)
+    if template == 'sheet':
+        font_name, _ = profile_fonts(font_name, profile)
+        return sum(1 for _ in layout_transfer_sheet(data, font_name, ''))
+    # 與 render_transfer_document 相同：表頭 5 行、間隔、清單標題與表格標題之後開始物品詳細
+    width, height = landscape(A4)
+    y_position = height - 120 - 40 * 5 - 20 - 30 - 5 - 20
+    return 1 + sum(new_page for _, new_page, _, _ in
+                   document_item_rows(data['items'], y_position, height))
+
+
+# 版面名稱 -> 繪製函式
+TEMPLATES = {
+    'document': render_transfer_document,
+    'sheet': render_transfer_sheet,
+}
+
+
+def render_bytes(template, data, font_name, deterministic=False, profile=DEFAULT_PROFILE):
+    """在記憶體中產生 PDF，回傳內容（寫檔交給 output_writer）"""
+    buffer = io.BytesIO()
+    TEMPLATES[template](data, buffer, font_name, deterministic=deterministic, profile=profile)
+    return buffer.getvalue()
+
+
+def sample_transfer(rows, catalog_path=None):
+    """以 ims_list.json 的商品組成指定行數的測試調貨資料"""
+    import catalog
+    catalog_path = catalog_path or catalog.find_catalog_file(
+        [os.path.dirname(os.path.abspath(__file__))])
+    items = list(catalog.open_catalog(catalog_path).items()) if catalog_path else []
+    items = items or [("00000", "SAMPLE ITEM")]
+    return {
+        'date': '2024/01/01',
+        'sender_store': '台北店',
+        'sender_name': '王小明',
+        'receiver_store': '台中店',
+        'receiver_name': '陳小華',
+        'notes': '',
+        'items': [
+            {'article_no': code, 'description': desc, 'quantity': str(i % 20 + 1)}
+            for i, (code, desc) in zip(range(rows), items * (rows // len(items) + 1))
+        ],
+    }
+
+
+def register_font(font_path=None):
+    """註冊 ChineseFont（指令列工具使用），未指定字體檔時使用 Helvetica
+
+    系統字體中缺字時使用的備用字體一併設定（見 font_coverage）。
+    """
+    if not font_path:
+        font_coverage.install_fallbacks(['Helvetica', 'Helvetica-Bold'])
+        return 'Helvetica'
+    pdfmetrics.registerFont(TTFont('ChineseFont', font_path))
+    pdfmetrics.registerFont(TTFont('ChineseFontBold', font_path))
+    font_coverage.install_fallbacks(['ChineseFont', 'ChineseFontBold', 'Helvetica', 'Helvetica-Bold'],
+                                    font_path)
+    return 'ChineseFont'
+
+
+def compare_profiles(rows=1000, repeat=3, font_name='Helvetica'):
+    """比較各輸出設定的產生時間與檔案大小，回傳 [(版面, 設定, 毫秒, 位元組)]"""
+    data = sample_transfer(rows)
+    results = []
+    for template, render in TEMPLATES.items():
+        for profile in OUTPUT_PROFILES:
+            best = None
+            for _ in range(repeat):
+                buffer = io.BytesIO()
+                start = time.perf_counter()
+                render(data, buffer, font_name, deterministic=True, profile=profile)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results.append((template, profile, best * 1000, len(buffer.getvalue())))
+    return results
+
+
+def compare_first_page_bytes(row_counts=(50, 500, 2000), font_name='Helvetica',
+                             profiles=('default', 'web')):
+    """比較各輸出設定下，依序下載時顯示第一頁需要的位元組數
+
+    回傳 [(版面, 行數, 設定, 檔案位元組, 第一頁位元組)]。
+    """
+    results = []
+    for rows in row_counts:
+        data = sample_transfer(rows)
+        for template in TEMPLATES:
+            for profile in profiles:
+                pdf_bytes = render_bytes(template, data, font_name, deterministic=True, profile=profile)
+                results.append((template, rows, profile, len(pdf_bytes),
+                                pdf_linearize.first_page_bytes(pdf_bytes)))
+    return results
+
+
+def page_contents(pdf_bytes):
+    """依序取出頁面內容串流（解開 ASCII85 / Flate），sheet 頁腳的產生時間以固定文字取代
+
+    比對兩份 PDF 的版面內容用（見 transfer_history.verify），不受建立時間、文件 ID 影響。
+    """
+    pages = []
+    for header, stream in re.findall(rb"<<([^>]*)>>\s*stream\r?\n(.*?)endstream", pdf_bytes, re.S):
+        if b"/ASCII85Decode" in header:
+            # ReportLab 的 ASCII85 以 ~> 結尾、沒有 <~ 開頭
+            stream = base64.a85decode(re.sub(rb"^<~|~>$", b"", stream.strip()))
+        if b"/FlateDecode" in header:
+            stream = zlib.decompress(stream)
+        if b" Tj" in stream or b" TJ" in stream:
+            pages.append(re.sub(rb"Generated on [\d\- :]+", b"Generated on", stream))
+    return pages
+
+
+def content_stream_bytes(pdf_bytes):
+    """頁面內容串流的總位元組數（PDF 需以不壓縮的輸出設定產生，例如 fast）"""
+    return sum(len(stream) for stream in re.findall(rb"stream\r?\n(.*?)endstream", pdf_bytes, re.S)
+               if b" Tj" in stream or b" TJ" in stream)
+
+
+def benchmark_rows(rows=1000, repeat=5, font_name='Helvetica'):
+    """各版面物品行的產生成本，回傳 [(版面, 每 1000 行 CPU 毫秒, 每行內容串流位元組)]
+
+    以 fast（不壓縮）輸出設定產生，內容串流可直接量測；CPU 時間取 repeat 次中最快者。
+    """
+    data = sample_transfer(rows)
+    results = []
+    for template in TEMPLATES:
+        render_bytes(template, data, font_name, deterministic=True, profile='fast')  # 預熱換行快取
+        best = None
+        for _ in range(repeat):
+            start = time.process_time()
+            pdf_bytes = render_bytes(template, data, font_name, deterministic=True, profile='fast')
+            elapsed = time.process_time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results.append((template, best * 1000 * 1000 / rows, content_stream_bytes(pdf_bytes) / rows))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="調貨單 PDF 工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compare_parser = subparsers.add_parser("compare-profiles", help="比較各輸出設定的速度與檔案大小")
+    compare_parser.add_argument("--rows", type=int, default=1000, help="測試調貨單的商品行數")
+    compare_parser.add_argument("--repeat", type=int, default=3, help="每個設定重複次數（取最快）")
+    compare_parser.add_argument("--font", help="ChineseFont 使用的 TTF/TTC 字體檔")
+
+    first_page_parser = subparsers.add_parser("first-page-bytes",
+                                              help="比較線性化前後顯示第一頁需要下載的位元組數")
+    first_page_parser.add_argument("--rows", default="50,500,2000", help="測試調貨單的商品行數（逗號分隔）")
+    first_page_parser.add_argument("--font", help="ChineseFont 使用的 TTF/TTC 字體檔")
+
+    rows_parser = subparsers.add_parser("bench-rows", help="量測物品行的 CPU 時間與內容串流大小")
+    rows_parser.add_argument("--rows", type=int, default=5000, help="測試調貨單的商品行數")
+    rows_parser.add_argument("--repeat", type=int, default=5, help="重複次數（取最快）")
+    rows_parser.add_argument("--font", help="ChineseFont 使用的 TTF/TTC 字體檔")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "bench-rows":
+        font_name = register_font(args.font)
+        print(f"{args.rows} 行商品，字體 {font_name}，每項取 {args.repeat} 次中最快者")
+        print(f"{'版面':<10}{'每 1000 行 (ms)':>18}{'每行內容串流 (B)':>20}")
+        for template, ms, size in benchmark_rows(args.rows, args.repeat, font_name):
+            print(f"{template:<10}{ms:>18.1f}{size:>20.1f}")
+    elif args.command == "first-page-bytes":
+        font_name = register_font(args.font)
+        print(f"字體 {font_name}，線性化工具: {pdf_linearize.backend_name() or '無（web 設定維持一般輸出）'}")
+        print(f"{'版面':<10}{'行數':>8}  {'設定':<10}{'檔案 (KB)':>12}{'第一頁 (KB)':>14}{'比例':>8}")
+        for template, rows, profile, size, first_page in compare_first_page_bytes(
+                [int(n) for n in args.rows.split(",")], font_name):
+            print(f"{template:<10}{rows:>8}  {profile:<10}{size / 1024:>12.1f}"
+                  f"{first_page / 1024:>14.1f}{first_page / size:>8.0%}")
+    elif args.command == "compare-profiles":
+        font_name = register_font(args.font)
+        print(f"{args.rows} 行商品，字體 {font_name}，每項取 {args.repeat} 次中最快者")
+        print(f"{'版面':<10}{'設定':<10}{'時間 (ms)':>12}{'大小 (KB)':>12}")
+        for template, profile, ms, size in compare_profiles(args.rows, args.repeat, font_name):
+            print(f"{template:<10}{profile:<10}{ms:>12.1f}{size / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# 直接列印：將產生的 PDF 送到印表機佇列（多份文件合併為單一列印工作）
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import time
+
+from app_paths import app_data_dir
+
+
+class CupsSpooler:
+    """透過 lp 指令送到 CUPS 印表機佇列
+
+    lp 一次帶入多個檔案時只會建立一個列印工作，整批文件只需送出一次。
+    """
+
+    def submit(self, files, printer=None, title=None):
+        cmd = ["lp"]
+        if printer:
+            cmd += ["-d", printer]
+        if title:
+            cmd += ["-t", title]
+        cmd += list(files)
+
+        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        # 輸出格式: request id is Printer-123 (2 file(s))
+        match = re.search(r"request id is (\S+)", result.stdout)
+        return match.group(1) if match else result.stdout.strip()
+
+
+def merge_pdfs(files, target):
+    """將多份 PDF 依序合併為 target（使用 pikepdf 或 qpdf 指令），兩者都沒有時回傳 False"""
+    from pdf_linearize import pikepdf
+
+    if pikepdf is not None:
+        with pikepdf.Pdf.new() as merged:
+            sources = [pikepdf.open(path) for path in files]
+            try:
+                for source in sources:
+                    merged.pages.extend(source.pages)
+                merged.save(target)
+            finally:
+                for source in sources:
+                    source.close()
+        return True
+    if shutil.which("qpdf"):
+        result = subprocess.run(["qpdf", "--empty", "--pages", *files, "--", target], capture_output=True)
+        if result.returncode not in (0, 3):  # 3 = 成功但有警告
+            raise RuntimeError(result.stderr.decode("utf-8", "replace").strip())
+        return True
+    return False
+
+
+class WindowsSpooler:
+    """Windows 沒有 lp，交由 PDF 程式的 print / printto 動作列印
+
+    多份文件先合併成一個 PDF（需要 pikepdf 或 qpdf），整批只送出一個列印工作；
+    兩者都沒有時退回逐一列印，每份文件各一個工作。
+    指定印表機時使用 printto 動作（需要 pywin32 或 Python 3.10 以上）。
+    """
+
+    # 合併後的暫存檔保留一天（PDF 程式在背景讀取，送出後無法立即刪除）
+    KEEP_SECONDS = 24 * 3600
+
+    def __init__(self, directory=None):
+        self.directory = directory or app_data_dir("print_spool")
+
+    def _cleanup(self):
+        cutoff = time.time() - self.KEEP_SECONDS
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pdf") and entry.stat().st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def _print(self, path, printer):
+        if not printer:
+            os.startfile(path, "print")
+            return
+        try:
+            import win32api
+        except ImportError:
+            try:
+                os.startfile(path, "printto", f'"{printer}"')
+            except TypeError:  # Python 3.9 以前的 startfile 沒有 arguments 參數
+                raise RuntimeError("指定印表機需要 pywin32（pip install pywin32）或 Python 3.10 以上")
+        else:
+            win32api.ShellExecute(0, "printto", path, f'"{printer}"', ".", 0)
+
+    def submit(self, files, printer=None, title=None):
+        files = list(files)
+        job_id = f"windows-{int(time.time() * 1000)}"
+        if len(files) > 1:
+            self._cleanup()
+            merged = os.path.join(self.directory, f"{job_id}.pdf")
+            if merge_pdfs(files, merged):
+                files = [merged]
+            else:
+                print("找不到 pikepdf 或 qpdf，無法合併為單一列印工作，改為逐一列印")
+        for path in files:
+            self._print(os.path.abspath(path), printer)
+        return job_id
+
+
+class FakeSpooler:
+    """測試用的本機假印表機佇列：每個工作建立一個目錄，存放檔案副本與工作資訊"""
+
+    def __init__(self, directory=None):
+        self.directory = directory or app_data_dir("fake_spool")
+        self.jobs = []
+
+    def submit(self, files, printer=None, title=None):
+        job_id = f"fake-{len(os.listdir(self.directory)) + 1}"
+        job_dir = os.path.join(self.directory, job_id)
+        os.makedirs(job_dir)
+        # 檔名加上序號，保留送出順序並避免同名檔案互相覆蓋
+        names = [f"{i:04d}_{os.path.basename(path)}" for i, path in enumerate(files, 1)]
+        for path, name in zip(files, names):
+            shutil.copy(path, os.path.join(job_dir, name))
+
+        job = {
+            "id": job_id,
+            "printer": printer,
+            "title": title,
+            "files": names,
+        }
+        with open(os.path.join(job_dir, "job.json"), "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False, indent=1)
+        self.jobs.append(job)
+        return job_id
+
+
+SPOOLERS = {
+    "cups": CupsSpooler,
+    "windows": WindowsSpooler,
+    "fake": FakeSpooler,
+}
+
+
+def get_spooler(name=None):
+    """取得列印後端，預設依作業系統選擇，可用環境變數 IMS_PRINT_SPOOLER 指定"""
+    name = name or os.environ.get("IMS_PRINT_SPOOLER")
+    if not name:
+        name = "windows" if platform.system() == "Windows" else "cups"
+    return SPOOLERS[name]()
+
+
+def default_printer():
+    """預設印表機（環境變數 IMS_PRINTER，未設定時使用系統預設）"""
+    return os.environ.get("IMS_PRINTER", "")
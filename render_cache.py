@@ -0,0 +1,118 @@
+# 以內容雜湊為鍵的 PDF 快取：相同調貨資料直接複製已產生的檔案
+import hashlib
+import json
+import os
+
+from app_paths import app_data_dir
+from output_writer import atomic_write
+import pdf_linearize
+import pdf_render
+import thumbnails
+
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+
+class RenderCache:
+    """PDF 產生結果的磁碟快取
+
+    快取鍵為「版面名稱 + 版面版本 + 輸出設定 + 字體 + 正規化後調貨資料」的 SHA-256，
+    因此只快取 deterministic 模式的輸出。總大小超過 max_bytes 時，
+    依最後使用時間淘汰最久未使用的檔案。
+    sheet 版面的頁腳預設印產生時間，每次內容都不同，只有 IMS_PRINT_SHEET_FOOTER=date 時才快取。
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or app_data_dir("render_cache")
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, template, data, font_name, profile=pdf_render.DEFAULT_PROFILE):
+        settings = {}
+        if pdf_render.OUTPUT_PROFILES[profile]['linearize']:
+            # 線性化工具安裝前快取的是一般輸出，安裝後需重新產生
+            settings['linearizer'] = pdf_linearize.backend_name()
+        thumbs = thumbnails.default_cache()
+        if thumbs is not None:
+            # 商品圖片新增或更換時重新產生
+            settings['thumbnails'] = thumbs.fingerprint(
+                str(item.get('article_no', '')) for item in data.get('items', []))
+        payload = json.dumps({
+            'template': template,
+            'version': pdf_render.TEMPLATE_VERSION,
+            'profile': profile,
+            'font': pdf_render.font_fingerprint(font_name),
+            'data': pdf_render.normalize_transfer(data),
+            **settings,
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pdf")
+
+    def cacheable(self, template):
+        return template != 'sheet' or pdf_render.footer_uses_date()
+
+    def render_bytes(self, template, data, font_name, profile=pdf_render.DEFAULT_PROFILE):
+        """產生 PDF 內容；回傳 (內容, 是否命中快取)"""
+        if not self.cacheable(template):
+            return pdf_render.render_bytes(template, data, font_name, deterministic=True, profile=profile), False
+
+        key = self.key(template, data, font_name, profile)
+        cached_path = self._path(key)
+
+        try:
+            with open(cached_path, 'rb') as f:
+                pdf_bytes = f.read()
+        except FileNotFoundError:
+            pass
+        else:
+            os.utime(cached_path)  # 更新最後使用時間供 LRU 淘汰
+            self.hits += 1
+            return pdf_bytes, True
+
+        self.misses += 1
+        pdf_bytes = pdf_render.render_bytes(template, data, font_name,
+                                            deterministic=True, profile=profile)
+        atomic_write(cached_path, pdf_bytes)
+        self.evict()
+        return pdf_bytes, False
+
+    def render(self, template, data, filepath, font_name, profile=pdf_render.DEFAULT_PROFILE):
+        """產生 PDF 到 filepath（暫存檔 + 改名）；快取命中時直接使用快取內容，回傳是否命中"""
+        pdf_bytes, hit = self.render_bytes(template, data, font_name, profile)
+        atomic_write(filepath, pdf_bytes)
+        return hit
+
+    def evict(self):
+        """總大小超過上限時淘汰最久未使用的檔案"""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".pdf"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def stats_text(self, template=None):
+        """狀態列顯示的快取統計；指定的版面不使用快取時改為說明原因"""
+        if template is not None and not self.cacheable(template):
+            return "快取未啟用：頁腳印產生時間（IMS_PRINT_SHEET_FOOTER=date 時啟用）"
+        return f"快取命中 {self.hits} / 未命中 {self.misses}"
+
+
+def render_cache_enabled():
+    """環境變數 IMS_PRINT_RENDER_CACHE=0 時停用快取與 deterministic 模式"""
+    return os.environ.get("IMS_PRINT_RENDER_CACHE", "1") != "0"
@@ -0,0 +1,291 @@
+# 調貨統計報表：將調貨紀錄的明細行轉為欄式陣列，依店別組合、商品、日期分組加總
+import argparse
+import csv
+import gc
+import heapq
+import sys
+from array import array
+from collections import Counter
+from itertools import groupby, repeat
+from operator import add, itemgetter, mul
+
+try:
+    import numpy
+except ImportError:  # 沒有 NumPy 時改用純 Python 加總，結果相同
+    numpy = None
+
+KEY_FIELDS = ("transfer_date", "sender_store", "receiver_store", "article_no")
+
+FIELD_LABELS = {
+    "transfer_date": "日期",
+    "sender_store": "寄出店別",
+    "receiver_store": "收件店別",
+    "article_no": "商品編號",
+}
+
+REPORTS = {
+    "pair-article": ("sender_store", "receiver_store", "article_no"),
+    "pair": ("sender_store", "receiver_store"),
+    "article": ("article_no",),
+    "day": ("transfer_date",),
+    "day-pair": ("transfer_date", "sender_store", "receiver_store"),
+}
+
+
+def parse_quantity(value):
+    """數量欄位轉為數值，無法解析時回傳 None"""
+    try:
+        return float(str(value).strip().replace(",", ""))
+    except ValueError:
+        return None
+
+
+class TransferColumns:
+    """以欄為單位存放調貨明細
+
+    字串欄位（日期、店別、商品編號）轉為整數代碼存在 array('i')，對照表只存一份字串；
+    表頭欄位每張調貨單只存一次，明細行只存調貨單序號、商品代碼與數量（array('d')）。
+    數百萬行明細只佔數十 MB，分組加總直接在代碼陣列上進行。
+    """
+
+    HEADER_FIELDS = ("transfer_date", "sender_store", "receiver_store")
+
+    def __init__(self):
+        self.labels = {field: [] for field in KEY_FIELDS}
+        self._index = {field: {} for field in KEY_FIELDS}
+        self.header_codes = {field: array("i") for field in self.HEADER_FIELDS}
+        self.row_transfer = array("i")
+        self.row_article = array("i")
+        self.quantity = array("d")
+        self.descriptions = {}
+        self.skipped = 0
+
+    def __len__(self):
+        return len(self.quantity)
+
+    def _code(self, field, value):
+        index = self._index[field]
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(index)
+            self.labels[field].append(value)
+        return code
+
+    def add_header(self, transfer_date, sender_store, receiver_store):
+        """加入一張調貨單的表頭，回傳調貨單序號"""
+        for field, value in zip(self.HEADER_FIELDS, (transfer_date, sender_store, receiver_store)):
+            self.header_codes[field].append(self._code(field, value))
+        return len(self.header_codes["transfer_date"]) - 1
+
+    def add_items(self, transfer, rows):
+        """加入明細行 [(商品編號, 數量)]；數量無法解析的行略過並計入 skipped"""
+        article_index = self._index["article_no"]
+        row_transfer = self.row_transfer
+        row_article = self.row_article
+        quantities = self.quantity
+        for article_no, quantity in rows:
+            try:
+                quantity = float(quantity)
+            except ValueError:
+                quantity = parse_quantity(quantity)
+                if quantity is None:
+                    self.skipped += 1
+                    continue
+            code = article_index.get(article_no)
+            if code is None:
+                code = self._code("article_no", article_no)
+            row_transfer.append(transfer)
+            row_article.append(code)
+            quantities.append(quantity)
+
+    def add_transfer(self, data):
+        """加入一張調貨單（get_transfer_data / history.load 的格式）"""
+        from transfer_history import parse_transfer_date
+
+        transfer = self.add_header(parse_transfer_date(data.get("date", "")),
+                                   str(data.get("sender_store", "")).strip(),
+                                   str(data.get("receiver_store", "")).strip())
+        items = data.get("items", [])
+        self.add_items(transfer, [(str(item.get("article_no", "")).strip(), item.get("quantity", ""))
+                                  for item in items])
+        for item in items:
+            article_no = str(item.get("article_no", "")).strip()
+            description = str(item.get("description", "")).strip()
+            if description:
+                self.descriptions.setdefault(article_no, description)
+
+    @classmethod
+    def from_history(cls, history, date_from=None, date_to=None):
+        """從調貨紀錄資料庫讀入指定日期範圍的明細"""
+        columns = cls()
+        transfers = {}
+        for transfer_id, transfer_date, sender_store, receiver_store in history.headers(date_from, date_to):
+            transfers[transfer_id] = columns.add_header(transfer_date, sender_store, receiver_store)
+
+        # 明細依 transfer_id 順序排列，同一張調貨單的行連續出現；
+        # 讀取表頭之後才寫入的調貨單（兩次查詢之間新增）不在 transfers 中，略過其明細
+        for batch in history.iter_item_batches(date_from, date_to):
+            for transfer_id, rows in groupby(batch, key=itemgetter(0)):
+                transfer = transfers.get(transfer_id)
+                if transfer is not None:
+                    columns.add_items(transfer, [row[1:] for row in rows])
+        return columns
+
+    def _strides(self, fields):
+        sizes = [len(self.labels[field]) for field in fields]
+        strides = []
+        stride = 1
+        for size in reversed(sizes):
+            strides.append(stride)
+            stride *= max(size, 1)
+        return sizes, list(reversed(strides))
+
+    def group_keys(self, fields, vectorized=True):
+        """各欄代碼以混合進位合成每一行的單一整數鍵
+
+        表頭欄位先在調貨單層級合成（調貨單數遠少於明細行數），
+        再依調貨單序號展開到明細行並加上商品代碼。
+        """
+        _, strides = self._strides(fields)
+        header_keys = [0] * len(self.header_codes["transfer_date"])
+        article_stride = 0
+        for field, stride in zip(fields, strides):
+            if field == "article_no":
+                article_stride = stride
+            else:
+                header_keys = list(map(add, header_keys, map(mul, self.header_codes[field], repeat(stride))))
+
+        if vectorized and numpy is not None:
+            keys = numpy.asarray(header_keys, dtype=numpy.int64)[
+                numpy.frombuffer(self.row_transfer, dtype=numpy.int32)]
+            if article_stride:
+                keys += numpy.frombuffer(self.row_article, dtype=numpy.int32).astype(numpy.int64) * article_stride
+            return keys
+
+        keys = map(header_keys.__getitem__, self.row_transfer)
+        if article_stride:
+            keys = map(add, keys, map(mul, self.row_article, repeat(article_stride)))
+        return keys
+
+    def group_sum(self, fields, top=None):
+        """依 fields 分組加總數量，回傳 [(鍵值 tuple, 數量合計, 明細行數)]，依數量由大到小
+
+        指定 top 時只取數量最多的前 top 組，不必排序全部分組。
+        """
+        if not len(self):
+            return []
+        sizes, strides = self._strides(fields)
+        # 鍵值範圍超出 int64 時改用 Python 整數
+        vectorized = numpy is not None and strides[0] * sizes[0] < 2 ** 62
+
+        # 分組過程會建立數百萬個小物件，暫停循環垃圾回收避免反覆掃描
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            if vectorized:
+                groups = self._group_sum_numpy(fields, top)
+            else:
+                groups = self._group_sum_python(fields, top)
+
+            # 整數鍵轉回欄位值 tuple
+            decoders = [(self.labels[field], stride) for field, stride in zip(fields, strides)]
+            result = []
+            for key, total, count in groups:
+                values = []
+                for labels, stride in decoders:
+                    code, key = divmod(key, stride)
+                    values.append(labels[code])
+                result.append((tuple(values), total, count))
+            return result
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def _group_sum_numpy(self, fields, top):
+        keys, inverse = numpy.unique(self.group_keys(fields), return_inverse=True)
+        totals = numpy.bincount(inverse, weights=numpy.frombuffer(self.quantity, dtype=numpy.float64))
+        counts = numpy.bincount(inverse)
+        # 數量由大到小，同數量依鍵值排序使輸出穩定
+        order = numpy.argsort(-totals, kind="stable")[:top]
+        return zip(keys[order].tolist(), totals[order].tolist(), counts[order].tolist())
+
+    def _group_sum_python(self, fields, top):
+        keys = list(self.group_keys(fields, vectorized=False))
+        counts = Counter(keys)
+        totals = dict.fromkeys(counts, 0.0)
+        for key, quantity in zip(keys, self.quantity):
+            totals[key] += quantity
+        # 數量由大到小，同數量依首次出現順序
+        if top:
+            order = heapq.nlargest(top, totals, key=totals.__getitem__)
+        else:
+            order = sorted(totals, key=totals.__getitem__, reverse=True)
+        return ((key, totals[key], counts[key]) for key in order)
+
+
+def format_quantity(value):
+    return str(int(value)) if float(value).is_integer() else f"{value:.2f}"
+
+
+def report_rows(columns, report, top=None, history=None):
+    """產生報表列（含表頭）；含商品編號的報表附上商品描述
+
+    從紀錄資料庫讀入時明細不含商品描述，只為輸出的商品向 history 查詢。
+    """
+    fields = REPORTS[report]
+    with_description = "article_no" in fields
+    header = [FIELD_LABELS[field] for field in fields]
+    if with_description:
+        header.append("商品描述")
+    header += ["數量合計", "明細行數"]
+
+    rows = [header]
+    groups = columns.group_sum(fields, top)
+    if with_description:
+        article_pos = fields.index("article_no")
+        missing = {key[article_pos] for key, _, _ in groups} - columns.descriptions.keys()
+        if history is not None and missing:
+            columns.descriptions.update(history.article_descriptions(missing))
+
+    for key, total, count in groups:
+        row = list(key)
+        if with_description:
+            row.append(columns.descriptions.get(key[article_pos], ""))
+        row += [format_quantity(total), count]
+        rows.append(row)
+    return rows
+
+
+def write_csv(rows, path):
+    """寫出 CSV（UTF-8 BOM，Excel 可直接開啟中文）"""
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        csv.writer(f).writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="調貨統計報表")
+    parser.add_argument("report", choices=sorted(REPORTS), help="報表類型")
+    parser.add_argument("--db", help="紀錄資料庫（預設 ~/.ims_print/history.db）")
+    parser.add_argument("--from", dest="date_from", help="起始日期")
+    parser.add_argument("--to", dest="date_to", help="結束日期")
+    parser.add_argument("--top", type=int, help="只輸出數量最多的前 N 組（例如熱門調貨商品）")
+    parser.add_argument("-o", "--output", help="輸出 CSV 檔案（未指定時印在畫面上）")
+    args = parser.parse_args(argv)
+
+    from transfer_history import TransferHistory
+    history = TransferHistory(args.db)
+    columns = TransferColumns.from_history(history, args.date_from, args.date_to)
+    rows = report_rows(columns, args.report, args.top, history)
+    history.close()
+
+    if args.output:
+        write_csv(rows, args.output)
+        print(f"{len(columns)} 行明細，{len(rows) - 1} 組 -> {args.output}")
+    else:
+        csv.writer(sys.stdout, delimiter="\t").writerows(rows)
+    if columns.skipped:
+        print(f"略過 {columns.skipped} 行數量無法解析的明細", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
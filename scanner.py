@@ -0,0 +1,72 @@
+# 條碼掃描器（鍵盤模擬輸入）的掃描佇列與速率統計
+import time
+from collections import deque
+
+
+class ScanQueue:
+    """掃描到的商品編號先排入佇列，由 UI 以批次方式處理
+
+    鍵盤事件處理只做入列，查詢與更新清單留到批次處理，
+    連續快速掃描時不會因為單筆處理較慢而漏掉輸入。
+    """
+
+    def __init__(self):
+        self._codes = deque()
+
+    def push(self, code):
+        code = code.strip()
+        if code:
+            self._codes.append(code)
+        return bool(code)
+
+    def drain(self, limit=None):
+        """取出佇列中的商品編號（最多 limit 筆）"""
+        codes = []
+        while self._codes and (limit is None or len(codes) < limit):
+            codes.append(self._codes.popleft())
+        return codes
+
+    def __len__(self):
+        return len(self._codes)
+
+
+class ScanStats:
+    """掃描速率與未知商品統計"""
+
+    def __init__(self, window=5.0, max_unknown=20, max_samples=1000):
+        self.window = window
+        self.total = 0
+        self.unknown_total = 0
+        # 最多保留 max_samples 筆掃描時間（速率上限 max_samples / window，遠高於實際掃描速度）
+        self._times = deque(maxlen=max_samples)
+        self._unknown = deque(maxlen=max_unknown)
+
+    def record(self, known, code=None, now=None):
+        now = time.monotonic() if now is None else now
+        self.total += 1
+        self._times.append(now)
+        # 記錄時也清除過期時間：沒有顯示速率時（例如關閉掃描模式）不會無限累積
+        self._expire(now)
+        if not known:
+            self.unknown_total += 1
+            self._unknown.append(code)
+
+    def _expire(self, now):
+        while self._times and now - self._times[0] > self.window:
+            self._times.popleft()
+
+    def rate(self, now=None):
+        """最近 window 秒內的每秒掃描數"""
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        return len(self._times) / self.window
+
+    def recent_unknown(self):
+        """最近的未知商品編號（新到舊）"""
+        return list(reversed(self._unknown))
+
+    def reset(self):
+        self.total = 0
+        self.unknown_total = 0
+        self._times.clear()
+        self._unknown.clear()
@@ -0,0 +1,404 @@
+# 共用記憶體商品資料：整份商品資料發佈成唯讀的區段檔，同一台主機上的所有程式以 mmap 共用
+# （終端機伺服器上數十個使用者各自執行程式時，商品資料只佔一份記憶體）
+import argparse
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from array import array
+from collections.abc import Mapping
+
+import catalog
+import catalog_attributes
+from output_writer import atomic_write
+
+MAGIC = b"IMSCAT02"
+
+# 區段檔格式（小端序）：
+#   表頭   magic(8) 筆數(I) 雜湊槽數(I) 項目表位置(Q) 字串區位置(Q) 來源版本(16) 表頭之後內容的 crc32(I) 保留(4)
+#   雜湊槽 每槽 (crc32(I), 項目序號 + 1(I))，0 表示空槽；槽數為 2 的次方，使用線性探測
+#   項目表 每筆 (商品編號位置(I), 長度(I), 商品描述位置(I), 長度(I))，位置相對於字串區
+#   字串區 UTF-8 編碼的商品編號與描述
+_HEADER = struct.Struct("<8sIIQQ16sI4x")
+_SLOT = struct.Struct("<II")
+_ENTRY = struct.Struct("<IIII")
+
+ATTRIBUTES_MAGIC = b"IMSATR02"
+
+# 屬性檔格式（小端序，與區段檔同名、副檔名為 .attr）：
+#   表頭   magic(8) 筆數(I) 來源版本(16) 表頭之後內容的 crc32(I)
+#   屬性欄 依 catalog_attributes.ATTRIBUTES 的順序，每個屬性 筆數 + 1 個 double，列號即區段的項目序號，
+#          最後一列是查無商品的哨兵列
+#   標記   筆數 + 1 個 byte 的有無位元標記
+_ATTRIBUTES_HEADER = struct.Struct("<8sI16sI")
+
+
+def shared_catalog_enabled():
+    """環境變數 IMS_PRINT_SHARED_CATALOG=1 時，JSON 商品資料改以共用區段載入"""
+    return os.environ.get("IMS_PRINT_SHARED_CATALOG", "0") == "1"
+
+
+def segment_dir():
+    """區段檔目錄：同一台主機的所有使用者共用
+
+    預設為 /dev/shm/ims_print_catalog（Linux，記憶體檔案系統），其他系統使用暫存目錄；
+    可用環境變數 IMS_PRINT_SHARED_CATALOG_DIR 指定。
+    """
+    directory = os.environ.get("IMS_PRINT_SHARED_CATALOG_DIR")
+    if not directory:
+        base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        directory = os.path.join(base, "ims_print_catalog")
+    os.makedirs(directory, exist_ok=True)
+    try:
+        os.chmod(directory, 0o1777)  # 所有使用者都可發佈，但只能刪除自己的檔案
+    except OSError:
+        pass
+    return directory
+
+
+def trusted_uids():
+    """可信任的區段檔擁有者：目前的使用者，以及環境變數 IMS_PRINT_SHARED_CATALOG_PUBLISHER
+    指定的發佈者（使用者名稱或 uid，例如以排程執行 publish 的帳號）"""
+    uids = {os.getuid()}
+    publisher = os.environ.get("IMS_PRINT_SHARED_CATALOG_PUBLISHER", "").strip()
+    if publisher.isdigit():
+        uids.add(int(publisher))
+    elif publisher:
+        import pwd
+        try:
+            uids.add(pwd.getpwnam(publisher).pw_uid)
+        except KeyError:
+            print(f"找不到共用商品資料發佈者: {publisher}")
+    return uids
+
+
+def _check_owner(f, path):
+    """區段目錄所有使用者都可寫入，只開啟可信任的使用者發佈、且其他人無法修改的檔案
+
+    Windows 的暫存目錄為各使用者私有，不檢查。
+    """
+    if not hasattr(os, "getuid"):
+        return
+    st = os.fstat(f.fileno())
+    if st.st_uid not in trusted_uids():
+        raise ValueError(f"區段檔不是由目前的使用者或指定的發佈者建立: {path}")
+    if st.st_mode & 0o022:
+        raise ValueError(f"區段檔可被其他使用者修改: {path}")
+
+
+def _open_segment_file(path, magic, header, version):
+    """開啟並映射區段檔或屬性檔，檢查擁有者、格式、來源版本與 crc32，回傳 (mmap, 表頭欄位)"""
+    with open(path, "rb") as f:
+        _check_owner(f, path)
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if len(mm) < header.size:
+            raise ValueError(f"區段檔不完整: {path}")
+        fields = header.unpack_from(mm, 0)
+        if fields[0] != magic:
+            raise ValueError(f"不是商品資料區段檔: {path}")
+        if version is not None and fields[-2] != version.encode("ascii"):
+            raise ValueError(f"區段檔版本與檔名不符: {path}")
+        with memoryview(mm) as view, view[header.size:] as body:
+            checksum = zlib.crc32(body)
+        if checksum != fields[-1]:
+            raise ValueError(f"區段檔內容校驗失敗: {path}")
+    except Exception:
+        mm.close()
+        raise
+    return mm, fields
+
+
+def path_version(path):
+    """區段檔或屬性檔檔名中的來源版本（<前綴>.<版本>.seg）"""
+    return os.path.basename(path).rsplit(".", 2)[-2]
+
+
+def source_version(catalog_path, options=None):
+    """來源商品資料的版本：商品資料檔與所有 delta 檔的路徑、大小與修改時間（以及 CSV 讀取設定、檔案格式）"""
+    parts = [MAGIC.decode("ascii"), ATTRIBUTES_MAGIC.decode("ascii"), json.dumps(options or {}, sort_keys=True)]
+    for path in [catalog_path] + catalog.find_delta_files(catalog_path):
+        stat = os.stat(path)
+        parts.append(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def segment_prefix(catalog_path):
+    """同一份來源商品資料的區段檔名稱前綴（不同版本共用）"""
+    path_key = hashlib.sha1(os.path.abspath(catalog_path).encode("utf-8")).hexdigest()[:12]
+    stem = os.path.splitext(os.path.basename(catalog_path))[0]
+    return f"{stem}-{path_key}"
+
+
+def build_segment(items, version=""):
+    """將 {商品編號: 商品描述} 編碼為區段檔內容（version 為 source_version）"""
+    items = list(items)
+    count = len(items)
+    slot_count = 8
+    while slot_count < count * 2:
+        slot_count *= 2
+    mask = slot_count - 1
+
+    slots = bytearray(slot_count * _SLOT.size)
+    entries = bytearray(count * _ENTRY.size)
+    strings = bytearray()
+    for index, (code, description) in enumerate(items):
+        code_bytes = code.encode("utf-8")
+        desc_bytes = description.encode("utf-8")
+        _ENTRY.pack_into(entries, index * _ENTRY.size, len(strings), len(code_bytes),
+                         len(strings) + len(code_bytes), len(desc_bytes))
+        strings += code_bytes
+        strings += desc_bytes
+
+        h = zlib.crc32(code_bytes)
+        slot = h & mask
+        while _SLOT.unpack_from(slots, slot * _SLOT.size)[1]:
+            slot = (slot + 1) & mask
+        _SLOT.pack_into(slots, slot * _SLOT.size, h, index + 1)
+
+    entries_offset = _HEADER.size + len(slots)
+    strings_offset = entries_offset + len(entries)
+    body = b"".join((slots, entries, strings))
+    header = _HEADER.pack(MAGIC, count, slot_count, entries_offset, strings_offset,
+                          version.encode("ascii"), zlib.crc32(body))
+    return header + body
+
+
+def build_attributes(attributes, codes, version=""):
+    """將屬性（catalog_attributes 的屬性物件）依區段的項目順序 codes 編碼為屬性檔內容"""
+    codes = list(codes)
+    values, known = attributes.gather(codes + [None])
+    parts = [array("d", values[name]).tobytes() for name in catalog_attributes.ATTRIBUTES]
+    parts.append(array("B", known).tobytes())
+    body = b"".join(parts)
+    return _ATTRIBUTES_HEADER.pack(ATTRIBUTES_MAGIC, len(codes), version.encode("ascii"),
+                                   zlib.crc32(body)) + body
+
+
+def attributes_path(segment_path):
+    """區段檔對應的屬性檔路徑"""
+    return os.path.splitext(segment_path)[0] + ".attr"
+
+
+class SharedCatalog(Mapping):
+    """以 mmap 開啟的唯讀商品資料區段，用法與 {商品編號: 商品描述} 字典相同
+
+    查詢直接在映射的頁面上計算雜湊與比對，不在程式中建立整份字典；
+    所有開啟同一區段檔的程式共用作業系統的同一份頁面快取。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._mm, fields = _open_segment_file(path, MAGIC, _HEADER, path_version(path))
+        _, self._count, self._slot_count, self._entries, self._strings = fields[:5]
+        if (self._slot_count & (self._slot_count - 1) or self._slot_count <= self._count
+                or self._entries != _HEADER.size + self._slot_count * _SLOT.size
+                or self._strings != self._entries + self._count * _ENTRY.size
+                or self._strings > len(self._mm)):
+            self._mm.close()
+            raise ValueError(f"區段檔格式錯誤: {path}")
+        self._mask = self._slot_count - 1
+
+    def close(self):
+        self._mm.close()
+
+    def _entry(self, index):
+        code_off, code_len, desc_off, desc_len = _ENTRY.unpack_from(
+            self._mm, self._entries + index * _ENTRY.size)
+        return self._strings + code_off, code_len, self._strings + desc_off, desc_len
+
+    def _find(self, code):
+        """回傳項目序號，找不到時回傳 -1"""
+        if not isinstance(code, str):
+            code = str(code)
+        code_bytes = code.encode("utf-8")
+        h = zlib.crc32(code_bytes)
+        slot = h & self._mask
+        mm = self._mm
+        for _ in range(self._slot_count):  # 最多探測一輪
+            slot_hash, index = _SLOT.unpack_from(mm, _HEADER.size + slot * _SLOT.size)
+            if not index or index > self._count:
+                return -1
+            if slot_hash == h:
+                code_start, code_len, _, _ = self._entry(index - 1)
+                if mm[code_start:code_start + code_len] == code_bytes:
+                    return index - 1
+            slot = (slot + 1) & self._mask
+        return -1
+
+    def __getitem__(self, code):
+        index = self._find(code)
+        if index < 0:
+            raise KeyError(code)
+        _, _, desc_start, desc_len = self._entry(index)
+        return self._mm[desc_start:desc_start + desc_len].decode("utf-8")
+
+    def __contains__(self, code):
+        return self._find(code) >= 0
+
+    def get(self, code, default=None):
+        index = self._find(code)
+        if index < 0:
+            return default
+        _, _, desc_start, desc_len = self._entry(index)
+        return self._mm[desc_start:desc_start + desc_len].decode("utf-8")
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        mm = self._mm
+        for index in range(self._count):
+            code_start, code_len, _, _ = self._entry(index)
+            yield mm[code_start:code_start + code_len].decode("utf-8")
+
+
+class SharedAttributes:
+    """以 mmap 開啟的唯讀屬性檔，用法與 catalog_attributes.AttributeColumns 的 gather 相同
+
+    商品編號經由同一版本的區段查出項目序號（查無時為 -1，正好對應最後的哨兵列），
+    屬性欄直接以映射頁面上的 memoryview 取值，不在程式中建立 {商品編號: 列號} 字典。
+    """
+
+    def __init__(self, segment, path):
+        self.segment = segment
+        self.path = path
+        self._mm, (_, count, _, _) = _open_segment_file(path, ATTRIBUTES_MAGIC, _ATTRIBUTES_HEADER,
+                                                         path_version(path))
+        size = _ATTRIBUTES_HEADER.size + (count + 1) * (8 * len(catalog_attributes.ATTRIBUTES) + 1)
+        if count != len(segment) or len(self._mm) != size:
+            self._mm.close()
+            raise ValueError(f"屬性檔與區段檔不符: {path}")
+
+        view = memoryview(self._mm)
+        offset = _ATTRIBUTES_HEADER.size
+        self._values = {}
+        for name in catalog_attributes.ATTRIBUTES:
+            self._values[name] = view[offset:offset + (count + 1) * 8].cast("d")
+            offset += (count + 1) * 8
+        self._known = view[offset:]
+        self._views = [view, self._known] + list(self._values.values())
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._mm.close()
+        self.segment.close()
+
+    def gather(self, codes):
+        rows = list(map(self.segment._find, codes))
+        return ({name: list(map(column.__getitem__, rows)) for name, column in self._values.items()},
+                list(map(self._known.__getitem__, rows)))
+
+
+def publish(catalog_path, directory=None, options=None):
+    """將商品資料（含 delta）發佈為區段檔與屬性檔，回傳區段檔路徑；相同版本已發佈時直接回傳
+
+    先寫暫存檔再改名，其他程式不會讀到寫到一半的區段；屬性檔先於區段檔寫入，
+    區段檔存在即表示屬性檔也已發佈（較早版本只發佈了區段檔時補上屬性檔）。
+    舊版本的區段檔隨即刪除，已開啟舊版的程式仍可繼續使用（映射在關閉前有效）。
+    """
+    directory = directory or segment_dir()
+    version = source_version(catalog_path, options)
+    path = os.path.join(directory, f"{segment_prefix(catalog_path)}.{version}.seg")
+    if not os.path.exists(path):
+        data = catalog.load_catalog(catalog_path, options)
+        catalog.apply_delta_files(data, catalog_path)
+        _write_segment_file(attributes_path(path), build_attributes(
+            catalog_attributes.load_attributes(catalog_path, options), data.keys(), version))
+        _write_segment_file(path, build_segment(data.items(), version))
+        print(f"已發佈共用商品資料: {len(data)} 筆 -> {path}")
+    elif not os.path.exists(attributes_path(path)):
+        segment = SharedCatalog(path)
+        try:
+            _write_segment_file(attributes_path(path), build_attributes(
+                catalog_attributes.load_attributes(catalog_path, options), segment, version))
+        finally:
+            segment.close()
+        print(f"已發佈共用商品屬性 -> {attributes_path(path)}")
+    remove_old_segments(catalog_path, directory, keep=path)
+    return path
+
+
+def _write_segment_file(path, content):
+    atomic_write(path, content)
+    try:
+        os.chmod(path, 0o644)
+    except OSError:
+        pass
+
+
+def remove_old_segments(catalog_path, directory=None, keep=None):
+    """刪除同一份商品資料的舊版區段檔與屬性檔，回傳刪除的數量
+
+    POSIX 系統刪除後，已映射的程式仍可使用到關閉為止；Windows 上仍被使用中的檔案會刪除失敗，
+    留待下次發佈時再刪除。
+    """
+    directory = directory or segment_dir()
+    keep = {os.path.normcase(os.path.abspath(p)) for p in (keep, attributes_path(keep))} if keep else set()
+    pattern = os.path.join(glob.escape(directory), glob.escape(segment_prefix(catalog_path)) + ".*")
+    removed = 0
+    for path in glob.glob(pattern + ".seg") + glob.glob(pattern + ".attr"):
+        if os.path.normcase(os.path.abspath(path)) in keep:
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def attach(catalog_path, directory=None, options=None):
+    """開啟商品資料的最新區段（尚未發佈或來源已更新時先發佈）"""
+    return SharedCatalog(publish(catalog_path, directory, options))
+
+
+def attach_attributes(catalog_path, directory=None, options=None):
+    """開啟商品資料最新版本的屬性檔（尚未發佈或來源已更新時先發佈）"""
+    path = publish(catalog_path, directory, options)
+    segment = SharedCatalog(path)
+    try:
+        return SharedAttributes(segment, attributes_path(path))
+    except (OSError, ValueError):
+        segment.close()
+        raise
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="共用記憶體商品資料")
+    parser.add_argument("--dir", help="區段檔目錄（預設 /dev/shm/ims_print_catalog 或暫存目錄）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    publish_parser = subparsers.add_parser("publish", help="發佈商品資料（更新商品資料後執行）")
+    publish_parser.add_argument("catalog", nargs="?", help="ims_list.json 或 CSV/TSV（預設為程式目錄中的檔案）")
+
+    subparsers.add_parser("status", help="列出已發佈的區段檔")
+
+    args = parser.parse_args(argv)
+    directory = args.dir or segment_dir()
+
+    if args.command == "publish":
+        catalog_path = args.catalog or catalog.find_catalog_file(
+            [os.path.dirname(os.path.abspath(__file__)), "."])
+        if not catalog_path or catalog_path.lower().endswith(catalog.SQLITE_SUFFIXES):
+            parser.error("請指定 JSON 或 CSV/TSV 格式的商品資料檔（SQLite 商品資料不需發佈）")
+        print(publish(catalog_path, directory))
+    elif args.command == "status":
+        for path in sorted(glob.glob(os.path.join(glob.escape(directory), "*.seg"))):
+            try:
+                segment = SharedCatalog(path)
+            except (OSError, ValueError) as e:
+                print(f"{os.path.basename(path):<50} 無法使用: {e}")
+                continue
+            print(f"{os.path.basename(path):<50} {len(segment):>9} 筆  "
+                  f"{os.path.getsize(path) / 2**20:7.1f} MB")
+            segment.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+# 長時間執行的記憶體測試：反覆執行產生 PDF、商品查詢、調貨紀錄等路徑，監測記憶體是否持續成長
+import argparse
+import gc
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def current_rss():
+    """目前的常駐記憶體（位元組），無法取得時回傳 None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # 沒有 /proc 時只能取得峰值（macOS 單位為位元組，其他為 KB）
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def make_transfer(catalog_items, rows, seed):
+    rng = random.Random(seed)
+    return {
+        'date': f"2024/{rng.randint(1, 12)}/{rng.randint(1, 28)}",
+        'sender_store': rng.choice(["台北店", "新竹店", "台中店"]),
+        'sender_name': "王小明",
+        'receiver_store': rng.choice(["高雄店", "台南店", "嘉義店"]),
+        'receiver_name': "陳小華",
+        'notes': f"測試 {seed % 50}",
+        'items': [
+            {'article_no': code, 'description': desc, 'quantity': str(rng.randint(1, 20))}
+            for code, desc in rng.sample(catalog_items, min(rows, len(catalog_items)))
+        ],
+    }
+
+
+# 各情境的 setup(context) 回傳每次迭代呼叫的 step(i)
+
+def setup_render(ctx):
+    import pdf_render
+    from output_profiles import OUTPUT_PROFILES
+
+    templates = list(pdf_render.TEMPLATES.items())
+    profiles = list(OUTPUT_PROFILES)
+
+    def step(i):
+        template, render = templates[i % len(templates)]
+        data = make_transfer(ctx['catalog_items'], ctx['rows'], i)
+        render(data, io.BytesIO(), ctx['font_name'], profile=profiles[i % len(profiles)])
+    return step
+
+
+def setup_cache(ctx):
+    from render_cache import RenderCache
+
+    # 快取上限設小，讓淘汰路徑也被反覆執行
+    cache = RenderCache(os.path.join(ctx['workdir'], "render_cache"), max_bytes=2 * 1024 * 1024)
+    output = os.path.join(ctx['workdir'], "cache_output.pdf")
+
+    def step(i):
+        data = make_transfer(ctx['catalog_items'], ctx['rows'], i % 40)
+        cache.render('sheet', data, output, ctx['font_name'])
+    return step
+
+
+def setup_catalog(ctx):
+    import catalog
+    from usage_stats import HotItemCache
+
+    registry = catalog.load_catalog_registry([SCRIPT_DIR])
+    hot_items = HotItemCache()
+    codes = [code for code, _ in ctx['catalog_items']] + ["UNKNOWN-%d" % n for n in range(50)]
+    rng = random.Random(1)
+
+    def step(i):
+        lookup = registry.for_store(rng.choice(["台北店", "台中店"]))
+        for code in rng.sample(codes, 20):
+            key = (registry.resolve_name("台北店"), code)
+            if hot_items.get(key) is None:
+                description = lookup.get(code)
+                if description is not None:
+                    hot_items.put(key, description)
+    return step
+
+
+def setup_usage(ctx):
+    from usage_stats import UsageStats
+
+    stats = UsageStats(os.path.join(ctx['workdir'], "usage_stats.json"), max_items_per_store=200)
+    rng = random.Random(2)
+
+    def step(i):
+        for code, desc in rng.sample(ctx['catalog_items'], 10):
+            stats.record(rng.choice(["台北店", "台中店"]), code, desc)
+        stats.recent("台北店")
+        stats.frequent("台中店")
+        if i % 50 == 0:
+            stats.save()
+    return step
+
+
+def setup_scanner(ctx):
+    from scanner import ScanQueue, ScanStats
+
+    queue = ScanQueue()
+    stats = ScanStats()
+    rng = random.Random(3)
+
+    def step(i):
+        # 只記錄不查詢速率：掃描模式關閉顯示時也不可無限累積
+        for code, _ in rng.sample(ctx['catalog_items'], 20):
+            queue.push(code)
+        for code in queue.drain():
+            stats.record(rng.random() > 0.1, code)
+    return step
+
+
+def setup_history(ctx):
+    from transfer_history import TransferHistory
+
+    history = TransferHistory(os.path.join(ctx['workdir'], "history.db"))
+    output = os.path.join(ctx['workdir'], "history_output.pdf")
+
+    def step(i):
+        transfer_id = history.record(make_transfer(ctx['catalog_items'], ctx['rows'], i), output, 'sheet')
+        history.query(sender_store="台北店", limit=20)
+        history.load(transfer_id)
+    return step
+
+
+def setup_gui(ctx):
+    """pdf_generator_tkinter 的視窗模型：清單反覆加入 / 清空、預覽、取得調貨資料"""
+    import tkinter as tk
+    import pdf_generator_tkinter
+
+    root = tk.Tk()
+    root.withdraw()
+    app = pdf_generator_tkinter.PDFGeneratorApp(root)
+    app.history = None
+    app.sender_store_var.set("台北店")
+    app.sender_name_var.set("王小明")
+    app.receiver_store_var.set("台中店")
+    app.receiver_name_var.set("陳小華")
+    ctx['cleanup'].append(root.destroy)
+
+    def step(i):
+        data = make_transfer(ctx['catalog_items'], ctx['rows'], i)
+        app.tree.delete(*app.tree.get_children())
+        app.scan_index = None
+        for item in data['items']:
+            app.tree.insert("", "end", values=(item['article_no'], item['description'], item['quantity']))
+        app.get_transfer_data()
+        app.preview_data()
+        root.update()
+    return step
+
+
+SCENARIOS = {
+    "render": setup_render,
+    "cache": setup_cache,
+    "catalog": setup_catalog,
+    "usage": setup_usage,
+    "scanner": setup_scanner,
+    "history": setup_history,
+    "gui": setup_gui,
+}
+
+DEFAULT_SCENARIOS = ("render", "cache", "catalog", "usage", "scanner", "history")
+
+
+def run_soak(scenarios, iterations=2000, warmup=200, rows=30, font_path=None,
+             max_rss_growth_mb=30.0, max_traced_growth_mb=5.0, report_every=500, frames=1):
+    """執行記憶體測試，記憶體成長超過上限時回傳 False
+
+    先執行 warmup 次讓各種快取填滿，之後的成長才視為洩漏。
+    frames 為 tracemalloc 記錄的堆疊深度，越深越容易找到來源但執行越慢。
+    """
+    import catalog
+    import pdf_render
+
+    workdir = tempfile.mkdtemp(prefix="ims_soak_")
+    # 使用統計、快取等寫到暫存目錄，不影響實際資料
+    os.environ["IMS_PRINT_HOME"] = workdir
+
+    catalog_path = catalog.find_catalog_file([SCRIPT_DIR])
+    catalog_items = list(catalog.open_catalog(catalog_path).items()) if catalog_path else []
+    ctx = {
+        'workdir': workdir,
+        'rows': rows,
+        'font_name': pdf_render.register_font(font_path),
+        'catalog_items': catalog_items or [("00000", "SAMPLE ITEM")],
+        'cleanup': [],
+    }
+
+    steps = []
+    for name in scenarios:
+        try:
+            steps.append((name, SCENARIOS[name](ctx)))
+        except Exception as e:
+            if name != "gui":
+                raise
+            print(f"略過 gui 情境（無法建立視窗）: {e}")
+
+    try:
+        for i in range(warmup):
+            for _, step in steps:
+                step(i)
+
+        gc.collect()
+        tracemalloc.start(frames)
+        baseline = tracemalloc.take_snapshot()
+        traced_start, _ = tracemalloc.get_traced_memory()
+        rss_start = current_rss()
+        start = time.perf_counter()
+
+        for i in range(warmup, warmup + iterations):
+            for _, step in steps:
+                step(i)
+            done = i - warmup + 1
+            if done % report_every == 0 or done == iterations:
+                traced, _ = tracemalloc.get_traced_memory()
+                rss = current_rss()
+                print(f"{done:>6}/{iterations}  {time.perf_counter() - start:7.1f}s  "
+                      f"tracemalloc {traced / 2**20:7.2f} MB  "
+                      f"RSS {rss / 2**20 if rss else 0:7.1f} MB")
+
+        gc.collect()
+        final = tracemalloc.take_snapshot()
+        traced, _ = tracemalloc.get_traced_memory()
+        rss_end = current_rss()
+        tracemalloc.stop()
+    finally:
+        for cleanup in ctx['cleanup']:
+            cleanup()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("記憶體成長最多的位置:")
+    for stat in final.compare_to(baseline, "traceback")[:5]:
+        if stat.size_diff <= 0:
+            break
+        print(f"  {stat.size_diff / 1024:+9.1f} KB  {stat.count_diff:+7d} 個物件")
+        for line in stat.traceback.format()[-4:]:
+            print(f"    {line}")
+
+    ok = True
+    traced_growth = (traced - traced_start) / 2**20
+    print(f"tracemalloc 成長: {traced_growth:+.2f} MB（上限 {max_traced_growth_mb} MB）")
+    if traced_growth > max_traced_growth_mb:
+        ok = False
+    if rss_start and rss_end:
+        rss_growth = (rss_end - rss_start) / 2**20
+        print(f"RSS 成長: {rss_growth:+.1f} MB（上限 {max_rss_growth_mb} MB）")
+        if rss_growth > max_rss_growth_mb:
+            ok = False
+    print("通過" if ok else "失敗：記憶體持續成長")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="長時間執行的記憶體測試")
+    parser.add_argument("scenarios", nargs="*",
+                        help=f"測試情境: {', '.join(SCENARIOS)}"
+                             f"（預設: {' '.join(DEFAULT_SCENARIOS)}；gui 需要顯示器）")
+    parser.add_argument("-n", "--iterations", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=30, help="每張調貨單的商品行數")
+    parser.add_argument("--font", help="ChineseFont 使用的 TTF/TTC 字體檔")
+    parser.add_argument("--max-rss-growth", type=float, default=30.0, help="RSS 成長上限（MB）")
+    parser.add_argument("--max-traced-growth", type=float, default=5.0, help="tracemalloc 成長上限（MB）")
+    parser.add_argument("--frames", type=int, default=1, help="tracemalloc 堆疊深度（找洩漏來源時可設為 10）")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知的測試情境: {', '.join(unknown)}")
+
+    ok = run_soak(args.scenarios or DEFAULT_SCENARIOS, args.iterations, args.warmup, args.rows,
+                  args.font, args.max_rss_growth, args.max_traced_growth, frames=args.frames)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# 文字寬度量測與依欄寬換行：商品描述正規化後依實際字寬斷行，結果以 LRU 快取重複使用
+import os
+import threading
+from collections import OrderedDict
+
+from reportlab.pdfbase import pdfmetrics
+
+import font_coverage
+
+ELLIPSIS = "..."
+DEFAULT_MAX_ENTRIES = 20000
+_MAX_WORD_WIDTHS = 100000
+
+
+def normalize_description(text):
+    """去除前後空白並將連續空白縮成一個（ims_list.json 的描述以空白補齊固定寬度）"""
+    return " ".join(str(text).split())
+
+
+def text_width(text, font_name, size):
+    """文字寬度（缺字的部分以備用字體計算）"""
+    chain = font_coverage.chain_for(font_name)
+    if chain is None:
+        return pdfmetrics.stringWidth(text, font_name, size)
+    return chain.string_width(text, size)
+
+
+class WrapCache:
+    """換行結果的 LRU 快取
+
+    鍵為 (原始描述, 字體, 大小, 欄寬, 最多行數)：相同商品在一批調貨單中重複出現時，
+    只有第一次需要量測。單字寬度另以 (單字, 字體, 大小) 快取，不同描述共用的單字只量測一次。
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lines = OrderedDict()
+        self._word_widths = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._lines)
+
+    def clear(self):
+        with self._lock:
+            self._lines.clear()
+            self._word_widths.clear()
+
+    def _word_width(self, word, font_name, size):
+        key = (word, font_name, size)
+        width = self._word_widths.get(key)
+        if width is None:
+            if len(self._word_widths) >= _MAX_WORD_WIDTHS:
+                self._word_widths.clear()
+            width = self._word_widths[key] = text_width(word, font_name, size)
+        return width
+
+    def wrap(self, text, font_name, size, width, max_lines=None):
+        """依欄寬換行，回傳各行文字的 tuple；超過 max_lines 時最後一行以 ... 結尾"""
+        key = (text, font_name, size, width, max_lines)
+        with self._lock:
+            lines = self._lines.get(key)
+            if lines is not None:
+                self._lines.move_to_end(key)
+                self.hits += 1
+                return lines
+
+        lines = wrap_text(normalize_description(text), font_name, size, width, max_lines,
+                          lambda word: self._word_width(word, font_name, size))
+        with self._lock:
+            self.misses += 1
+            self._lines[key] = lines
+            if len(self._lines) > self.max_entries:
+                self._lines.popitem(last=False)
+        return lines
+
+    def precompute(self, descriptions, font_name, size, width, max_lines=None):
+        """預先計算整份商品資料的換行（最多 max_entries 筆），回傳計算的筆數"""
+        count = 0
+        for description in descriptions:
+            if count >= self.max_entries:
+                break
+            self.wrap(description, font_name, size, width, max_lines)
+            count += 1
+        return count
+
+    def stats_text(self):
+        return f"換行快取 {len(self._lines)} 筆，命中 {self.hits} / 未命中 {self.misses}"
+
+
+def _break_word(word, font_name, size, first_width, width):
+    """單字比欄寬還長（例如沒有空白的中文描述）時依字元切開，第一段放進 first_width"""
+    pieces = []
+    piece = ""
+    piece_width = 0.0
+    limit = first_width
+    for ch in word:
+        ch_width = text_width(ch, font_name, size)
+        if piece and piece_width + ch_width > limit:
+            pieces.append((piece, piece_width))
+            piece, piece_width, limit = "", 0.0, width
+        piece += ch
+        piece_width += ch_width
+    pieces.append((piece, piece_width))
+    return pieces
+
+
+def _truncate(line, font_name, size, width):
+    """截短到加上 ... 後不超過欄寬"""
+    limit = width - text_width(ELLIPSIS, font_name, size)
+    while line and text_width(line, font_name, size) > limit:
+        line = line[:-1]
+    return line.rstrip() + ELLIPSIS
+
+
+def wrap_text(text, font_name, size, width, max_lines=None, word_width=None):
+    """貪婪換行（不快取）：ReportLab 的字寬不含字距調整，行寬即單字與空白寬度的和"""
+    if not text:
+        return ("",)
+    word_width = word_width or (lambda word: text_width(word, font_name, size))
+    space = word_width(" ")
+
+    lines = []
+    current = []
+    current_width = 0.0
+    for word in text.split(" "):
+        w = word_width(word)
+        if current and current_width + space + w <= width:
+            current.append(word)
+            current_width += space + w
+            continue
+        if w <= width:
+            if current:
+                lines.append(" ".join(current))
+            current, current_width = [word], w
+            continue
+
+        # 過長的單字：先填滿目前這一行剩下的寬度，其餘逐行切開
+        first_width = width - current_width - space if current else width
+        pieces = _break_word(word, font_name, size, first_width, width)
+        if current:
+            if pieces[0][1] <= first_width:
+                current.append(pieces[0][0])
+                pieces = pieces[1:]
+            else:  # 剩下的寬度連一個字都放不下
+                pieces = _break_word(word, font_name, size, width, width)
+            lines.append(" ".join(current))
+        for piece, piece_width in pieces[:-1]:
+            lines.append(piece)
+        current, current_width = [pieces[-1][0]], pieces[-1][1]
+    lines.append(" ".join(current))
+
+    if max_lines and len(lines) > max_lines:
+        lines = lines[:max_lines - 1] + [_truncate(lines[max_lines - 1], font_name, size, width)]
+    return tuple(lines)
+
+
+def prewrap_enabled():
+    """環境變數 IMS_PRINT_PREWRAP=1 時，載入商品資料後預先計算整份描述的換行"""
+    return os.environ.get("IMS_PRINT_PREWRAP", "0") == "1"
+
+
+# 兩個程式與背景工作共用的快取
+wrap_cache = WrapCache()
@@ -0,0 +1,183 @@
+# 商品縮圖：依商品編號在圖片目錄中找到商品照片，縮小一次後存到磁碟快取，調貨單物品行旁顯示
+# 需要 Pillow（pip install pillow）；未設定圖片目錄或沒有 Pillow 時不顯示縮圖
+import argparse
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from app_paths import app_data_dir
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp")
+
+# 縮圖長邊像素：物品行中約 18pt，列印時約 380 dpi
+THUMBNAIL_PIXELS = 96
+JPEG_QUALITY = 85
+DEFAULT_MAX_ENTRIES = 5000
+# 圖片目錄是否有變更，最多每隔幾秒檢查一次（不在每一行都查詢目錄）
+INDEX_CHECK_INTERVAL = 5.0
+
+_default_cache = None
+_warned = False
+
+
+class ThumbnailCache:
+    """商品縮圖快取
+
+    圖片目錄只列出一次建立 {商品編號: 圖片檔} 索引（目錄修改時間改變時重建）；
+    縮圖以「原圖路徑 + 大小 + 修改時間 + 像素」為鍵存成 JPEG，PDF 直接嵌入 JPEG 資料不需重新編碼，
+    同一份 PDF 中相同的縮圖檔由 ReportLab 只嵌入一次（共用同一個 XObject）。
+    商品編號對應的縮圖路徑另以 LRU 保存在記憶體，批量產生時不需重複查詢。
+    """
+
+    def __init__(self, image_dir, cache_dir=None, max_entries=DEFAULT_MAX_ENTRIES,
+                 pixels=THUMBNAIL_PIXELS):
+        self.image_dir = image_dir
+        self.cache_dir = cache_dir or app_data_dir("thumbnails")
+        self.max_entries = max_entries
+        self.pixels = pixels
+        self._index = None
+        self._index_mtime = None
+        self._index_checked = 0.0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _source_index(self):
+        """{商品編號: 原圖路徑}；同一商品有多個檔案時依 IMAGE_SUFFIXES 的順序選用"""
+        now = time.monotonic()
+        if self._index is not None and now - self._index_checked < INDEX_CHECK_INTERVAL:
+            return self._index
+        self._index_checked = now
+        try:
+            mtime = os.stat(self.image_dir).st_mtime_ns
+        except OSError:
+            self._index = {}
+            return self._index
+        if self._index is None or mtime != self._index_mtime:
+            index = {}
+            with os.scandir(self.image_dir) as it:
+                for entry in it:
+                    stem, suffix = os.path.splitext(entry.name)
+                    suffix = suffix.lower()
+                    if suffix not in IMAGE_SUFFIXES or not entry.is_file():
+                        continue
+                    current = index.get(stem)
+                    if current is None or IMAGE_SUFFIXES.index(suffix) < IMAGE_SUFFIXES.index(
+                            os.path.splitext(current)[1].lower()):
+                        index[stem] = entry.path
+            self._index, self._index_mtime = index, mtime
+            self._entries.clear()  # 圖片有增減時重新查詢
+        return self._index
+
+    def _thumbnail(self, source):
+        """縮小原圖並存到磁碟快取（已存在時直接回傳），回傳縮圖路徑；無法讀取時回傳 None"""
+        stat = os.stat(source)
+        key = hashlib.sha1(f"{os.path.abspath(source)}:{stat.st_size}:{stat.st_mtime_ns}:{self.pixels}"
+                           .encode("utf-8")).hexdigest()
+        path = os.path.join(self.cache_dir, key + ".jpg")
+        if os.path.exists(path):
+            return path
+
+        try:
+            with Image.open(source) as image:
+                image.thumbnail((self.pixels, self.pixels), Image.LANCZOS)
+                if image.mode in ("RGBA", "LA", "P"):
+                    # 透明背景以白色填滿（JPEG 不支援透明）
+                    image = image.convert("RGBA")
+                    background = Image.new("RGB", image.size, "white")
+                    background.paste(image, mask=image.getchannel("A"))
+                    image = background
+                elif image.mode not in ("RGB", "L"):
+                    image = image.convert("RGB")
+                buffer = io.BytesIO()
+                image.save(buffer, "JPEG", quality=JPEG_QUALITY, optimize=True)
+        except (OSError, ValueError) as e:
+            print(f"無法讀取商品圖片 {source}: {e}")
+            return None
+
+        from output_writer import atomic_write
+        atomic_write(path, buffer.getvalue())
+        return path
+
+    def get(self, article_no):
+        """商品的縮圖路徑，沒有圖片時回傳 None"""
+        article_no = str(article_no).strip()
+        with self._lock:
+            index = self._source_index()
+            if article_no in self._entries:
+                self._entries.move_to_end(article_no)
+                self.hits += 1
+                return self._entries[article_no]
+
+            self.misses += 1
+            source = index.get(article_no)
+            path = self._thumbnail(source) if source else None
+            self._entries[article_no] = path
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return path
+
+    def article_nos(self):
+        """圖片目錄中有圖片的商品編號"""
+        with self._lock:
+            return list(self._source_index())
+
+    def fingerprint(self, article_nos):
+        """快取鍵用：各商品使用的縮圖檔名（縮圖檔名已包含原圖的修改時間）"""
+        return [os.path.basename(self.get(code) or "") for code in article_nos]
+
+    def stats_text(self):
+        return f"縮圖快取 {len(self._entries)} 筆，命中 {self.hits} / 未命中 {self.misses}"
+
+
+def thumbnail_dir():
+    """商品圖片目錄（環境變數 IMS_PRINT_THUMBNAILS），未設定時回傳 None"""
+    return os.environ.get("IMS_PRINT_THUMBNAILS") or None
+
+
+def default_cache():
+    """兩個程式與背景工作共用的縮圖快取；未設定圖片目錄或沒有 Pillow 時回傳 None"""
+    global _default_cache, _warned
+    directory = thumbnail_dir()
+    if not directory:
+        return None
+    if Image is None:
+        if not _warned:
+            _warned = True
+            print("已設定 IMS_PRINT_THUMBNAILS，但未安裝 Pillow，不顯示商品縮圖")
+        return None
+    if _default_cache is None or _default_cache.image_dir != directory:
+        _default_cache = ThumbnailCache(directory)
+    return _default_cache
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="商品縮圖快取")
+    parser.add_argument("--dir", help="商品圖片目錄（預設為環境變數 IMS_PRINT_THUMBNAILS）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("build", help="預先產生圖片目錄中所有商品的縮圖")
+
+    args = parser.parse_args(argv)
+    directory = args.dir or thumbnail_dir()
+    if not directory:
+        parser.error("請以 --dir 或環境變數 IMS_PRINT_THUMBNAILS 指定商品圖片目錄")
+    if Image is None:
+        parser.error("需要 Pillow：pip install pillow")
+
+    cache = ThumbnailCache(directory)
+    codes = cache.article_nos()
+    built = sum(1 for code in codes if cache.get(code))
+    print(f"{built} / {len(codes)} 個商品縮圖 -> {cache.cache_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+# 調貨紀錄：每次產生的調貨單都寫入本機 SQLite（只新增不修改），可查詢並重新產生 / 列印
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from app_paths import app_data_dir
+
+HISTORY_FILENAME = "history.db"
+
+_HEADER_COLUMNS = ("date", "sender_store", "sender_name", "receiver_store", "receiver_name", "notes")
+
+
+def parse_transfer_date(value):
+    """將 2024/01/31、2024-1-31 等日期轉為 ISO 格式（2024-01-31），無法解析時原樣回傳"""
+    value = str(value).strip()
+    parts = value.replace("/", "-").replace(".", "-").split("-")
+    if len(parts) == 3:
+        try:
+            return datetime(int(parts[0]), int(parts[1]), int(parts[2])).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    return value
+
+
+class TransferHistory:
+    """調貨紀錄資料庫
+
+    transfers 存放表頭與輸出路徑，transfer_items 依 (transfer_id, line_no)
+    叢集存放商品明細。日期、店別組合與商品編號皆有索引，
+    資料累積到數百萬行時查詢仍只讀取需要的範圍。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(app_data_dir(), HISTORY_FILENAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._create_schema()
+
+    def close(self):
+        self._conn.close()
+
+    def _create_schema(self):
+        with self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS transfers (
+                    id INTEGER PRIMARY KEY,
+                    created_at TEXT NOT NULL,
+                    transfer_date TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    sender_store TEXT NOT NULL,
+                    sender_name TEXT NOT NULL,
+                    receiver_store TEXT NOT NULL,
+                    receiver_name TEXT NOT NULL,
+                    notes TEXT NOT NULL,
+                    template TEXT NOT NULL,
+                    profile TEXT NOT NULL,
+                    output_path TEXT NOT NULL,
+                    item_count INTEGER NOT NULL,
+                    totals TEXT NOT NULL DEFAULT ''
+                );
+                CREATE TABLE IF NOT EXISTS transfer_items (
+                    transfer_id INTEGER NOT NULL REFERENCES transfers (id),
+                    line_no INTEGER NOT NULL,
+                    article_no TEXT NOT NULL,
+                    description TEXT NOT NULL,
+                    quantity TEXT NOT NULL,
+                    PRIMARY KEY (transfer_id, line_no)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_transfers_date
+                    ON transfers (transfer_date);
+                CREATE INDEX IF NOT EXISTS idx_transfers_pair
+                    ON transfers (sender_store, receiver_store, transfer_date);
+                CREATE INDEX IF NOT EXISTS idx_transfers_receiver
+                    ON transfers (receiver_store, transfer_date);
+                CREATE INDEX IF NOT EXISTS idx_items_article
+                    ON transfer_items (article_no, transfer_id);
+            """)
+            # 舊版資料庫沒有 totals 欄（調貨單合計，見 transfer_totals）
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(transfers)")}
+            if "totals" not in columns:
+                self._conn.execute("ALTER TABLE transfers ADD COLUMN totals TEXT NOT NULL DEFAULT ''")
+
+    def record(self, data, output_path, template, profile="default"):
+        """寫入一筆調貨紀錄，回傳紀錄編號
+
+        data 含合計（totals）時一併保存，重新產生時印出與原文件相同的總重量、材積與箱數。
+        """
+        header = {column: str(data.get(column, "")).strip() for column in _HEADER_COLUMNS}
+        items = data.get("items", [])
+        totals = json.dumps(data["totals"], sort_keys=True) if data.get("totals") else ""
+
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO transfers (created_at, transfer_date, date, sender_store, sender_name, "
+                "receiver_store, receiver_name, notes, template, profile, output_path, item_count, totals) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (datetime.now().isoformat(timespec="seconds"),
+                 parse_transfer_date(header["date"]),
+                 header["date"], header["sender_store"], header["sender_name"],
+                 header["receiver_store"], header["receiver_name"], header["notes"],
+                 template, profile, os.path.abspath(output_path), len(items), totals))
+            transfer_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO transfer_items (transfer_id, line_no, article_no, description, quantity) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(transfer_id, line_no,
+                  str(item.get("article_no", "")).strip(),
+                  str(item.get("description", "")).strip(),
+                  str(item.get("quantity", "")).strip())
+                 for line_no, item in enumerate(items, 1)])
+        return transfer_id
+
+    def query(self, date_from=None, date_to=None, sender_store=None, receiver_store=None,
+              article_no=None, limit=200):
+        """依日期範圍、店別或商品編號查詢，回傳表頭紀錄（新到舊）"""
+        conditions = []
+        params = []
+        if date_from:
+            conditions.append("transfer_date >= ?")
+            params.append(parse_transfer_date(date_from))
+        if date_to:
+            conditions.append("transfer_date <= ?")
+            params.append(parse_transfer_date(date_to))
+        if sender_store:
+            conditions.append("sender_store = ?")
+            params.append(sender_store.strip())
+        if receiver_store:
+            conditions.append("receiver_store = ?")
+            params.append(receiver_store.strip())
+        if article_no:
+            conditions.append(
+                "id IN (SELECT transfer_id FROM transfer_items WHERE article_no = ?)")
+            params.append(str(article_no).strip())
+
+        sql = "SELECT * FROM transfers"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def load(self, transfer_id):
+        """載入完整調貨資料（與 get_transfer_data 相同格式），找不到時回傳 None"""
+        with self._lock:
+            header = self._conn.execute(
+                "SELECT * FROM transfers WHERE id = ?", (transfer_id,)).fetchone()
+            if header is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT article_no, description, quantity FROM transfer_items "
+                "WHERE transfer_id = ? ORDER BY line_no", (transfer_id,)).fetchall()
+
+        data = dict(header)
+        totals = data.pop("totals", "")
+        if totals:
+            data["totals"] = json.loads(totals)
+        data["items"] = [dict(row) for row in rows]
+        return data
+
+    def _date_conditions(self, date_from, date_to):
+        conditions = []
+        params = []
+        if date_from:
+            conditions.append("transfer_date >= ?")
+            params.append(parse_transfer_date(date_from))
+        if date_to:
+            conditions.append("transfer_date <= ?")
+            params.append(parse_transfer_date(date_to))
+        return " AND ".join(conditions), params
+
+    def headers(self, date_from=None, date_to=None):
+        """依日期範圍讀出表頭：(紀錄編號, 日期, 寄出店別, 收件店別)"""
+        where, params = self._date_conditions(date_from, date_to)
+        sql = "SELECT id, transfer_date, sender_store, receiver_store FROM transfers"
+        if where:
+            sql += " WHERE " + where
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def iter_item_batches(self, date_from=None, date_to=None, batch_size=50000):
+        """依日期範圍逐批讀出明細行 [(紀錄編號, 商品編號, 數量)]
+
+        不與表頭 JOIN：表頭另以 headers 讀取，明細依主鍵順序掃描，
+        數百萬行時比 JOIN 快數倍。
+        """
+        where, params = self._date_conditions(date_from, date_to)
+        sql = "SELECT transfer_id, article_no, quantity FROM transfer_items"
+        if where:
+            sql += " WHERE transfer_id IN (SELECT id FROM transfers WHERE " + where + ")"
+
+        # 使用獨立連線，避免長時間掃描佔住寫入用的連線
+        conn = sqlite3.connect(self.path)
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+    def article_descriptions(self, article_nos):
+        """查詢商品編號在紀錄中的商品描述（以商品編號索引逐筆查詢）"""
+        descriptions = {}
+        with self._lock:
+            for article_no in article_nos:
+                row = self._conn.execute(
+                    "SELECT description FROM transfer_items WHERE article_no = ? "
+                    "AND description != '' LIMIT 1", (article_no,)).fetchone()
+                if row is not None:
+                    descriptions[article_no] = row[0]
+        return descriptions
+
+
+def rerender(record, font_name, output_path=None, render_cache=None):
+    """依紀錄重新產生 PDF（預設寫回原輸出路徑），回傳輸出路徑"""
+    import pdf_render
+    from output_writer import atomic_write
+
+    output_path = output_path or record["output_path"]
+    if render_cache is not None:
+        render_cache.render(record["template"], record, output_path, font_name, record["profile"])
+    else:
+        atomic_write(output_path, pdf_render.render_bytes(
+            record["template"], record, font_name, profile=record["profile"]))
+    return output_path
+
+
+def verify(record, font_name):
+    """重新產生紀錄的 PDF（不寫檔），與原輸出檔逐頁比對頁面內容，回傳不一致的頁碼清單（從 1 起算）
+
+    只比對頁面內容（文字、線條與圖片位置），不比對建立時間、文件 ID 與 sheet 版面頁腳的產生時間。
+    """
+    import pdf_render
+
+    with open(record["output_path"], "rb") as f:
+        original = pdf_render.page_contents(f.read())
+    rendered = pdf_render.page_contents(pdf_render.render_bytes(
+        record["template"], record, font_name, deterministic=True, profile=record["profile"]))
+    pages = max(len(original), len(rendered))
+    return [n + 1 for n in range(pages)
+            if n >= len(original) or n >= len(rendered) or original[n] != rendered[n]]
+
+
+def _attach_missing_totals(record):
+    """本功能之前的紀錄沒有保存合計：依目前的商品屬性重新計算（找不到商品資料時只計算總數量）"""
+    if "totals" in record:
+        return record
+    import catalog
+    from transfer_totals import with_totals
+
+    registry = catalog.load_catalog_registry(['.', os.path.dirname(os.path.abspath(__file__))])
+    attributes = None
+    if registry is not None:
+        try:
+            attributes = registry.attributes_for_store(record["sender_store"])
+        except Exception as e:
+            print(f"載入商品屬性時發生錯誤: {e}")
+    return with_totals(record, attributes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="調貨紀錄查詢與重新產生")
+    parser.add_argument("--db", help="紀錄資料庫（預設 ~/.ims_print/history.db）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = subparsers.add_parser("list", help="查詢調貨紀錄")
+    list_parser.add_argument("--from", dest="date_from", help="起始日期")
+    list_parser.add_argument("--to", dest="date_to", help="結束日期")
+    list_parser.add_argument("--sender", help="寄出店別")
+    list_parser.add_argument("--receiver", help="收件店別")
+    list_parser.add_argument("--article", help="商品編號")
+    list_parser.add_argument("--limit", type=int, default=50)
+
+    show_parser = subparsers.add_parser("show", help="顯示單筆調貨紀錄")
+    show_parser.add_argument("id", type=int)
+
+    reprint_parser = subparsers.add_parser("reprint", help="重新產生（並列印）調貨單")
+    reprint_parser.add_argument("id", type=int)
+    reprint_parser.add_argument("-o", "--output", help="輸出路徑（預設為原輸出路徑）")
+    reprint_parser.add_argument("--font", help="ChineseFont 使用的 TTF/TTC 字體檔")
+    reprint_parser.add_argument("--print", dest="printer", nargs="?", const="",
+                                help="產生後送到印表機（可指定印表機名稱）")
+
+    verify_parser = subparsers.add_parser("verify", help="重新產生並與原輸出檔比對頁面內容")
+    verify_parser.add_argument("id", type=int)
+    verify_parser.add_argument("--font", help="ChineseFont 使用的 TTF/TTC 字體檔")
+
+    args = parser.parse_args(argv)
+    history = TransferHistory(args.db)
+
+    if args.command == "list":
+        for row in history.query(args.date_from, args.date_to, args.sender, args.receiver,
+                                 args.article, args.limit):
+            print(f"{row['id']:>8}  {row['transfer_date']}  {row['sender_store']} -> "
+                  f"{row['receiver_store']}  {row['item_count']:>5} 項  {row['output_path']}")
+    elif args.command in ("show", "reprint", "verify"):
+        record = history.load(args.id)
+        if record is None:
+            parser.error(f"找不到調貨紀錄 {args.id}")
+
+        if args.command == "show":
+            for column in ("id", "created_at") + _HEADER_COLUMNS + ("template", "profile", "output_path"):
+                print(f"{column:<15} {record[column]}")
+            for item in record["items"]:
+                print(f"  {item['article_no']:<15} {item['description'][:60]:<60} {item['quantity']}")
+        elif args.command == "verify":
+            import pdf_render
+            mismatched = verify(_attach_missing_totals(record), pdf_render.register_font(args.font))
+            if mismatched:
+                print(f"與原文件不一致的頁: {', '.join(map(str, mismatched))}")
+                history.close()
+                raise SystemExit(1)
+            print(f"與原文件一致: {record['output_path']}")
+        else:
+            import pdf_render
+            record = _attach_missing_totals(record)
+            output_path = rerender(record, pdf_render.register_font(args.font), args.output)
+            print(f"已重新產生: {output_path}")
+            if args.printer is not None:
+                import print_spool
+                job_id = print_spool.get_spooler().submit(
+                    [output_path], printer=args.printer or None, title=os.path.basename(output_path))
+                print(f"已送出列印工作: {job_id}")
+
+    history.close()
+
+
+if __name__ == "__main__":
+    main()
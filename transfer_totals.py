@@ -0,0 +1,115 @@
+# 調貨單合計：總數量，以及依商品屬性計算的總重量、總材積與箱數（供安排貨車）
+import argparse
+import math
+import time
+from collections import Counter
+from operator import itemgetter, mul, truediv
+
+from catalog_attributes import ATTRIBUTE_BITS, AttributeColumns
+
+# 屬性 -> (標籤, 單位, 小數位數)
+TOTAL_LABELS = {
+    "weight": ("Weight / 總重量", "kg", 2),
+    "volume": ("Volume / 總材積", "m³", 3),
+    "cartons": ("Cartons / 箱數", "", 0),
+}
+
+
+def parse_quantity(value):
+    """數量轉為整數，無法解析時為 0（數量格式由產生前的驗證回報）"""
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        return 0
+
+
+def _quantities(items):
+    try:
+        return list(map(int, map(itemgetter("quantity"), items)))
+    except (KeyError, TypeError, ValueError):  # 有空白或格式錯誤的數量時逐項解析
+        return list(map(parse_quantity, (item.get("quantity", "") for item in items)))
+
+
+def transfer_totals(items, attributes=None):
+    """計算整張調貨單的合計，回傳可寫入調貨資料的字典
+
+    attributes 為 catalog_attributes 的屬性物件（None 時只計算總數量）。
+    商品屬性一次取出整欄，重量與材積以 map(mul) 對整欄相乘後加總，箱數以數量 / 箱入數無條件進位
+    （缺少的屬性在欄中為 0 或無限大，不需逐項判斷）；每一步都在 C 實作的 map / sum 中完成。
+    缺少某項屬性的商品不計入該項，行數記錄在 missing 中。
+    """
+    quantities = _quantities(items)
+    totals = {"lines": len(quantities), "quantity": sum(quantities)}
+    if attributes is None or not quantities:
+        return totals
+
+    values, known = attributes.gather([str(item.get("article_no", "")).strip() for item in items])
+    totals["weight"] = round(math.fsum(map(mul, quantities, values["weight"])), 3)
+    totals["volume"] = round(math.fsum(map(mul, quantities, values["volume"])), 4)
+    totals["cartons"] = sum(map(math.ceil, map(truediv, quantities, values["pack_size"])))
+
+    # 有無標記只有幾種組合，先計數再換算各屬性缺少的行數
+    counts = Counter(known)
+    totals["missing"] = {
+        total: sum(count for mask, count in counts.items() if not mask & ATTRIBUTE_BITS[name])
+        for total, name in (("weight", "weight"), ("volume", "volume"), ("cartons", "pack_size"))
+    }
+    return totals
+
+
+def format_totals(totals):
+    """合計的顯示文字（PDF 與預覽共用），回傳行的清單
+
+    總數量之後，有商品屬性時每項一行（所有商品都缺少的項目不顯示），部分商品缺少資料時最後加註。
+    """
+    lines = [f"Total Qty / 總數量: {totals.get('quantity', 0):,}"]
+    missing = totals.get("missing")
+    if missing is None:
+        return lines
+
+    incomplete = 0
+    for name, (label, unit, digits) in TOTAL_LABELS.items():
+        if missing[name] >= totals["lines"]:
+            continue
+        value = f"{totals[name]:,.{digits}f}" + (f" {unit}" if unit else "")
+        lines.append(f"{label}: {value}")
+        incomplete = max(incomplete, missing[name])
+    if incomplete and len(lines) > 1:
+        lines.append(f"（{incomplete} 項商品缺少資料，未計入）")
+    return lines
+
+
+def with_totals(data, attributes=None):
+    """回傳加上 totals 的調貨資料副本"""
+    return dict(data, totals=transfer_totals(data.get("items", []), attributes))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="調貨單合計")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subparsers.add_parser("benchmark", help="以測試資料量測計算合計的時間")
+    bench_parser.add_argument("--rows", type=int, default=10000, help="調貨單商品行數")
+    bench_parser.add_argument("--repeat", type=int, default=5)
+
+    args = parser.parse_args(argv)
+    import random
+
+    rng = random.Random(0)
+    attributes = AttributeColumns()
+    for n in range(50000):
+        attributes.set(f"{n:05d}", {"weight": rng.uniform(0.1, 5), "volume": rng.uniform(0.001, 0.05),
+                                    "pack_size": rng.choice((None, 6, 12, 24))})
+    items = [{"article_no": f"{rng.randrange(60000):05d}", "quantity": str(rng.randrange(1, 50))}
+             for _ in range(args.rows)]
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        totals = transfer_totals(items, attributes)
+        best = min(best, time.perf_counter() - start)
+    print("\n".join(format_totals(totals)))
+    print(f"{args.rows} 行，最佳 {best * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# 產生 PDF 前的整批驗證：商品編號、重複行、數量與輸出檔名，一次回報所有問題
+import os
+from collections import Counter, namedtuple
+
+ERROR = "error"
+WARNING = "warning"
+
+HEADER_LABELS = {
+    "date": "日期",
+    "sender_store": "寄出店別",
+    "sender_name": "寄件人",
+    "receiver_store": "收件店別",
+    "receiver_name": "收件人",
+}
+
+DEFAULT_MAX_QUANTITY = 9999
+
+
+class ValidationIssue(namedtuple("ValidationIssue", "severity transfer line message")):
+    """單一問題：transfer 為調貨單在批次中的序號（從 0 起算），line 為商品行號（表頭問題為 None）"""
+
+    def describe(self, labels=None):
+        where = labels[self.transfer] if labels else f"第 {self.transfer + 1} 張"
+        if self.line is not None:
+            where += f" 第 {self.line} 行"
+        return f"{where}: {self.message}"
+
+
+class ValidationReport:
+    """驗證結果：錯誤會阻止產生 PDF，警告由使用者決定是否繼續"""
+
+    def __init__(self, transfer_count=0):
+        self.transfer_count = transfer_count
+        self.issues = []
+
+    def add(self, severity, transfer, line, message):
+        self.issues.append(ValidationIssue(severity, transfer, line, message))
+
+    @property
+    def errors(self):
+        return [issue for issue in self.issues if issue.severity == ERROR]
+
+    @property
+    def warnings(self):
+        return [issue for issue in self.issues if issue.severity == WARNING]
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def failed_transfers(self):
+        """有錯誤的調貨單序號"""
+        return sorted({issue.transfer for issue in self.errors})
+
+    def summary(self, labels=None, limit=15):
+        """給對話框顯示的摘要（錯誤在前，最多列出 limit 項）"""
+        errors, warnings = self.errors, self.warnings
+        lines = [f"共 {self.transfer_count} 張調貨單：{len(errors)} 個錯誤、{len(warnings)} 個警告"]
+        shown = (errors + warnings)[:limit]
+        for issue in shown:
+            prefix = "錯誤" if issue.severity == ERROR else "警告"
+            lines.append(f"[{prefix}] {issue.describe(labels)}")
+        if len(errors) + len(warnings) > len(shown):
+            lines.append(f"... 其餘 {len(errors) + len(warnings) - len(shown)} 項未列出")
+        return "\n".join(lines)
+
+
+def validate_transfers(transfers, catalog_for_store=None, output_paths=None,
+                       required_fields=("sender_store", "receiver_store"), require_items=True,
+                       max_quantity=DEFAULT_MAX_QUANTITY, warn_existing_files=False):
+    """驗證整批調貨資料（get_transfer_data / get_form_data 的格式），回傳 ValidationReport
+
+    商品編號依寄出店別對應的商品資料分組，以集合差一次找出查無的編號；
+    output_paths 與 transfers 一一對應，用來檢查同批次內的檔名衝突。
+    """
+    report = ValidationReport(len(transfers))
+    codes_by_store = {}
+
+    for index, data in enumerate(transfers):
+        for field in required_fields:
+            if not str(data.get(field, "")).strip():
+                report.add(ERROR, index, None, f"請輸入{HEADER_LABELS.get(field, field)}")
+
+        items = data.get("items", [])
+        if require_items and not items:
+            report.add(ERROR, index, None, "請至少加入一項商品")
+
+        store_codes = codes_by_store.setdefault(str(data.get("sender_store", "")).strip(), {})
+        codes = []
+        for line, item in enumerate(items, 1):
+            code = str(item.get("article_no", "")).strip()
+            codes.append(code)
+            store_codes.setdefault(code, []).append((index, line))
+            if not code:
+                report.add(ERROR, index, line, "商品編號空白")
+
+            quantity = str(item.get("quantity", "")).strip()
+            try:
+                value = int(quantity)
+            except ValueError:
+                report.add(ERROR, index, line, f"商品 {code} 的數量「{quantity}」不是整數")
+                continue
+            if value <= 0:
+                report.add(ERROR, index, line, f"商品 {code} 的數量必須大於 0")
+            elif value > max_quantity:
+                report.add(WARNING, index, line, f"商品 {code} 的數量 {value} 超過 {max_quantity}")
+
+        for code, count in Counter(codes).items():
+            if code and count > 1:
+                report.add(WARNING, index, None, f"商品 {code} 重複 {count} 行")
+
+    # 查無的商品編號：每份商品資料只做一次集合差；商品資料尚未更新的新商品是正常情況，只提出警告
+    if catalog_for_store is not None:
+        for store, codes in codes_by_store.items():
+            lookup = catalog_for_store(store)
+            if lookup is None or (isinstance(lookup, dict) and not lookup):  # 商品資料無法使用時不檢查
+                continue
+            if isinstance(lookup, dict):
+                missing = codes.keys() - lookup.keys()
+            else:
+                # SQLite / 多層商品資料：逐一查詢本批出現的編號，避免掃描整份商品資料
+                missing = {code for code in codes if code not in lookup}
+            for code in sorted(missing):
+                if not code:
+                    continue
+                for index, line in codes[code]:
+                    report.add(WARNING, index, line, f"商品編號 {code} 不在商品資料中（沒有描述）")
+
+    if output_paths is not None:
+        paths = [os.path.normcase(os.path.abspath(path)) for path in output_paths]
+        first_index = {}
+        for index, path in enumerate(paths):
+            if path in first_index:
+                report.add(ERROR, index, None,
+                           f"輸出檔名與第 {first_index[path] + 1} 張相同: {os.path.basename(path)}")
+            else:
+                first_index[path] = index
+                if warn_existing_files and os.path.exists(path):
+                    report.add(WARNING, index, None, f"將覆蓋既有檔案: {os.path.basename(path)}")
+
+    report.issues.sort(key=lambda issue: (issue.transfer, issue.line or 0))
+    return report
@@ -0,0 +1,102 @@
+# 各門市的商品使用統計（常用 / 最近使用）與常用商品快取
+import json
+import os
+import time
+from collections import OrderedDict
+
+from app_paths import app_data_dir
+
+USAGE_STATS_FILENAME = "usage_stats.json"
+
+
+class UsageStats:
+    """記錄各門市每項商品的使用次數與最後使用時間
+
+    檔案格式精簡：{門市: {商品編號: [次數, 最後使用時間, 商品描述]}}，
+    每個門市只保留使用分數最高的 max_items_per_store 項。
+    """
+
+    def __init__(self, path=None, max_items_per_store=500):
+        self.path = path or os.path.join(app_data_dir(), USAGE_STATS_FILENAME)
+        self.max_items_per_store = max_items_per_store
+        self.stores = {}
+        self.dirty = False
+
+    def load(self):
+        """載入使用統計，檔案不存在或損毀時從空白開始"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.stores = json.load(f)
+        except FileNotFoundError:
+            self.stores = {}
+        except (OSError, ValueError) as e:
+            print(f"使用統計載入失敗，將重新建立: {e}")
+            self.stores = {}
+        return self
+
+    def save(self):
+        """寫出使用統計（先寫暫存檔再取代，避免寫到一半損毀）"""
+        if not self.dirty:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.stores, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def record(self, store, code, description=""):
+        """記錄一次商品使用"""
+        code = str(code).strip()
+        if not code:
+            return
+        items = self.stores.setdefault((store or "").strip(), {})
+        count = items[code][0] if code in items else 0
+        items[code] = [count + 1, round(time.time(), 3), description]
+        if len(items) > self.max_items_per_store:
+            self._prune(items)
+        self.dirty = True
+
+    def _prune(self, items):
+        # 保留最近使用的一半，其餘依使用次數補滿
+        keep = self.max_items_per_store
+        recent = sorted(items, key=lambda c: items[c][1], reverse=True)[:keep // 2]
+        rest = sorted(set(items) - set(recent), key=lambda c: items[c][0], reverse=True)
+        kept = set(recent) | set(rest[:keep - len(recent)])
+        for code in list(items):
+            if code not in kept:
+                del items[code]
+
+    def recent(self, store, limit=20):
+        """最近使用的商品 [(商品編號, 商品描述)]"""
+        items = self.stores.get((store or "").strip(), {})
+        codes = sorted(items, key=lambda c: items[c][1], reverse=True)[:limit]
+        return [(code, items[code][2]) for code in codes]
+
+    def frequent(self, store, limit=20):
+        """最常使用的商品 [(商品編號, 商品描述)]"""
+        items = self.stores.get((store or "").strip(), {})
+        codes = sorted(items, key=lambda c: (items[c][0], items[c][1]), reverse=True)[:limit]
+        return [(code, items[code][2]) for code in codes]
+
+
+class HotItemCache:
+    """放在商品資料查詢前的小型 LRU 快取"""
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def get(self, key):
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()